@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+readability 候选节点：原先的 dict 记录、全量排序和逐次执行正则的 class_weight，
+与 Candidate（__slots__）、heapq 选出最高分和按属性值缓存的 class_weight 对比。
+计时包括 score_paragraphs、select_best_candidate 以及对每个元素调用一次 class_weight（sanitize 中的用法）；
+除测试页面外还构造了含有数千个 td/p 候选节点的大型论坛页面
+
+    python -m benchmark.bench_candidates
+"""
+
+from lxml.html import fromstring
+
+from magic_html.readability_plus import Document, clean
+from magic_html.utils import load_html
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+ROWS = (500, 2000, 8000)
+
+
+class LegacyDocument(Document):
+    """改写前的实现"""
+
+    def score_paragraphs(self):
+        candidates = {}
+        ordered = []
+        for elem in self.tags(self._html(), "p", "pre", "td"):
+            parent_node = elem.getparent()
+            if parent_node is None:
+                continue
+            grand_parent_node = parent_node.getparent()
+            inner_text = clean(elem.text_content() or "")
+            inner_text_len = len(inner_text)
+            if inner_text_len < self.min_text_length:
+                continue
+            if parent_node not in candidates:
+                candidates[parent_node] = self.score_node(parent_node)
+                ordered.append(parent_node)
+            if grand_parent_node is not None and grand_parent_node not in candidates:
+                candidates[grand_parent_node] = self.score_node(grand_parent_node)
+                ordered.append(grand_parent_node)
+            content_score = 1
+            content_score += len(inner_text.split(","))
+            content_score += len(inner_text.split("，"))
+            content_score += min((inner_text_len / 100), 3)
+            candidates[parent_node]["content_score"] += content_score
+            if grand_parent_node is not None:
+                candidates[grand_parent_node]["content_score"] += content_score / 2.0
+        for elem in ordered:
+            candidates[elem]["content_score"] *= 1 - self.get_link_density(elem)
+        return candidates
+
+    def select_best_candidate(self, candidates):
+        if not candidates:
+            return None
+        sorted_candidates = sorted(candidates.values(), key=lambda x: x["content_score"], reverse=True)
+        for candidate in sorted_candidates[:5]:
+            elem = candidate["elem"]
+        return sorted_candidates[0]
+
+    def class_weight(self, e):
+        weight = 0
+        for feature in [e.get("class", None), e.get("id", None)]:
+            if feature:
+                if self.xp_num == "others":
+                    if self.REGEXES["negativeRe"].search(feature):
+                        weight -= 25
+                    if self.REGEXES["positiveRe"].search(feature):
+                        weight += 25
+                elif self.REGEXES["positiveRe"].search(feature):
+                    weight += 25
+        return weight
+
+    def score_node(self, elem):
+        candidate = super().score_node(elem)
+        return {"content_score": candidate.content_score, "elem": candidate.elem}
+
+
+def forum_page(rows):
+    """每行一个楼层：作者、正文两个 td，正文中有一段带逗号的文字"""
+    row = (
+        '<tr class="post-row" id="post-{0}"><td class="author-info">user{0}</td>'
+        '<td class="post-content"><p class="text">reply {0}, some words, more words and a sentence.</p>'
+        '<a class="reply-link" href="#r{0}">reply</a></td></tr>'
+    )
+    body = "".join(row.format(i) for i in range(rows))
+    return f'<html><body><div id="main" class="thread-body"><table class="posts">{body}</table></div></body></html>'
+
+
+def run(cls, tree):
+    doc = cls(tree)
+    doc._html(True)
+    candidates = doc.score_paragraphs()
+    best = doc.select_best_candidate(candidates)
+    weights = [doc.class_weight(e) for e in tree.iter("div", "table", "ul", "td", "p")]
+    return best, len(candidates), weights
+
+
+def summary(result):
+    best, count, weights = result
+    if isinstance(best, dict):
+        best = (best["content_score"], best["elem"])
+    elif best is not None:
+        best = (best.content_score, best.elem)
+    return best, count, weights
+
+
+def compare(label, trees):
+    assert [summary(run(LegacyDocument, t)) for t in trees] == [summary(run(Document, t)) for t in trees]
+    candidates = sum(run(Document, t)[1] for t in trees)
+    legacy = best_of(lambda: [run(LegacyDocument, t) for t in trees])
+    current = best_of(lambda: [run(Document, t) for t in trees])
+    print(
+        f"{label} candidates={candidates} legacy={legacy * 1000:.1f} ms "
+        f"current={current * 1000:.1f} ms ({legacy / current:.2f}x)"
+    )
+
+
+def main():
+    for kind in KINDS:
+        trees = [t for t in (load_html(html) for _, _, html in load_pages(kind)) if t is not None]
+        compare(f"{kind:8s} pages={len(trees)}", trees)
+    for rows in ROWS:
+        compare(f"forum rows={rows:<5d}", [fromstring(forum_page(rows))])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+readability 输出前删除 width/height/style 等属性：对序列化结果循环执行 clean_attributes 正则，
+与在树上一次遍历删除后再序列化的耗时对比。页面先经过 normalize_tree，与 readability 的输入一致。
+开始前先校验 Document.summary 不会删除输入树上仍保留的节点的这些属性，论坛提取之后还会按 style 删除节点
+
+    python -m benchmark.bench_clean_attributes
+"""
+
+from copy import deepcopy
+
+from lxml.etree import tounicode
+
+from magic_html.extractors.base_extractor import BaseExtractor
+from magic_html.readability_plus import Document, bad_attr_name, clean_attributes, htmlstrip, strip_bad_attributes
+from magic_html.utils import load_html
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+
+def regex_passes(html):
+    """clean_attributes 对整个字符串执行正则替换的次数"""
+    passes = 0
+    while htmlstrip.search(html):
+        html = htmlstrip.sub("<\\1\\2>", html)
+        passes += 1
+    return passes
+
+
+def bad_attributes(tree):
+    return {
+        elem: {name: value for name, value in elem.items() if bad_attr_name.match(name)}
+        for elem in tree.iter()
+    }
+
+
+def check_input_untouched(tree, xp_num):
+    """summary 之后仍在输入树中的节点，bad_attrs 中的属性与之前相同；返回是否走了没有候选节点的分支"""
+    before = bad_attributes(tree)
+    doc = Document(tree, xp_num=xp_num)
+    doc.summary(html_partial=True)
+    for elem, attrs in bad_attributes(tree).items():
+        # transform_misused_divs_into_paragraphs 新建的 p 不在 before 中
+        assert attrs == before.get(elem, attrs)
+    return doc.html is not None and doc.html.getroottree().getroot() is tree.getroottree().getroot()
+
+
+def main():
+    extractor = BaseExtractor()
+    for kind in KINDS:
+        trees = []
+        whole_body = 0
+        for _, url, html in load_pages(kind):
+            tree = load_html(html)
+            if tree is not None:
+                trees.append(extractor.normalize_tree(tree, base_url=url))
+                for xp_num in ("others", "1"):
+                    whole_body += check_input_untouched(deepcopy(trees[-1]), xp_num)
+        print(f"{kind:8s} summary keeps input attributes, summaries of the input body={whole_body}")
+        passes = [regex_passes(tounicode(tree, method="html")) for tree in trees]
+        regex = best_of(lambda: [clean_attributes(tounicode(tree, method="html")) for tree in trees])
+        # 删除属性会修改树，每轮使用新的副本，复制的耗时不计入
+        rounds = [[deepcopy(tree) for tree in trees] for _ in range(3)]
+        tree_based = best_of(
+            lambda: [tounicode(strip_bad_attributes(tree), method="html") for tree in rounds.pop()]
+        )
+        print(
+            f"{kind:8s} pages={len(trees)} regex passes mean={sum(passes) / len(passes):.1f} max={max(passes)} "
+            f"clean_attributes={regex * 1000:.1f} ms tree={tree_based * 1000:.1f} ms ({regex / tree_based:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+标签清理基准：原先 HTML_CLEANER.clean_html 先 deepcopy 整棵树再清理，clean_in_place 直接修改原树。
+每种方式在新进程中处理全部页面，分别比较只执行 normalize_tree（不含解析）和完整提取的耗时，
+以及每个页面处理过程中的峰值内存增量。
+libxml2 的内存不经过 tracemalloc，这里提取前通过 /proc/self/clear_refs 重置 VmHWM，
+提取后读取 VmHWM 减去提取前的 VmRSS，只能在 Linux（glibc）上运行
+
+    python -m benchmark.bench_cleaner
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from benchmark.bench_utils import KINDS
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import ctypes, json, sys, time
+from lxml.html.clean import Cleaner
+from magic_html.extractors import base_extractor
+from magic_html.extractors.article_extractor import ArticleExtractor
+from magic_html.extractors.forum_extractor import ForumExtractor
+from magic_html.utils import HTML_CLEANER, load_html
+from benchmark.bench_utils import load_pages
+
+kind, mode, stage = sys.argv[1], sys.argv[2], sys.argv[3]
+if mode == "copy":
+    cleaner = Cleaner(**{k: getattr(HTML_CLEANER, k) for k in (
+        "annoying_tags", "comments", "embedded", "forms", "frames", "javascript", "links", "meta",
+        "page_structure", "processing_instructions", "remove_unknown_tags", "safe_attrs_only",
+        "scripts", "style")})
+
+    def clean_with_copy(tree, kill_tags, remove_tags):
+        cleaner.kill_tags, cleaner.remove_tags = kill_tags, remove_tags
+        return cleaner.clean_html(tree)
+
+    base_extractor.clean_in_place = clean_with_copy
+
+extractor_class = ArticleExtractor if kind == "article" else ForumExtractor
+
+
+def memory_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+
+
+libc = ctypes.CDLL("libc.so.6")
+pages = load_pages(kind)
+# 预热：加载 XSLT 等延迟初始化的对象，不计入峰值
+extractor_class().extract(pages[0][2], base_url=pages[0][1])
+elapsed, peaks = 0.0, []
+for _, url, html in pages:
+    # 把已释放的堆内存还给系统，否则复制的树可能落在已释放的内存中，不增加 RSS
+    tree = load_html(html) if stage == "normalize" else None
+    libc.malloc_trim(0)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    before = memory_kb("VmRSS:")
+    start = time.perf_counter()
+    if tree is None:
+        extractor_class().extract(html, base_url=url)
+    else:
+        extractor_class().normalize_tree(tree, base_url=url)
+    elapsed += time.perf_counter() - start
+    peaks.append(memory_kb("VmHWM:") - before)
+print(json.dumps({"pages": len(pages), "time": elapsed, "peaks": peaks}))
+"""
+
+
+def run_child(kind, mode, stage):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, kind, mode, stage],
+        capture_output=True,
+        text=True,
+        cwd=PACKAGE_ROOT,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def best_run(kind, mode, stage, repeat=3):
+    runs = [run_child(kind, mode, stage) for _ in range(repeat)]
+    # 峰值内存增量在各次运行间基本不变，耗时取最短
+    return min(runs, key=lambda r: r["time"])
+
+
+def peak_summary(result):
+    peaks = result["peaks"]
+    return f"max={max(peaks) / 1024:.1f} MB mean={sum(peaks) / len(peaks) / 1024:.2f} MB"
+
+
+def main():
+    for kind in KINDS:
+        for stage in ("normalize", "extract"):
+            copy = best_run(kind, "copy", stage)
+            in_place = best_run(kind, "in_place", stage)
+            print(
+                f"{kind:8s} {stage:9s} pages={copy['pages']} "
+                f"copy={copy['time']:.2f} s in_place={in_place['time']:.2f} s "
+                f"({copy['time'] / in_place['time']:.2f}x)\n"
+                f"{'':18s} per-page peak copy {peak_summary(copy)}, in_place {peak_summary(in_place)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+对比 prune_unwanted_sections 中四组丢弃规则逐条执行 XPath 与单次遍历匹配的耗时，
+并校验两者匹配到的节点完全一致
+
+    python -m benchmark.bench_discard
+"""
+
+from magic_html.config import (
+    DISCARD_IMAGE_ELEMENTS,
+    OVERALL_DISCARD_XPATH,
+    PAYWALL_DISCARD_XPATH,
+    TEASER_DISCARD_XPATH,
+)
+from magic_html.discard import DISCARD_ENGINE
+from magic_html.utils import load_html
+from magic_html.xpaths import run_xpath
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+EXPRS = [
+    expr
+    for rule_list in (
+        OVERALL_DISCARD_XPATH,
+        PAYWALL_DISCARD_XPATH,
+        TEASER_DISCARD_XPATH,
+        DISCARD_IMAGE_ELEMENTS,
+    )
+    for expr in rule_list
+]
+
+
+def main():
+    for kind in KINDS:
+        xpath_total = tokens_total = 0.0
+        mismatches = 0
+        pages = load_pages(kind)
+        for _, _, html in pages:
+            tree = load_html(html)
+            if tree is None:
+                continue
+            matches = DISCARD_ENGINE.match(tree, EXPRS)
+            mismatches += sum(matches[expr] != run_xpath(tree, expr) for expr in EXPRS)
+            xpath_total += best_of(lambda: [run_xpath(tree, expr) for expr in EXPRS])
+            tokens_total += best_of(lambda: DISCARD_ENGINE.match(tree, EXPRS))
+        n = len(pages)
+        print(
+            f"{kind:8s} pages={n} xpath={xpath_total / n * 1000:.2f} ms/page "
+            f"tokens={tokens_total / n * 1000:.2f} ms/page "
+            f"speedup={xpath_total / tokens_total:.1f}x mismatches={mismatches}"
+        )
+
+
+if __name__ == "__main__":
+    main()
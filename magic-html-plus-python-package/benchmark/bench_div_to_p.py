@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+readability 中 div 改为 p 的判断：对每个 div 序列化全部子节点后用正则查找，
+与一次遍历求出含有块级后代的元素集合对比；嵌套的 div 越深，前者重复序列化的内容越多
+
+    python -m benchmark.bench_div_to_p
+"""
+
+from lxml.html import HTMLParser, fromstring
+
+from magic_html.readability_plus import Document
+from magic_html.utils import load_html, tostring
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+# 默认的解析器最多嵌套 256 层，构造深层页面需要 huge_tree
+DEEP_PARSER = HTMLParser(huge_tree=True, remove_comments=True)
+DEPTHS = (100, 500, 2000)
+
+
+def serialized_divs(doc):
+    """改写前的实现，返回需要改为 p 的 div"""
+    return [
+        elem
+        for elem in doc.tags(doc.html, "div")
+        if not doc.REGEXES["divToPElementsRe"].search(str(b"".join(map(tostring, list(elem)))))
+    ]
+
+
+def structural_divs(doc):
+    containers = doc.block_containers()
+    return [elem for elem in doc.tags(doc.html, "div") if elem not in containers]
+
+
+def document(tree):
+    doc = Document(tree)
+    doc.html = tree
+    return doc
+
+
+def deep_page(depth):
+    """每层一个 div 和一段文字，最内层没有块级子节点"""
+    return "<html><body>" + "<div><span>x</span>" * depth + "</div>" * depth + "</body></html>"
+
+
+def compare(label, docs):
+    for doc in docs:
+        assert serialized_divs(doc) == structural_divs(doc)
+    serialized = best_of(lambda: [serialized_divs(doc) for doc in docs])
+    structural = best_of(lambda: [structural_divs(doc) for doc in docs])
+    print(
+        f"{label} serialize={serialized * 1000:.1f} ms structural={structural * 1000:.1f} ms "
+        f"({serialized / structural:.1f}x)"
+    )
+
+
+def main():
+    for kind in KINDS:
+        docs = [document(tree) for tree in (load_html(html) for _, _, html in load_pages(kind)) if tree is not None]
+        compare(f"{kind:8s} pages={len(docs)}", docs)
+    for depth in DEPTHS:
+        tree = fromstring(deep_page(depth), parser=DEEP_PARSER)
+        compare(f"depth={depth:<5d}", [document(tree)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+编码检测基准：测试页面转为 GB18030 / Shift_JIS 编码后，
+对比原先的统计检测与分级检测（Content-Type、<meta charset>、站点缓存、有界采样）的耗时
+
+    python -m benchmark.bench_encoding
+"""
+
+import re
+from urllib.parse import urlparse
+
+from magic_html.utils import (
+    ENCODING_CACHE,
+    cchardet_detect,
+    decode_file,
+    from_bytes,
+    isutf8,
+    normalize_charset,
+    sniff_meta_charset,
+)
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+META_CHARSET = re.compile(r"""(<meta[^>]+?charset\s*=\s*["']?\s*)[\w.:-]+""", re.I)
+ENCODINGS = ("gb18030", "shift_jis")
+
+
+def legacy_decode(data):
+    """改写前的 detect_encoding + decode_file：统计检测失败时会在整个页面上再检测一次"""
+    if isutf8(data):
+        return data.decode("utf-8")
+    guesses = []
+    if cchardet_detect is not None:
+        guess = cchardet_detect(data)["encoding"]
+        if guess is not None:
+            guesses.append(guess.lower())
+    results = from_bytes(data[:15000]) or from_bytes(data)
+    guesses.extend(r.encoding for r in results)
+    for guess in guesses:
+        try:
+            return data.decode(guess)
+        except (LookupError, UnicodeDecodeError):
+            pass
+    return str(data, encoding="utf-8", errors="replace")
+
+
+def encode_page(html, encoding, declare):
+    """把页面转为 encoding 编码，declare 为 False 时去掉 <meta> 中的 charset 声明"""
+    html = META_CHARSET.sub(lambda m: m.group(1) + encoding if declare else "", html)
+    return html.encode(encoding, "xmlcharrefreplace")
+
+
+def main():
+    for kind in KINDS:
+        pages = load_pages(kind, limit=40)
+        for encoding in ENCODINGS:
+            declared = [(url, encode_page(html, encoding, True)) for _, url, html in pages]
+            bare = [(url, encode_page(html, encoding, False)) for _, url, html in pages]
+            header = f"text/html; charset={encoding}"
+            # 声明的 Shift_JIS 按 cp932 解码
+            codec = normalize_charset(encoding)
+            for (url, data), (_, plain) in zip(declared, bare):
+                if sniff_meta_charset(data) is not None:
+                    assert decode_file(data) == data.decode(codec)
+                assert decode_file(plain, content_type=header) == plain.decode(codec)
+
+            legacy = best_of(lambda: [legacy_decode(data) for _, data in bare], repeat=1)
+            meta = best_of(lambda: [decode_file(data) for _, data in declared])
+            content_type = best_of(
+                lambda: [decode_file(data, content_type=header) for _, data in bare]
+            )
+            sample = best_of(lambda: [decode_file(data) for _, data in bare], repeat=1)
+            ENCODING_CACHE.clear()
+            for url, data in declared:
+                decode_file(data, netloc=urlparse(url).netloc)
+            cached = best_of(
+                lambda: [decode_file(data, netloc=urlparse(url).netloc) for url, data in bare]
+            )
+            # 没有任何声明时统计检测得到正确结果的页面数
+            legacy_ok = sum(legacy_decode(data) == data.decode(codec) for _, data in bare)
+            sample_ok = sum(decode_file(data) == data.decode(codec) for _, data in bare)
+            print(
+                f"{kind:8s} {encoding:9s} pages={len(pages)} legacy={legacy * 1000:.1f} ms "
+                f"meta={meta * 1000:.1f} ms content_type={content_type * 1000:.1f} ms "
+                f"netloc_cache={cached * 1000:.1f} ms sampled={sample * 1000:.1f} ms "
+                f"undeclared_correct legacy={legacy_ok} sampled={sample_ok}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+冷启动基准：在新进程中测量 import magic_html 以及第一次提取的耗时，
+AsciiMath 页面分别在语法表磁盘缓存为空和已有缓存时测量
+
+    python -m benchmark.bench_import
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmark.bench_utils import load_pages
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ASCIIMATH_HTML = (
+    "<html><head><title>AsciiMath</title></head><body><article>"
+    "<p>The sum of the first n cubes is a square number.</p>"
+    '<script type="math/asciimath">sum_(i=1)^n i^3=((n(n+1))/2)^2</script>'
+    "<p>It can be shown by induction on n for every natural number.</p>"
+    "</article></body></html>"
+)
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import magic_html
+imported = time.perf_counter()
+html = sys.stdin.read()
+if html:
+    magic_html.GeneralExtractor().extract(html, base_url="https://example.com/")
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "extract": done - imported}))
+"""
+
+
+def run_child(html, cache_dir):
+    env = dict(os.environ, MAGIC_HTML_CACHE_DIR=cache_dir)
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        input=html,
+        capture_output=True,
+        text=True,
+        cwd=PACKAGE_ROOT,
+        env=env,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def best_run(html, cache_dir, repeat=3):
+    runs = [run_child(html, cache_dir) for _ in range(repeat)]
+    return min(runs, key=lambda r: r["import"] + r["extract"])
+
+
+def report(name, result):
+    print(
+        f"{name:40s} import={result['import'] * 1000:.0f} ms "
+        f"extract={result['extract'] * 1000:.0f} ms"
+    )
+
+
+def main():
+    _, _, article = load_pages("article", limit=1)[0]
+    with tempfile.TemporaryDirectory() as cache_dir:
+        report("import only", best_run("", cache_dir))
+        report("first extract (article)", best_run(article, cache_dir))
+        # 第一次构建语法表并写入缓存
+        report("first extract (asciimath, cold cache)", run_child(ASCIIMATH_HTML, cache_dir))
+        report("first extract (asciimath, warm cache)", best_run(ASCIIMATH_HTML, cache_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+节点遍历基准：递归的 iter_node 与基于 iter() 快照的 iter_tree 在测试页面上的耗时，
+以及嵌套数千层的页面上 generate_unique_id + convert_tags 的耗时（递归版本会 RecursionError）
+
+    python -m benchmark.bench_iter_tree
+"""
+
+from lxml.html import HtmlElement, HTMLParser, fromstring, tostring
+
+from magic_html.extractors import base_extractor
+from magic_html.extractors.base_extractor import BaseExtractor
+from magic_html.utils import iter_tree, load_html
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+# 默认的解析器最多嵌套 256 层，构造深层页面需要 huge_tree
+DEEP_PARSER = HTMLParser(huge_tree=True, remove_comments=True)
+DEPTHS = (200, 2000, 20000)
+
+
+def recursive_iter_node(element):
+    """改写前的递归实现"""
+    yield element
+    for sub_element in element:
+        if isinstance(sub_element, HtmlElement):
+            yield from recursive_iter_node(sub_element)
+
+
+def deep_page(depth):
+    """broken CMS 输出中常见的未闭合标签，每层一个 div 和一段文字"""
+    return "<html><body>" + '<div class="c"><span>x</span>' * depth + "</div>" * depth + "</body></html>"
+
+
+def process(iterate, html, parser=None):
+    """用 iterate 遍历执行 generate_unique_id 和 convert_tags，返回处理后的页面"""
+    base_extractor.iter_tree = iterate
+    try:
+        tree = fromstring(html, parser=parser) if parser is not None else load_html(html)
+        extractor = BaseExtractor()
+        extractor.generate_unique_id(tree)
+        extractor.convert_tags(tree, base_url="https://example.com/")
+        return tostring(tree)
+    finally:
+        base_extractor.iter_tree = iter_tree
+
+
+def main():
+    for kind in KINDS:
+        trees = [load_html(html) for _, _, html in load_pages(kind)]
+        assert [list(recursive_iter_node(t)) for t in trees] == [list(iter_tree(t)) for t in trees]
+        recursive = best_of(lambda: [sum(1 for _ in recursive_iter_node(t)) for t in trees])
+        iterative = best_of(lambda: [sum(1 for _ in iter_tree(t)) for t in trees])
+        print(
+            f"{kind:8s} pages={len(trees)} traverse recursive={recursive * 1000:.1f} ms "
+            f"iter_tree={iterative * 1000:.1f} ms ({recursive / iterative:.2f}x)"
+        )
+
+    for depth in DEPTHS:
+        html = deep_page(depth)
+        try:
+            expected = process(recursive_iter_node, html, DEEP_PARSER)
+            recursive = f"{best_of(lambda: process(recursive_iter_node, html, DEEP_PARSER)) * 1000:.1f} ms"
+        except RecursionError:
+            expected, recursive = None, "RecursionError"
+        result = process(iter_tree, html, DEEP_PARSER)
+        assert expected is None or result == expected
+        iterative = best_of(lambda: process(iter_tree, html, DEEP_PARSER))
+        print(f"depth={depth:<6d} convert recursive={recursive} iter_tree={iterative * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+列表页上 delete_by_link_density 的耗时随同级节点数量的变化
+
+    python -m benchmark.bench_link_density
+"""
+
+import time
+
+from magic_html.config import LINK_DENSITY_TAGS
+from magic_html.extractors.base_extractor import BaseExtractor
+from magic_html.utils import load_html
+
+SIZES = (250, 500, 1000, 2000)
+
+
+def listing_page(n):
+    items = "".join(
+        f'<li class="item"><a href="/p/{i}">post title {i}</a> <span>{i} replies</span></li>'
+        for i in range(n)
+    )
+    cards = "".join(
+        f'<div class="card"><div class="meta"><a href="/u/{i}">user {i}</a></div>'
+        f'<div class="body">summary of card {i} with a few words</div><a href="/c/{i}">more</a></div>'
+        for i in range(n)
+    )
+    return f"<html><body><ul>{items}</ul><div>{cards}</div></body></html>"
+
+
+def main():
+    for n in SIZES:
+        html = listing_page(n)
+        extractor = BaseExtractor()
+        tree = load_html(html)
+        start = time.perf_counter()
+        for tagname, backtracking in LINK_DENSITY_TAGS:
+            extractor.delete_by_link_density(tree, tagname, backtracking=backtracking)
+        elapsed = time.perf_counter() - start
+        print(f"siblings={n:5d} delete_by_link_density={elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
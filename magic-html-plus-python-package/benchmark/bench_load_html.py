@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+load_html 字节输入基准：先解码为 str 再解析的原路径与直接解析字节的对比，
+输入为测试页面的 UTF-8 编码，分别以 bytes / bytearray / memoryview / mmap 传入
+
+    python -m benchmark.bench_load_html
+"""
+
+import mmap
+
+from lxml.html import tostring
+
+from magic_html.utils import decode_file, load_html, load_html_text
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+
+def legacy_load_html(data):
+    """改写前字节输入的处理方式：decode_file 解码为 str 后解析"""
+    return load_html_text(decode_file(data))
+
+
+def to_mmap(data):
+    """把页面写入匿名 mmap"""
+    buffer = mmap.mmap(-1, len(data))
+    buffer.write(data)
+    return buffer
+
+
+def main():
+    for kind in KINDS:
+        pages = [html.encode("utf-8") for _, _, html in load_pages(kind)]
+        for data in pages:
+            assert tostring(load_html(data)) == tostring(legacy_load_html(data))
+        inputs = {
+            "bytes": pages,
+            "bytearray": [bytearray(data) for data in pages],
+            "memoryview": [memoryview(data) for data in pages],
+            "mmap": [to_mmap(data) for data in pages],
+        }
+
+        legacy = best_of(lambda: [legacy_load_html(data) for data in pages])
+        line = f"{kind:8s} pages={len(pages)} bytes={sum(map(len, pages))} legacy={legacy * 1000:.1f} ms"
+        for name, items in inputs.items():
+            elapsed = best_of(lambda: [load_html(data) for data in items])
+            line += f" {name}={elapsed * 1000:.1f} ms ({legacy / elapsed:.2f}x)"
+        print(line)
+        for buffer in inputs["mmap"]:
+            buffer.close()
+
+
+if __name__ == "__main__":
+    main()
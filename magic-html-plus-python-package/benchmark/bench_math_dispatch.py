@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+公式处理器查表基准：对测试页面的每个节点执行 math_latex_processing 的耗时，
+以及注册站点特有处理器后的耗时（不匹配的节点不会执行这些处理器）
+
+    python -m benchmark.bench_math_dispatch
+"""
+
+import gc
+import time
+
+from magic_html.extractors.base_extractor import BaseExtractor
+from magic_html.math_handlers import MATH_HANDLERS
+from magic_html.utils import load_html
+
+from benchmark.bench_utils import KINDS, load_pages
+
+CUSTOM_HANDLERS = 20
+
+
+def time_process(pages, repeat=3):
+    """对每个节点执行 math_latex_processing 的最短耗时（秒），每轮重新解析，解析不计时"""
+    best = float("inf")
+    for _ in range(repeat):
+        nodes = [node for html in pages for node in load_html(html).iter()]
+        extractor = BaseExtractor()
+        # 节点列表很大，关闭 GC 避免回收的耗时混入
+        gc.disable()
+        start = time.perf_counter()
+        for node in nodes:
+            extractor.math_latex_processing(node)
+        best = min(best, time.perf_counter() - start)
+        gc.enable()
+    return best
+
+
+def site_handler(extractor, node, parent):
+    node.set("data-site-math", "1")
+
+
+def main():
+    for kind in KINDS:
+        pages = [html for _, _, html in load_pages(kind)]
+        nodes = sum(1 for html in pages for _ in load_html(html).iter())
+        builtin = time_process(pages)
+        for i in range(CUSTOM_HANDLERS):
+            MATH_HANDLERS.register(site_handler, tag=f"site-math-{i}")
+            MATH_HANDLERS.register(site_handler, class_name=f"site-math-{i}")
+        custom = time_process(pages)
+        MATH_HANDLERS.unregister(site_handler)
+        print(
+            f"{kind:8s} pages={len(pages)} nodes={nodes} builtin={builtin * 1000:.1f} ms "
+            f"with_{CUSTOM_HANDLERS * 2}_custom={custom * 1000:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
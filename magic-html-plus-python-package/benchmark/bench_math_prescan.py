@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+公式预检基准：convert_tags 中对每个节点执行 math_latex_processing 与先做整页预检的耗时对比，
+同时统计跳过公式转换的页面比例
+
+    python -m benchmark.bench_math_prescan
+"""
+
+import time
+
+from lxml.html import tostring
+
+from magic_html.extractors.base_extractor import BaseExtractor
+from magic_html.utils import load_html
+
+from benchmark.bench_utils import KINDS, load_pages
+
+
+class AlwaysMathExtractor(BaseExtractor):
+    """不做预检，每个节点都执行公式转换"""
+
+    def contains_math(self, element):
+        return True
+
+
+def convert_all(extractor_class, trees):
+    skipped = 0
+    for tree in trees:
+        extractor = extractor_class()
+        extractor.convert_tags(tree)
+        skipped += extractor.math_skipped
+    return skipped
+
+
+def time_convert(extractor_class, pages, repeat=3):
+    """convert_tags 的最短耗时（秒），每轮重新解析，解析不计时"""
+    best = float("inf")
+    for _ in range(repeat):
+        trees = [load_html(html) for html in pages]
+        start = time.perf_counter()
+        convert_all(extractor_class, trees)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    for kind in KINDS:
+        pages = [html for _, _, html in load_pages(kind)]
+        expected = [load_html(html) for html in pages]
+        convert_all(AlwaysMathExtractor, expected)
+        trees = [load_html(html) for html in pages]
+        skipped = convert_all(BaseExtractor, trees)
+        assert [tostring(t) for t in trees] == [tostring(t) for t in expected]
+
+        always = time_convert(AlwaysMathExtractor, pages)
+        prescan = time_convert(BaseExtractor, pages)
+        print(
+            f"{kind:8s} pages={len(pages)} math_skipped={skipped} "
+            f"always={always * 1000:.1f} ms prescan={prescan * 1000:.1f} ms ({always / prescan:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+MathML 转 LaTeX 基准：不缓存、按 MathML 缓存、整页批量转换三种方式下 convert_tags 的耗时
+
+测试集中的文章页面没有需要 XSLT 转换的 <math>，这里在文章页面的段落后插入由
+AsciiMath 生成的 MathML，每个页面 40 个不同公式各重复 5 次，模拟理科页面中反复出现的行内符号
+
+    python -m benchmark.bench_mathml
+"""
+
+import logging
+import random
+import time
+
+from lxml.html import fromstring, tostring
+
+from magic_html import utils
+from magic_html.extractors.base_extractor import BaseExtractor
+from magic_html.utils import ASCIIMath2MathML, load_html
+
+from benchmark.bench_utils import load_pages
+
+ATOMS = [
+    "x", "y_1", "a^2", "sqrt(x)", "root(3)(x)", "frac(a)(b)", "sum_(i=1)^n", "int_0^1 f(x) dx",
+    "lim_(x->0)", "(a+b)", "[[a,b],[c,d]]", "sin x", "alpha", "oo", "!=", "<=", "hat(x)", "vec v",
+    "abs(x)", "e^(i pi)", "ln x", "->", "cdot", "xx", "x_(i,j)^2", "{x | x > 0}",
+]
+FORMULAS = 40
+REPEAT = 5
+
+
+def make_formulas(seed):
+    translator = ASCIIMath2MathML(log=False)
+    rng = random.Random(seed)
+    formulas = []
+    # translate 会输出 DTD 相关的警告
+    level = logging.getLogger().level
+    logging.getLogger().setLevel(logging.ERROR)
+    for _ in range(FORMULAS):
+        expr = " ".join(rng.choice(ATOMS) for _ in range(rng.randint(1, 4)))
+        formulas.append(translator.translate(expr, xml_pprint=False))
+    logging.getLogger().setLevel(level)
+    return formulas
+
+
+def math_page(html, seed):
+    """在页面的段落后面插入公式"""
+    tree = load_html(html)
+    paragraphs = list(tree.iter("p")) or [tree.find("body")]
+    formulas = make_formulas(seed) * REPEAT
+    random.Random(seed).shuffle(formulas)
+    for i, formula in enumerate(formulas):
+        paragraphs[i % len(paragraphs)].append(fromstring(formula))
+    return tostring(tree, encoding=str)
+
+
+class BatchExtractor(BaseExtractor):
+    mathml_batch = True
+
+
+def convert_all(extractor_class, pages, cache_size):
+    """返回 convert_tags 的耗时（秒，不含解析）和转换后的页面"""
+    utils.MML_CACHE.clear()
+    utils.MML_CACHE_SIZE = cache_size
+    trees = [load_html(html) for html in pages]
+    start = time.perf_counter()
+    for tree in trees:
+        extractor_class().convert_tags(tree)
+    return time.perf_counter() - start, [tostring(tree) for tree in trees]
+
+
+def main():
+    pages = [math_page(html, i) for i, (_, _, html) in enumerate(load_pages("article", limit=20))]
+    cache_size = utils.MML_CACHE_SIZE
+    expected = None
+    line = f"pages={len(pages)} formulas={len(pages) * FORMULAS * REPEAT}"
+    for name, extractor_class, size in [
+        ("uncached", BaseExtractor, 0),
+        ("cached", BaseExtractor, cache_size),
+        ("batch", BatchExtractor, cache_size),
+    ]:
+        elapsed, result = min(
+            (convert_all(extractor_class, pages, size) for _ in range(3)), key=lambda r: r[0]
+        )
+        if expected is None:
+            expected, baseline = result, elapsed
+        assert result == expected
+        line += f" {name}={elapsed * 1000:.1f} ms ({baseline / elapsed:.2f}x)"
+    utils.MML_CACHE_SIZE = cache_size
+    print(line)
+
+
+if __name__ == "__main__":
+    main()
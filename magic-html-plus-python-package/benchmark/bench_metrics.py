@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+对每个 div/section/article/ul/li/p 元素计算链接文本密度与 readability 链接密度，
+对比逐个拼接子树文本统计与使用 TextMetrics 缓存的耗时
+
+    python -m benchmark.bench_metrics
+"""
+
+from magic_html.metrics import TextMetrics
+from magic_html.readability_plus import text_length
+from magic_html.utils import density_of_a_text, load_html, text_len
+from magic_html.xpaths import run_xpath
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+TAGS = ("div", "section", "article", "ul", "li", "p")
+
+
+def walk_plain(elems):
+    for elem in elems:
+        density_of_a_text(elem, 0.5)
+        text_len("".join(run_xpath(elem, ".//text()[not(ancestor::a)]")))
+        sum(text_length(a) for a in elem.findall(".//a")) / max(text_length(elem), 1)
+
+
+def walk_metrics(elems):
+    metrics = TextMetrics()
+    for elem in elems:
+        density_of_a_text(elem, 0.5, metrics=metrics)
+        metrics.nonlink_text_len(elem)
+        metrics.link_length(elem) / max(metrics.clean_length(elem), 1)
+
+
+def main():
+    for kind in KINDS:
+        plain_total = metrics_total = 0.0
+        count = 0
+        pages = load_pages(kind)
+        for _, _, html in pages:
+            tree = load_html(html)
+            if tree is None:
+                continue
+            elems = [elem for elem in tree.iter(*TAGS)]
+            count += len(elems)
+            plain_total += best_of(lambda: walk_plain(elems), repeat=1)
+            metrics_total += best_of(lambda: walk_metrics(elems), repeat=1)
+        n = len(pages)
+        print(
+            f"{kind:8s} pages={n} elements={count} plain={plain_total / n * 1000:.2f} ms/page "
+            f"metrics={metrics_total / n * 1000:.2f} ms/page "
+            f"speedup={plain_total / metrics_total:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
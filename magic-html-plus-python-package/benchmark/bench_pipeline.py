@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+单次遍历流水线基准：原先 convert_tags、clean_tags 分别遍历与 normalize_tree 一次遍历的耗时，
+以及完整提取一个页面时对文档树的平均遍历次数
+
+    python -m benchmark.bench_pipeline
+"""
+
+import time
+
+from lxml.etree import Comment, strip_elements
+from lxml.html import tostring
+
+from magic_html.config import (
+    CONTENT_EXTRACTOR_NOISE_XPATHS,
+    MANUALLY_CLEANED,
+    MANUALLY_STRIPPED,
+    REMOVE_COMMENTS_XPATH,
+    USELESS_ATTR,
+)
+from magic_html.extractors.article_extractor import ArticleExtractor
+from magic_html.extractors.base_extractor import BaseExtractor
+from magic_html.extractors.forum_extractor import ForumExtractor
+from magic_html.pipeline import PipelineContext
+from magic_html.utils import HTML_CLEANER, iter_tree, load_html, run_xpath
+
+from benchmark.bench_utils import KINDS, load_pages
+
+
+class LegacyMixin:
+    """改写前的流程：标签转换遍历一次，清理时每条噪声 XPath、figure、每个标签、空节点各遍历一次"""
+
+    def normalize_tree(self, tree, base_url="", convert=True, clean=True):
+        if convert:
+            tree = self.legacy_convert_tags(tree, base_url)
+        if clean:
+            tree = self.legacy_clean_tags(tree)
+        return tree
+
+    def legacy_convert_tags(self, element, base_url):
+        useless_attrs = USELESS_ATTR if self.need_comment else USELESS_ATTR + ["comment"]
+        has_math = self.contains_math(element)
+        self.math_skipped = not has_math
+        context = PipelineContext(
+            element, base_url=base_url, has_math=has_math, useless_attrs=set(useless_attrs)
+        )
+        self.traversals += 1
+        for node in iter_tree(element):
+            self.convert_node(node, context)
+        return element
+
+    def legacy_clean_tags(self, tree):
+        strip_elements(tree, Comment)
+        xp_lists = []
+        if not self.need_comment:
+            xp_lists.append(REMOVE_COMMENTS_XPATH)
+        xp_lists.append(CONTENT_EXTRACTOR_NOISE_XPATHS)
+        for xp_list in xp_lists:
+            tree = self.prune_unwanted_nodes(tree, xp_list)
+        cleaning_list, stripping_list = MANUALLY_CLEANED.copy(), MANUALLY_STRIPPED.copy()
+        for elem in run_xpath(tree, ".//figure[descendant::table]"):
+            elem.tag = "div"
+        self.metrics.clear()
+        for expression in cleaning_list + ["form"]:
+            for element in tree.getiterator(expression):
+                if element.tag == "form":
+                    if self.metrics.nonlink_text_len(element) <= 60:
+                        self.remove_node(element)
+                else:
+                    self.remove_node(element)
+        HTML_CLEANER.kill_tags, HTML_CLEANER.remove_tags = cleaning_list, stripping_list
+        cleaned_tree = HTML_CLEANER.clean_html(self.prune_html(tree))
+        self.metrics.clear()
+        # 注释、figure、每个标签和 form、空节点、HTML_CLEANER，噪声 XPath 在 prune_unwanted_nodes 中计数
+        self.traversals += 1 + 1 + len(cleaning_list) + 1 + 1 + 1
+        return cleaned_tree
+
+
+class LegacyBase(LegacyMixin, BaseExtractor):
+    pass
+
+
+class LegacyArticle(LegacyMixin, ArticleExtractor):
+    pass
+
+
+class LegacyForum(LegacyMixin, ForumExtractor):
+    pass
+
+
+EXTRACTORS = {
+    "article": (ArticleExtractor, LegacyArticle),
+    "forum": (ForumExtractor, LegacyForum),
+}
+
+
+def normalize_all(extractor_class, pages, need_comment):
+    """返回 normalize_tree 的耗时（秒，不含解析）和处理后的页面"""
+    trees = [load_html(html) for _, html in pages]
+    start = time.perf_counter()
+    results = []
+    for (url, _), tree in zip(pages, trees):
+        extractor = extractor_class()
+        extractor.need_comment = need_comment
+        results.append(extractor.normalize_tree(tree, base_url=url))
+    return time.perf_counter() - start, [tostring(tree) for tree in results]
+
+
+def mean_traversals(extractor_class, pages):
+    return sum(extractor_class().extract(html, base_url=url)["traversals"] for url, html in pages) / len(pages)
+
+
+def main():
+    for kind in KINDS:
+        pages = [(url, html) for _, url, html in load_pages(kind)]
+        need_comment = kind == "forum"
+        legacy, expected = min(
+            (normalize_all(LegacyBase, pages, need_comment) for _ in range(3)), key=lambda r: r[0]
+        )
+        fused, result = min(
+            (normalize_all(BaseExtractor, pages, need_comment) for _ in range(3)), key=lambda r: r[0]
+        )
+        assert result == expected
+        fused_class, legacy_class = EXTRACTORS[kind]
+        print(
+            f"{kind:8s} pages={len(pages)} normalize legacy={legacy * 1000:.1f} ms "
+            f"fused={fused * 1000:.1f} ms ({legacy / fused:.2f}x) "
+            f"traversals/page legacy={mean_traversals(legacy_class, pages):.1f} "
+            f"fused={mean_traversals(fused_class, pages):.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
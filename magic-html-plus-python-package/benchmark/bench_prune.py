@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+prune_unwanted_nodes(with_backup=True) 中回退机制的开销：
+删除日志（当前实现）与原先每次调用都执行的 deepcopy + 两次 text_content() 对比
+
+    python -m benchmark.bench_prune
+"""
+
+import time
+from copy import deepcopy
+
+from magic_html.config import OVERALL_DISCARD_XPATH
+from magic_html.extractors.base_extractor import BaseExtractor
+from magic_html.utils import load_html
+
+from benchmark.bench_utils import KINDS, load_pages
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    extractor = BaseExtractor()
+    for kind in KINDS:
+        plain_total = journal_total = copy_total = 0.0
+        pages = load_pages(kind)
+        for _, _, html in pages:
+            if load_html(html) is None:
+                continue
+            plain_total += timed(
+                extractor.prune_unwanted_nodes, load_html(html), OVERALL_DISCARD_XPATH
+            )
+            journal_total += timed(
+                extractor.prune_unwanted_nodes, load_html(html), OVERALL_DISCARD_XPATH, with_backup=True
+            )
+            tree = load_html(html)
+            copy_total += timed(
+                lambda: (len(tree.text_content()), deepcopy(tree), len(tree.text_content()))
+            )
+        n = len(pages)
+        print(
+            f"{kind:8s} pages={n} no backup={plain_total / n * 1000:.2f} ms/page "
+            f"journal={journal_total / n * 1000:.2f} ms/page "
+            f"(overhead {(journal_total - plain_total) / n * 1000:.2f}) "
+            f"old deepcopy overhead={copy_total / n * 1000:.2f} ms/page"
+        )
+
+
+if __name__ == "__main__":
+    main()
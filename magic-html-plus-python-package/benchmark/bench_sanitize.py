@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Document.sanitize 对每个 table/ul/div/aside/header/footer/section 读取的统计：
+原先每个元素两次 text_content()、七次 findall 和祖先 XPath，与 ReadabilityMetrics 一次自底向上遍历后查表对比；
+嵌套越深，前者重复扫描的子树越大
+
+    python -m benchmark.bench_sanitize
+"""
+
+from lxml.html import HTMLParser, fromstring
+
+from magic_html.extractors.base_extractor import BaseExtractor
+from magic_html.metrics import COUNTED_TAGS, ReadabilityMetrics
+from magic_html.utils import load_html, run_xpath
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+SANITIZED_TAGS = ("table", "ul", "div", "aside", "header", "footer", "section")
+# 默认的解析器最多嵌套 256 层，构造深层页面需要 huge_tree
+DEEP_PARSER = HTMLParser(huge_tree=True, remove_comments=True)
+DEPTHS = (100, 500, 2000)
+
+
+def scan_stats(elems):
+    """改写前的统计方式"""
+    stats = []
+    for el in elems:
+        commas = el.text_content().count(",") + el.text_content().count("，")
+        counts = {kind: len(el.findall(".//%s" % kind)) for kind in COUNTED_TAGS}
+        counts["hidden_input"] = len(el.findall('.//input[@type="hidden"]'))
+        in_code = any(run_xpath(el, f"ancestor::{tag}[1]") for tag in ("code", "pre"))
+        stats.append((commas, counts, in_code))
+    return stats
+
+
+def table_stats(elems):
+    metrics = ReadabilityMetrics()
+    stats = []
+    for el in elems:
+        in_code = False
+        for _ in el.iterancestors("code", "pre"):
+            in_code = True
+            break
+        stats.append((metrics.commas(el), metrics.tag_counts(el), in_code))
+    return stats
+
+
+def deep_page(depth):
+    """每层一个 div、一个带逗号的段落和一个链接"""
+    return "<html><body>" + "<div><p>a, b</p><a href='#'>x</a>" * depth + "</div>" * depth + "</body></html>"
+
+
+def compare(label, elems):
+    assert scan_stats(elems) == table_stats(elems)
+    scan = best_of(lambda: scan_stats(elems))
+    table = best_of(lambda: table_stats(elems))
+    print(f"{label} elements={len(elems)} scan={scan * 1000:.1f} ms table={table * 1000:.1f} ms ({scan / table:.1f}x)")
+
+
+def main():
+    extractor = BaseExtractor()
+    for kind in KINDS:
+        elems = []
+        for _, url, html in load_pages(kind):
+            tree = load_html(html)
+            if tree is not None:
+                tree = extractor.normalize_tree(tree, base_url=url)
+                elems.extend(el for el in tree.iter(*SANITIZED_TAGS))
+        compare(f"{kind:8s}", elems)
+    for depth in DEPTHS:
+        tree = fromstring(deep_page(depth), parser=DEEP_PARSER)
+        compare(f"depth={depth:<5d}", list(tree.iter(*SANITIZED_TAGS)))
+
+
+if __name__ == "__main__":
+    main()
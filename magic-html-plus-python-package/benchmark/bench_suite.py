@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+吞吐量和延迟基准：文章、论坛提取器分别处理 benchmark/data/article、benchmark/data/forum 下的全部页面，
+报告每秒页数、每秒字节数、单页延迟的 p50/p90/p99/max、进程的峰值内存，以及 readability 宽松模式
+重新评分（retries）和沿用严格模式结果（reuses）的次数，
+并把结果写入 JSON，便于比较两次运行。
+不需要网络，也不依赖 evaluate_*.py 使用的 jieba、ltp 等评估依赖。
+
+每个 (语料, 提取器) 组合在新进程中运行，峰值内存互不影响；每个组合执行 --repeat 轮，
+取总耗时最短的一轮，该轮中每个提取成功的页面的耗时作为延迟样本；失败的页面按异常类型计数并在结果中列出。
+旧版本的提取结果中没有 readability_retries 等字段时记为 0
+
+    python -m benchmark.bench_suite
+    python -m benchmark.bench_suite --repeat 5 --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import lxml
+import numpy as np
+
+from benchmark.bench_utils import KINDS
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXTRACTORS = ("article", "forum")
+PERCENTILES = (50, 90, 99)
+
+CHILD = """
+import json, resource, sys, time
+from collections import Counter
+from magic_html.extractors.article_extractor import ArticleExtractor
+from magic_html.extractors.forum_extractor import ForumExtractor
+from benchmark.bench_utils import load_pages
+
+corpus, name, repeat = sys.argv[1], sys.argv[2], int(sys.argv[3])
+limit = int(sys.argv[4]) or None
+extractor = {"article": ArticleExtractor, "forum": ForumExtractor}[name]()
+pages = load_pages(corpus, limit)
+best = None
+for _ in range(repeat):
+    latencies, errors, retries, reuses = [], Counter(), 0, 0
+    start = time.perf_counter()
+    for _, url, html in pages:
+        page_start = time.perf_counter()
+        try:
+            result = extractor.extract(html=html, base_url=url)
+        except Exception as e:
+            errors[type(e).__name__] += 1
+            continue
+        latencies.append(time.perf_counter() - page_start)
+        retries += result.get("readability_retries", 0)
+        reuses += result.get("readability_reuses", 0)
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best["seconds"]:
+        best = {"seconds": elapsed, "latencies": latencies, "errors": errors, "retries": retries, "reuses": reuses}
+# Linux 上为 KB，macOS 上为字节
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+best["peak_rss_mb"] = peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+best["pages"] = len(pages)
+best["bytes"] = sum(len(html.encode("utf-8")) for _, _, html in pages)
+print(json.dumps(best))
+"""
+
+
+def run_child(corpus, extractor, repeat, limit):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, corpus, extractor, str(repeat), str(limit or 0)],
+        capture_output=True,
+        text=True,
+        cwd=PACKAGE_ROOT,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(corpus, extractor, raw):
+    # 全部页面都失败时没有延迟样本，延迟记为 nan
+    latencies = np.array(raw["latencies"] or [np.nan]) * 1000
+    seconds = raw["seconds"]
+    latency = {f"p{p}": float(np.percentile(latencies, p)) for p in PERCENTILES}
+    latency["max"] = float(latencies.max())
+    latency["mean"] = float(latencies.mean())
+    return {
+        "corpus": corpus,
+        "extractor": extractor,
+        "pages": raw["pages"],
+        "errors": sum(raw["errors"].values()),
+        "error_types": raw["errors"],
+        "readability_retries": raw["retries"],
+        "readability_reuses": raw["reuses"],
+        "seconds": seconds,
+        "pages_per_sec": raw["pages"] / seconds,
+        "bytes_per_sec": raw["bytes"] / seconds,
+        "latency_ms": latency,
+        "peak_rss_mb": raw["peak_rss_mb"],
+    }
+
+
+def environment():
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "lxml": lxml.__version__,
+        "cpus": os.cpu_count(),
+    }
+
+
+def report(result, baseline=None):
+    latency = result["latency_ms"]
+    line = (
+        f"{result['corpus']:8s} {result['extractor']:8s} pages={result['pages']} errors={result['errors']} "
+        f"retries={result['readability_retries']} reuses={result['readability_reuses']} "
+        f"{result['pages_per_sec']:.1f} pages/s {result['bytes_per_sec'] / 1024 / 1024:.2f} MB/s "
+        f"p50={latency['p50']:.1f} p90={latency['p90']:.1f} p99={latency['p99']:.1f} "
+        f"max={latency['max']:.1f} ms peak_rss={result['peak_rss_mb']:.0f} MB"
+    )
+    if result["error_types"]:
+        line += " error_types=" + ",".join(f"{name}:{count}" for name, count in sorted(result["error_types"].items()))
+    if baseline is not None:
+        line += (
+            f" | vs baseline: {result['pages_per_sec'] / baseline['pages_per_sec']:.2f}x pages/s, "
+            f"p99 {baseline['latency_ms']['p99']:.1f} -> {latency['p99']:.1f} ms, "
+            f"peak_rss {baseline['peak_rss_mb']:.0f} -> {result['peak_rss_mb']:.0f} MB"
+        )
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", choices=KINDS, action="append", help="默认全部语料")
+    parser.add_argument("--extractor", choices=EXTRACTORS, action="append", help="默认全部提取器")
+    parser.add_argument("--repeat", type=int, default=3, help="每个组合执行的轮数，取最快的一轮")
+    parser.add_argument("--limit", type=int, default=None, help="每个语料最多使用的页面数")
+    parser.add_argument("--output", default="bench_suite.json", help="结果 JSON 的路径")
+    parser.add_argument("--compare", default=None, help="之前运行的结果 JSON，逐项输出对比")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            for result in json.load(f)["results"]:
+                baseline[result["corpus"], result["extractor"]] = result
+
+    results = []
+    for corpus in args.corpus or KINDS:
+        for extractor in args.extractor or EXTRACTORS:
+            result = summarize(corpus, extractor, run_child(corpus, extractor, args.repeat, args.limit))
+            report(result, baseline.get((corpus, extractor)))
+            results.append(result)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
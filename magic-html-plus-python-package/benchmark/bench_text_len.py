@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+text_len 微基准：原实现、当前实现与批量版本 text_len_many 的对比，
+输入为测试页面中 p/div/li/a/span 元素的文本；开始前先校验 EDGE_STRINGS 上两者的结果一致
+
+    python -m benchmark.bench_text_len
+"""
+
+import re
+
+from magic_html.utils import load_html, text_len, text_len_many
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+
+def legacy_text_len(s):
+    """改写前的 text_len，用于校验结果与对比耗时"""
+    s = re.sub(" +", " ", s)
+    s = re.sub("[\n\t\r]+", "\n", s)
+    english_words = s.split()
+    chinese_characters = re.findall(r"[一-鿿]", s)
+    japanese_characters = re.findall(r"[぀-ゟ゠-ヿ]", s)
+    arabic_characters = re.findall(r"[؀-ۿ]", s)
+    return (
+            len(english_words)
+            + len(chinese_characters)
+            + len(japanese_characters)
+            + len(arabic_characters)
+    )
+
+
+# 逐个调用与批量调用必须一致的特殊输入：单独的代理码位、各种空白、查找表边界附近的码位
+EDGE_STRINGS = [
+    "a \ud800 b",
+    "\udc80中文\udfff ab",
+    "x\u3000y\u2028z\x1c\x85 w",
+    "\u05ff\u0600\u06ff\u0700 \u303f\u3040\u30ff\u3100 \u4dff\u4e00\u9fff\ua000",
+    "\U0001f600 emoji \U00020000",
+    "",
+    " \t\n ",
+] * 300
+
+
+def main():
+    assert text_len_many(iter(EDGE_STRINGS)) == [text_len(s) for s in EDGE_STRINGS]
+    for kind in KINDS:
+        strings = []
+        for _, _, html in load_pages(kind):
+            tree = load_html(html)
+            if tree is not None:
+                strings.extend(e.text_content() for e in tree.iter("p", "div", "li", "a", "span"))
+        expected = [legacy_text_len(s) for s in strings]
+        assert [text_len(s) for s in strings] == expected
+        assert text_len_many(strings) == expected
+
+        legacy = best_of(lambda: [legacy_text_len(s) for s in strings])
+        single = best_of(lambda: [text_len(s) for s in strings])
+        batch = best_of(lambda: text_len_many(strings))
+        chars = sum(map(len, strings))
+        print(
+            f"{kind:8s} strings={len(strings)} chars={chars} "
+            f"legacy={legacy * 1000:.1f} ms text_len={single * 1000:.1f} ms "
+            f"({legacy / single:.1f}x) text_len_many={batch * 1000:.1f} ms ({legacy / batch:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
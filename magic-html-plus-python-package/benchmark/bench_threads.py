@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+线程池批量提取基准：同一个 GeneralExtractor 在 1 到 N 个线程中提取全部页面的吞吐量（页/秒），
+N 默认为 CPU 核数与 4 中的较大者，可以通过命令行参数指定。
+lxml 解析、XPath 和 XSLT 执行时释放 GIL，吞吐量随线程数的提高取决于这部分耗时所占的比例；
+在 free-threaded 构建（python3.13t）上运行时没有 GIL，纯 Python 部分也可以并行
+
+    python -m benchmark.bench_threads [N]
+    python3.13t -m benchmark.bench_threads [N]
+"""
+
+import os
+import sys
+import sysconfig
+
+from magic_html import GeneralExtractor
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+
+def thread_counts(limit):
+    counts = [1]
+    while counts[-1] * 2 <= limit:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != limit:
+        counts.append(limit)
+    return counts
+
+
+def main():
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else max(os.cpu_count() or 1, 4)
+    free_threaded = bool(sysconfig.get_config_var("Py_GIL_DISABLED"))
+    # free-threaded 构建上导入不支持的 C 扩展时会重新启用 GIL
+    gil_enabled = sys._is_gil_enabled() if hasattr(sys, "_is_gil_enabled") else True
+    print(
+        f"python={sys.version.split()[0]} free_threaded={free_threaded} "
+        f"gil_enabled={gil_enabled} cpus={os.cpu_count()}"
+    )
+    extractor = GeneralExtractor()
+    for kind in KINDS:
+        items = [(html, url, kind) for _, url, html in load_pages(kind)]
+        expected = extractor.extract_many(items, processes=1)
+        base = None
+        line = f"{kind:8s} pages={len(items)}"
+        for threads in thread_counts(limit):
+            assert extractor.extract_many(items, processes=threads, executor="thread") == expected
+            elapsed = best_of(
+                lambda: extractor.extract_many(items, processes=threads, executor="thread")
+            )
+            rate = len(items) / elapsed
+            base = base or rate
+            line += f" threads={threads}: {rate:.1f} pages/s ({rate / base:.2f}x)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
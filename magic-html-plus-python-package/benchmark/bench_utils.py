@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准脚本的公共工具，从包根目录以模块方式运行，例如：
+
+    python -m benchmark.bench_xpath
+"""
+
+import json
+import os
+import time
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+KINDS = ("article", "forum")
+
+
+def load_pages(kind="article", limit=None):
+    """读取 benchmark/data/<kind> 下的测试页面，返回 (key, url, html) 列表"""
+    with open(os.path.join(DATA_DIR, kind, "base.json"), "r", encoding="utf-8") as f:
+        base = json.loads(f.read())
+    pages = []
+    for k, v in base.items():
+        with open(os.path.join(DATA_DIR, kind, "htmls", f"{k}.html"), "r", encoding="utf-8") as f:
+            pages.append((k, v["url"], f.read()))
+        if limit and len(pages) >= limit:
+            break
+    return pages
+
+
+def best_of(func, repeat=3, number=1):
+    """重复执行 repeat 轮，每轮调用 number 次，返回单次调用的最短耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
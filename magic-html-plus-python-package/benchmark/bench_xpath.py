@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+对比 config.py 中规则以字符串形式执行与预编译后执行的耗时
+
+    python -m benchmark.bench_xpath
+"""
+
+from magic_html.utils import load_html
+from magic_html.xpaths import RULE_LISTS, XPathRegistry
+
+from benchmark.bench_utils import KINDS, best_of, load_pages
+
+
+def main():
+    registry = XPathRegistry()
+    registry.warm()
+    stats = registry.stats()
+    print(f"compile {stats['compiled']} rules: {stats['compile_seconds'] * 1000:.2f} ms")
+
+    exprs = [expr for rule_list in RULE_LISTS for expr in rule_list]
+    for kind in KINDS:
+        raw_total = compiled_total = 0.0
+        pages = load_pages(kind)
+        for _, _, html in pages:
+            tree = load_html(html)
+            if tree is None:
+                continue
+            raw_total += best_of(lambda: [tree.xpath(expr) for expr in exprs])
+            compiled_total += best_of(lambda: [registry(tree, expr) for expr in exprs])
+        n = len(pages)
+        print(
+            f"{kind:8s} pages={n} raw={raw_total / n * 1000:.2f} ms/page "
+            f"compiled={compiled_total / n * 1000:.2f} ms/page "
+            f"saved={(raw_total - compiled_total) / n * 1000:.2f} ms/page"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from magic_html.extractors.article_extractor import ArticleExtractor
 from magic_html.extractors.weixin_extractor import WeixinExtractor
 from magic_html.extractors.forum_extractor import ForumExtractor
 from magic_html.extractors.custom_extractor import CustomExtractor
+from magic_html.batch import iter_extract
 
 
 class GeneralExtractor:
@@ -33,15 +34,20 @@ class GeneralExtractor:
                 pass
         else:
             self.rule = {}
+        # 提取器只保存配置，每次调用的状态在 ExtractionContext 中，同一个实例可以在多个线程中同时使用
+        self.article_extractor = ArticleExtractor()
+        self.forum_extractor = ForumExtractor()
+        self.weixin_extractor = WeixinExtractor()
+        self.custom_extractor = CustomExtractor()
 
     def extract(self, html="", **kwargs) -> dict:
         base_url = kwargs.get("base_url", "")
         html_type = kwargs.pop("html_type", None)
         if html_type:
             if html_type == "forum":
-                return ForumExtractor().extract(html=html, **kwargs)
+                return self.forum_extractor.extract(html=html, **kwargs)
             elif html_type == "weixin":
-                return WeixinExtractor().extract(html=html, **kwargs)
+                return self.weixin_extractor.extract(html=html, **kwargs)
         if base_url:
             netloc = urlparse(base_url).netloc
             if netloc in self.rule:
@@ -49,10 +55,33 @@ class GeneralExtractor:
                     new_kwargs = dict()
                     new_kwargs["rule"] = self.rule[netloc]
                     new_kwargs.update(kwargs)
-                    return CustomExtractor().extract(html=html, **new_kwargs)
+                    return self.custom_extractor.extract(html=html, **new_kwargs)
                 except:
                     # 当自定义规则不能覆盖站点所有板块时，使用
-                    return ArticleExtractor().extract(html=html, **kwargs)
+                    return self.article_extractor.extract(html=html, **kwargs)
             if netloc == "mp.weixin.qq.com":
-                return WeixinExtractor().extract(html=html, **kwargs)
-        return ArticleExtractor().extract(html=html, **kwargs)
+                return self.weixin_extractor.extract(html=html, **kwargs)
+        return self.article_extractor.extract(html=html, **kwargs)
+
+    def extract_many(self, items, processes=None, chunksize=1, ordered=True, errors="raise", stream=False,
+                     executor="process"):
+        """
+        批量提取，items 为 (html, base_url, html_type) 的可迭代对象
+        processes 默认为 CPU 核数，为 1 时在当前进程内顺序执行
+        ordered=False 时结果按完成顺序返回
+        errors 为 raise / skip / return，见 magic_html.batch.iter_extract
+        stream=True 时返回生成器，逐条产出 (index, result)
+        executor="thread" 时在当前进程的线程池中执行，processes 为线程数，chunksize 不起作用
+        """
+        results = iter_extract(
+            self,
+            items,
+            processes=processes,
+            chunksize=chunksize,
+            ordered=ordered,
+            errors=errors,
+            executor=executor,
+        )
+        if stream:
+            return results
+        return [result for _, result in results]
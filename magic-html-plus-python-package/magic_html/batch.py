@@ -0,0 +1,160 @@
+# -*- coding:utf-8 -*-
+"""
+批量提取：把 GeneralExtractor.extract 分发到进程池或线程池中执行
+提取器的每次调用使用独立的 ExtractionContext，线程池中的所有线程共享同一个提取器；
+进程池的每个工作进程持有调用方提取器的副本，子类和实例上的设置（rule、discard_backend 等）与调用方一致
+"""
+
+import os
+import multiprocessing
+from collections import deque
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from magic_html.utils import BYTES_TYPES, buffer_to_bytes
+
+ERROR_POLICIES = ("raise", "skip", "return")
+EXECUTORS = ("process", "thread")
+
+# 每个工作进程持有的提取器副本，由 _init_worker 设置
+_worker_extractor = None
+
+
+def normalize_item(item):
+    """
+    将批量输入统一为 (html, base_url, html_type)
+    支持单独的 html 字符串/字节，或长度为 1~3 的元组/列表
+    memoryview、mmap 等无法传给工作进程的缓冲区转为 bytes
+    """
+    if isinstance(item, (str,) + BYTES_TYPES):
+        item = (item,)
+    item = tuple(item)
+    if not 1 <= len(item) <= 3:
+        raise ValueError("batch item must be (html, base_url, html_type)", item)
+    html, base_url, html_type = (item + ("", None))[:3]
+    if isinstance(html, BYTES_TYPES):
+        html = buffer_to_bytes(html)
+    return html, base_url or "", html_type
+
+
+def _init_worker(extractor):
+    global _worker_extractor
+    _worker_extractor = extractor
+
+
+def _extract_one(extractor, index, item):
+    try:
+        html, base_url, html_type = normalize_item(item)
+        kwargs = {"base_url": base_url}
+        if html_type:
+            kwargs["html_type"] = html_type
+        return index, True, extractor.extract(html=html, **kwargs)
+    except Exception as e:
+        return index, False, e
+
+
+def _worker_extract(task):
+    index, item = task
+    return _extract_one(_worker_extractor, index, item)
+
+
+def iter_extract(extractor, items, processes=None, chunksize=1, ordered=True,
+                 errors="raise", mp_context=None, executor="process"):
+    """
+    批量提取的流式版本，每完成一条即产出 (index, result)
+    index 为该条目在输入中的位置；ordered=False 时按完成顺序产出
+    errors:
+      - raise  遇到第一条失败即抛出该异常并终止进程池
+      - skip   丢弃失败的条目
+      - return 以异常对象代替结果产出
+    executor 为 thread 时 processes 为线程数，所有线程共享 extractor，见 _iter_threads
+    """
+    if errors not in ERROR_POLICIES:
+        raise ValueError(f"errors must be one of {ERROR_POLICIES}", errors)
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor must be one of {EXECUTORS}", executor)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    tasks = enumerate(items)
+
+    if processes <= 1:
+        outcomes = (_extract_one(extractor, index, item) for index, item in tasks)
+        yield from _apply_error_policy(outcomes, errors)
+        return
+
+    if executor == "thread":
+        yield from _apply_error_policy(_iter_threads(extractor, tasks, processes, ordered), errors)
+        return
+
+    ctx = mp_context or multiprocessing.get_context()
+    with ctx.Pool(processes, initializer=_init_worker, initargs=(extractor,)) as pool:
+        yield from _apply_error_policy(_iter_processes(pool, tasks, processes, chunksize, ordered), errors)
+
+
+def _iter_processes(pool, tasks, processes, chunksize, ordered):
+    """
+    在进程池中执行 _worker_extract，每次提交 chunksize 条，同时提交的批次不超过 2 * processes 个。
+    Pool.imap 的任务线程会一次性读完 items，很长的流会全部缓存在当前进程中，因此逐批提交
+    """
+    limit = 2 * processes
+    pending = deque()
+    while True:
+        chunk = list(islice(tasks, chunksize))
+        if chunk:
+            pending.append(pool.map_async(_worker_extract, chunk))
+        while pending and (len(pending) >= limit or not chunk):
+            for outcomes in _drain_async(pending, ordered):
+                yield from outcomes
+        if not chunk:
+            return
+
+
+def _drain_async(pending, ordered):
+    """ordered 时等待并产出最早提交的批次的结果，否则产出已完成的全部批次，都未完成时等待最早的批次"""
+    if ordered or not any(result.ready() for result in pending):
+        yield pending.popleft().get()
+        return
+    for result in [result for result in pending if result.ready()]:
+        pending.remove(result)
+        yield result.get()
+
+
+def _iter_threads(extractor, tasks, threads, ordered):
+    """
+    在线程池中执行 _extract_one，同时提交的任务不超过 2 * threads 个，items 可以是很长的流
+    生成器提前关闭（包括 errors=raise 时抛出异常）时取消尚未开始的任务
+    """
+    limit = 2 * threads
+    pending = deque()
+    with ThreadPoolExecutor(threads, thread_name_prefix="magic_html") as pool:
+        try:
+            for index, item in tasks:
+                pending.append(pool.submit(_extract_one, extractor, index, item))
+                while len(pending) >= limit:
+                    yield from _drain(pending, ordered)
+            while pending:
+                yield from _drain(pending, ordered)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _drain(pending, ordered):
+    """ordered 时等待并产出最早提交的任务，否则产出已完成的全部任务"""
+    if ordered:
+        yield pending.popleft().result()
+        return
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in [future for future in pending if future in done]:
+        pending.remove(future)
+        yield future.result()
+
+
+def _apply_error_policy(outcomes, errors):
+    for index, ok, payload in outcomes:
+        if ok:
+            yield index, payload
+        elif errors == "raise":
+            raise payload
+        elif errors == "return":
+            yield index, payload
@@ -208,6 +208,19 @@ CUT_EMPTY_ELEMS = {
     "strong",
 }
 
+# prune_unwanted_sections 中按链接密度删除的标签，依次处理，(标签, 是否回溯重复文本)
+LINK_DENSITY_TAGS = [
+    ("div", True),
+    ("article", False),
+    ("section", False),
+    ("ul", False),
+    ("li", False),
+    ("dl", False),
+    ("dt", False),
+    ("dd", False),
+    ("p", False),
+]
+
 USELESS_ATTR = [
     "share",
     "contribution",
@@ -222,6 +235,14 @@ USELESS_ATTR = [
     "report-infor",
 ]
 
+# convert_tags 的公式预检，与 math_latex_processing 中各分支的触发条件一一对应，都不满足时整棵树跳过公式转换
+MATH_PRESCAN_TAGS = ("math", "script", "img", "span")
+# class 恰好为这些值时才转换的写法不参与预检，由 convert_node 在读取 class 时逐节点判断，省去一次整页查找
+MATH_EXACT_CLASSES = frozenset(("math-container", "wp-katex-eq", "tex"))
+MATH_IMAGE_SRC_MARKERS = ("codecogs", "latex.php", "mimetex.cgi", "mathtex.cgi")
+# class 中包含类名 $class_name（两侧带空格）的节点
+CLASS_TOKEN_XPATH = 'boolean(.//@class[contains(concat(" ", normalize-space(.), " "), $class_name)])'
+
 BODY_XPATH = [
     """.//*[(self::article or self::div or self::main or self::section)][
     @class="post" or @class="entry" or
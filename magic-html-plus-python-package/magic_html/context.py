@@ -0,0 +1,81 @@
+# -*- coding:utf-8 -*-
+"""
+一次提取的状态
+
+提取器原先把删除的节点编号、是否保留评论、文本统计缓存、遍历次数等保存在实例上，
+同一个实例不能同时处理两个页面。这些状态现在放在 ExtractionContext 中，由
+extract 在调用开始时创建并保存在 ContextVar 里，每个线程（以及每个 asyncio 任务）
+看到的是自己的那一份，提取器实例只保存配置，可以在多个线程之间共享。
+"""
+
+from contextvars import ContextVar
+from functools import wraps
+
+from magic_html.metrics import TextMetrics
+from magic_html.profiling import stage
+
+
+class ExtractionContext:
+    def __init__(self, extractor, need_comment=False):
+        # 创建该状态的提取器，其他提取器的方法不会读到这份状态
+        self.extractor = extractor
+        self.drop_ids = []
+        self.need_comment = need_comment
+        # 文本统计缓存，所有删除都经过 remove_node 使其失效，其他改动树的地方需要 clear
+        self.metrics = TextMetrics()
+        # 最近一次 convert_tags 是否因预检未发现公式而跳过了公式转换
+        self.math_skipped = False
+        # 提取过程中对文档树的完整遍历次数（不含标题提取和 readability 内部的遍历）
+        self.traversals = 0
+        # readability 宽松模式重新评分的次数，以及没有候选节点、直接沿用严格模式结果的次数
+        self.readability_retries = 0
+        self.readability_reuses = 0
+        # profile=True 时为 {阶段名: 秒}，见 magic_html.profiling
+        self.timings = None
+
+
+CURRENT_CONTEXT = ContextVar("magic_html_extraction_context", default=None)
+
+
+def current_context(extractor):
+    """extractor 当前调用的状态，不在 extract 调用中时返回 None"""
+    context = CURRENT_CONTEXT.get()
+    if context is not None and context.extractor is extractor:
+        return context
+    return None
+
+
+def with_extraction_context(method):
+    """
+    装饰 extract 等入口方法，每次调用使用新的 ExtractionContext，返回后恢复原先的状态
+    方法增加关键字参数 profile，为 True 时在返回的 dict 中加入各阶段耗时 timings
+    """
+
+    @wraps(method)
+    def wrapper(self, *args, profile=False, **kwargs):
+        context = self.new_context()
+        if profile:
+            context.timings = {}
+        token = CURRENT_CONTEXT.set(context)
+        try:
+            with stage(context, "extract"):
+                result = method(self, *args, **kwargs)
+        finally:
+            CURRENT_CONTEXT.reset(token)
+        if profile and isinstance(result, dict):
+            result["timings"] = context.timings
+        return result
+
+    return wrapper
+
+
+def context_attribute(name, doc=None):
+    """提取器上转发到当前 ExtractionContext 同名属性的属性"""
+
+    def getter(self):
+        return getattr(self.context, name)
+
+    def setter(self, value):
+        setattr(self.context, name, value)
+
+    return property(getter, setter, doc=doc)
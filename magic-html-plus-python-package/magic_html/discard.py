@@ -0,0 +1,311 @@
+# -*- coding:utf-8 -*-
+"""
+基于属性匹配的节点筛选引擎
+
+config.py 中的 *_DISCARD_XPATH 规则都是形如
+    .//*[(self::div or self::p ...)][contains(@class, "x") or starts-with(@id, "y") or ...]
+的表达式，每条表达式都要遍历整棵树，并对每个元素计算几十个 contains/translate 谓词。
+
+这里把这些谓词解析出来，按属性合并为正则：每个元素的 class/id/role/style 等属性只读取一次，
+先用该属性上所有规则合并成的一个正则做预筛，命中后再判断具体是哪几条规则，
+一次文档遍历即可得到所有规则各自匹配到的节点，结果与 XPath 完全一致。
+"""
+
+import re
+from functools import lru_cache
+
+from lxml import etree
+
+from magic_html.config import (
+    DISCARD_IMAGE_ELEMENTS,
+    OVERALL_DISCARD_XPATH,
+    PAYWALL_DISCARD_XPATH,
+    TEASER_DISCARD_XPATH,
+)
+from magic_html.xpaths import run_xpath
+
+DISCARD_BACKENDS = ("xpath", "tokens")
+
+TOKEN_REGEX = re.compile(
+    r"""\s*(?:
+        (?P<func>contains|starts-with|translate)\s*\(
+        |(?P<attr>@[\w:-]+)
+        |"(?P<dstr>[^"]*)"
+        |'(?P<sstr>[^']*)'
+        |(?P<op>[(),=\[\]])
+        |(?P<or>or)\b
+    )""",
+    re.X,
+)
+TAG_FILTER_REGEX = re.compile(
+    r"\[\s*\(?\s*(self::[\w-]+(?:\s+or\s+self::[\w-]+)*)\s*\)?\s*\]"
+)
+PREFIX_REGEX = re.compile(r"\s*(\.?//)(\*|[\w-]+)")
+
+
+class UnsupportedExpression(ValueError):
+    pass
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = TOKEN_REGEX.match(text, pos)
+        if m is None or m.end() == pos:
+            raise UnsupportedExpression(text[pos:pos + 30])
+        pos = m.end()
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind in ("dstr", "sstr"):
+            kind = "str"
+        tokens.append((kind, value))
+    return tokens
+
+
+def _translate_table(src, dst):
+    """XPath translate()：src 中重复字符以第一次出现为准，dst 不够长的部分删除"""
+    table = {}
+    for i, ch in enumerate(src):
+        table.setdefault(ch, dst[i] if i < len(dst) else None)
+    return table
+
+
+def _needle_pattern(needle, table):
+    """构造在原始属性值上匹配 translate(@attr, ...) 后包含 needle 的正则"""
+    if not table:
+        return re.escape(needle)
+    parts = []
+    for ch in needle:
+        chars = [src for src, dst in table.items() if dst == ch]
+        if ch not in table:
+            chars.append(ch)
+        if not chars:
+            # 翻译后不可能出现该字符
+            return None
+        if len(chars) == 1:
+            parts.append(re.escape(chars[0]))
+        else:
+            parts.append("[" + "".join(re.escape(c) for c in chars) + "]")
+    return "".join(parts)
+
+
+class AttributeRule:
+    """一条 XPath 表达式解析后的形式：标签过滤 + 若干属性谓词的或"""
+
+    def __init__(self, expr):
+        self.expr = expr
+        m = PREFIX_REGEX.match(expr)
+        if m is None:
+            raise UnsupportedExpression(expr)
+        self.absolute = m.group(1) == "//"
+        rest = expr[m.end():]
+        self.tags = None if m.group(2) == "*" else {m.group(2)}
+        m = TAG_FILTER_REGEX.match(rest)
+        if m is not None:
+            if self.tags is not None:
+                raise UnsupportedExpression(expr)
+            self.tags = {t.strip()[len("self::"):] for t in m.group(1).split(" or ")}
+            rest = rest[m.end():]
+        # 属性 -> 原始属性值上的正则片段
+        self.patterns = {}
+        self.exists = set()
+        self.always = False
+        rest = rest.strip()
+        if rest:
+            if not (rest.startswith("[") and rest.endswith("]")):
+                raise UnsupportedExpression(expr)
+            self._parse_predicates(_tokenize(rest[1:-1]))
+        else:
+            self.always = True
+        self.regexes = {
+            attr: re.compile("|".join(parts)) for attr, parts in self.patterns.items()
+        }
+        self.attrs = set(self.patterns) | self.exists
+
+    def _parse_predicates(self, tokens):
+        pos = 0
+        while True:
+            pos = self._parse_predicate(tokens, pos)
+            if pos == len(tokens):
+                return
+            if tokens[pos][0] != "or":
+                raise UnsupportedExpression(self.expr)
+            pos += 1
+
+    def _expect(self, tokens, pos, kind, value=None):
+        if pos >= len(tokens) or tokens[pos][0] != kind or (
+                value is not None and tokens[pos][1] != value
+        ):
+            raise UnsupportedExpression(self.expr)
+        return tokens[pos][1]
+
+    def _add(self, attr, pattern):
+        if pattern is not None:
+            self.patterns.setdefault(attr, []).append(pattern)
+
+    def _parse_predicate(self, tokens, pos):
+        kind, value = tokens[pos] if pos < len(tokens) else (None, None)
+        if kind == "attr":
+            attr = value[1:]
+            if pos + 1 < len(tokens) and tokens[pos + 1] == ("op", "="):
+                literal = self._expect(tokens, pos + 2, "str")
+                self._add(attr, r"\A" + re.escape(literal) + r"\Z")
+                return pos + 3
+            self.exists.add(attr)
+            return pos + 1
+        if kind != "func" or value == "translate":
+            raise UnsupportedExpression(self.expr)
+        func = value
+        pos += 1
+        table = None
+        if pos < len(tokens) and tokens[pos] == ("func", "translate"):
+            attr = self._expect(tokens, pos + 1, "attr")[1:]
+            self._expect(tokens, pos + 2, "op", ",")
+            src = self._expect(tokens, pos + 3, "str")
+            self._expect(tokens, pos + 4, "op", ",")
+            dst = self._expect(tokens, pos + 5, "str")
+            self._expect(tokens, pos + 6, "op", ")")
+            table = _translate_table(src, dst)
+            pos += 7
+        else:
+            attr = self._expect(tokens, pos, "attr")[1:]
+            pos += 1
+        self._expect(tokens, pos, "op", ",")
+        needle = self._expect(tokens, pos + 1, "str")
+        self._expect(tokens, pos + 2, "op", ")")
+        if not needle:
+            # contains(x, "") 恒为真
+            self.always = True
+        else:
+            pattern = _needle_pattern(needle, table)
+            if func == "starts-with" and pattern is not None:
+                pattern = r"\A" + pattern
+            self._add(attr, pattern)
+        return pos + 3
+
+    def matches(self, element):
+        if self.tags is not None and element.tag not in self.tags:
+            return False
+        if self.always:
+            return True
+        get = element.get
+        for attr in self.exists:
+            if get(attr) is not None:
+                return True
+        for attr, regex in self.regexes.items():
+            value = get(attr)
+            if value is not None and regex.search(value):
+                return True
+        return False
+
+
+@lru_cache(maxsize=None)
+def attribute_rule(expr):
+    """expr 解析后的 AttributeRule，用于在遍历中逐个节点判断；无法解析时返回 None"""
+    try:
+        return AttributeRule(expr)
+    except UnsupportedExpression:
+        return None
+
+
+class DiscardEngine:
+    """
+    把多组规则一次性编译，在一次文档遍历中求出每条表达式匹配的节点
+    无法解析的表达式退回到 XPath 执行
+    """
+
+    def __init__(self, rule_lists):
+        self.rules = {}
+        self.fallback = []
+        for rule_list in rule_lists:
+            for expr in rule_list:
+                if expr in self.rules or expr in self.fallback:
+                    continue
+                try:
+                    rule = AttributeRule(expr)
+                except UnsupportedExpression:
+                    self.fallback.append(expr)
+                    continue
+                if rule.absolute or rule.always:
+                    self.fallback.append(expr)
+                else:
+                    self.rules[expr] = rule
+        # 每个属性上所有规则合并成的预筛正则
+        parts = {}
+        for rule in self.rules.values():
+            for attr, patterns in rule.patterns.items():
+                parts.setdefault(attr, []).extend(patterns)
+        self.prefilters = {
+            attr: re.compile("|".join(patterns)) for attr, patterns in parts.items()
+        }
+        self.rules_by_attr = {}
+        for rule in self.rules.values():
+            for attr in rule.attrs:
+                self.rules_by_attr.setdefault(attr, []).append(rule)
+
+    def walks(self, exprs):
+        """match(tree, exprs) 遍历文档的次数：一次属性匹配遍历，加上退回 XPath 执行的表达式数"""
+        fallback = sum(expr not in self.rules for expr in exprs)
+        return fallback + (len(exprs) > fallback)
+
+    def match(self, tree, exprs):
+        """返回 {expr: [匹配节点]}，节点按文档顺序排列，与 tree.xpath(expr) 相同"""
+        result = {}
+        wanted = {}
+        for expr in exprs:
+            if expr in self.rules:
+                wanted[expr] = self.rules[expr]
+                result[expr] = []
+            else:
+                result[expr] = run_xpath(tree, expr)
+        if not wanted:
+            return result
+
+        prefilters = [
+            (attr, regex, self.rules_by_attr[attr])
+            for attr, regex in self.prefilters.items()
+        ]
+        exists = [
+            (attr, self.rules_by_attr[attr])
+            for attr in self.rules_by_attr
+            if attr not in self.prefilters
+        ]
+        for element in tree.iterdescendants(etree.Element):
+            attrib = element.attrib
+            if not attrib:
+                continue
+            hit = None
+            for attr, regex, rules in prefilters:
+                value = attrib.get(attr)
+                if value is not None and regex.search(value):
+                    if hit is None:
+                        hit = []
+                    hit.extend(rules)
+            for attr, rules in exists:
+                if attr in attrib:
+                    if hit is None:
+                        hit = []
+                    hit.extend(rules)
+            if hit is None:
+                continue
+            seen = set()
+            for rule in hit:
+                expr = rule.expr
+                if expr in seen or expr not in wanted:
+                    continue
+                seen.add(expr)
+                if rule.matches(element):
+                    result[expr].append(element)
+        return result
+
+
+DISCARD_ENGINE = DiscardEngine(
+    (
+        OVERALL_DISCARD_XPATH,
+        PAYWALL_DISCARD_XPATH,
+        TEASER_DISCARD_XPATH,
+        DISCARD_IMAGE_ELEMENTS,
+    )
+)
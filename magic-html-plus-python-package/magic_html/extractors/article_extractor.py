@@ -1,6 +1,8 @@
 # -*- coding:utf-8 -*-
 
 from magic_html.utils import *
+from magic_html.xpaths import run_xpath
+from magic_html.context import with_extraction_context
 from magic_html.extractors.base_extractor import BaseExtractor
 from magic_html.extractors.title_extractor import TitleExtractor
 
@@ -9,33 +11,36 @@ class ArticleExtractor(BaseExtractor):
     def __init__(self) -> None:
         super().__init__()
 
-    def extract(self, html="", base_url="") -> dict:
-        html = html.replace("&nbsp;", " ").replace("&#160;", " ")
-        tree = load_html(html)
+    @with_extraction_context
+    def extract(self, html="", base_url="", encoding=None, content_type=None) -> dict:
+        with self.stage("load_html"):
+            html = replace_nbsp(html)
+            tree = load_html(html, encoding, content_type, base_url)
         if tree is None:
             raise ValueError
 
-        title = TitleExtractor().process(tree)
+        with self.stage("title"):
+            title = TitleExtractor().process(tree)
 
         # base_url
-        base_href = tree.xpath("//base/@href")
+        base_href = run_xpath(tree, "//base/@href")
 
         if base_href and "http" in base_href[0]:
             base_url = base_href[0]
 
         if "://blog.csdn.net/" in base_url:
-            for dtree in tree.xpath('//div[@id="content_views"]//ul[@class="pre-numbering"]'):
+            for dtree in run_xpath(tree, '//div[@id="content_views"]//ul[@class="pre-numbering"]'):
                 self.remove_node(dtree)
 
-        # 标签转换, 增加数学标签处理
-        format_tree = self.convert_tags(tree, base_url=base_url)
+        # 标签转换（含数学标签处理），删除script style等标签及其内容，在一次遍历中完成
+        with self.stage("normalize"):
+            normal_tree = self.normalize_tree(tree, base_url=base_url)
 
-        # 删除script style等标签及其内容
-        normal_tree = self.clean_tags(format_tree)
-
-        subtree, xp_num, drop_list = self.xp_1_5(normal_tree)
+        with self.stage("xp_1_5"):
+            subtree, xp_num, drop_list = self.xp_1_5(normal_tree)
         if xp_num == "others":
-            subtree, drop_list = self.prune_unwanted_sections(normal_tree)
+            with self.stage("prune_unwanted_sections"):
+                subtree, drop_list = self.prune_unwanted_sections(normal_tree)
         body_html = self.get_content_html(subtree, xp_num, base_url)
 
         return {
@@ -44,4 +49,8 @@ class ArticleExtractor(BaseExtractor):
             "html": body_html,
             "title": title,
             "base_url": base_url,
+            "math_skipped": self.math_skipped,
+            "traversals": self.traversals,
+            "readability_retries": self.readability_retries,
+            "readability_reuses": self.readability_reuses,
         }
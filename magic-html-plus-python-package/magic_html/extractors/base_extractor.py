@@ -2,18 +2,68 @@
 
 import html
 from collections import defaultdict
-from copy import deepcopy
 from urllib.parse import unquote, urljoin
 from lxml.etree import Comment, strip_elements
 from magic_html.config import *
+from magic_html.context import ExtractionContext, context_attribute, current_context, with_extraction_context
+from magic_html.discard import DISCARD_BACKENDS, DISCARD_ENGINE, attribute_rule
+from magic_html.journal import RemovalJournal, detach_node
+from magic_html.math_handlers import MATH_HANDLERS, convert_latex_environments
+from magic_html.metrics import text_len_of
+from magic_html.pipeline import NodePipeline, NodeStep
+from magic_html.profiling import stage
 from magic_html.readability_plus import Document as DocumentPlus
 from magic_html.utils import *
+from magic_html.xpaths import run_xpath
 
 
 class BaseExtractor:
+    # prune_unwanted_sections 的节点筛选方式：xpath 逐条执行规则，tokens 一次遍历匹配全部规则
+    discard_backend = "xpath"
+    # 为 True 时 convert_tags 先用一次 XSLT 调用转换页面中所有需要转换的 <math>
+    mathml_batch = False
+
+    # 新建提取器时 need_comment 的初始值
+    default_need_comment = False
+
+    # 以下为一次提取的状态，保存在 ExtractionContext 中，见 magic_html.context
+    drop_ids = context_attribute("drop_ids")
+    need_comment = context_attribute("need_comment")
+    metrics = context_attribute("metrics")
+    math_skipped = context_attribute("math_skipped")
+    traversals = context_attribute("traversals")
+    readability_retries = context_attribute("readability_retries")
+    readability_reuses = context_attribute("readability_reuses")
+
     def __init__(self):
-        self.drop_ids = []
-        self.need_comment = False
+        # 不在 extract 调用中、直接调用各个方法时使用的状态
+        self._default_context = ExtractionContext(self, need_comment=self.default_need_comment)
+
+    def __getstate__(self):
+        """
+        批量提取时提取器被复制到工作进程，只复制配置；默认状态中的文本统计缓存等引用 lxml 节点，
+        无法序列化，在新进程中重新创建，只保留 need_comment
+        """
+        state = self.__dict__.copy()
+        state["_need_comment"] = state.pop("_default_context").need_comment
+        return state
+
+    def __setstate__(self, state):
+        need_comment = state.pop("_need_comment")
+        self.__dict__.update(state)
+        self._default_context = ExtractionContext(self, need_comment=need_comment)
+
+    @property
+    def context(self):
+        return current_context(self) or self._default_context
+
+    def stage(self, name):
+        """with self.stage(name): 统计其中代码的耗时，见 magic_html.profiling"""
+        return stage(self.context, name)
+
+    def new_context(self):
+        """extract 每次调用使用的新状态，need_comment 沿用实例上设置的值"""
+        return ExtractionContext(self, need_comment=self._default_context.need_comment)
 
     def xp_1_5(self, tree: HtmlElement):
         drop_list = False
@@ -21,8 +71,9 @@ class BaseExtractor:
         result_body = Element("body")
 
         for idx, expr in enumerate(BODY_XPATH):
+            self.traversals += 1
             try:
-                subtree = tree.xpath(expr)[0]
+                subtree = run_xpath(tree, expr)[0]
                 xp_num = str(idx + 1)
             except IndexError:
                 continue
@@ -33,11 +84,8 @@ class BaseExtractor:
                 xp_num = "others"
                 continue
 
-            ptest = subtree.xpath(".//text()[not(ancestor::a)]")
-            ptest_len = text_len("".join(ptest))
-            all_text_len = text_len(
-                "".join(tree.xpath("//p//text()[not(ancestor::a)]"))
-            )
+            ptest_len = self.metrics.nonlink_text_len(subtree)
+            all_text_len = text_len_of(self.metrics.paragraph_text(tree))
             if drop_list:
                 if ptest_len <= 50:
                     if all_text_len > 100:
@@ -49,31 +97,45 @@ class BaseExtractor:
                         xp_num = "others"
                     continue
             result_body.append(subtree)
+            self.metrics.clear()
             return result_body, xp_num, drop_list
 
         return result_body, xp_num, drop_list
 
     def get_content_html(self, cleaned_tree_backup, xp_num="others", base_url=""):
         # readability_plus
-        doc = DocumentPlus(
-            cleaned_tree_backup,
-            url=base_url,
-            xp_num=xp_num,
-            need_comment=self.need_comment,
-        )
-        body = doc.summary(html_partial=True)
+        with self.stage("readability"):
+            doc = DocumentPlus(
+                cleaned_tree_backup,
+                url=base_url,
+                xp_num=xp_num,
+                need_comment=self.need_comment,
+            )
+            body = doc.summary(html_partial=True)
+            self.readability_retries += doc.retries
+            self.readability_reuses += doc.reuses
 
         return body
 
-    def prune_unwanted_nodes(self, tree, nodelist, with_backup=False):
+    def prune_unwanted_nodes(self, tree, nodelist, with_backup=False, matches=None):
+        """
+        matches: DiscardEngine.match 预先求出的 {expr: 节点列表}，
+        其中已随祖先删除的节点在使用前过滤掉，与此时执行 XPath 的结果一致
+        with_backup 为 True 时，删除后剩余的文本不超过原来的 1/7 则撤销全部删除，原地恢复 tree
+        """
+        journal = None
         if with_backup is True:
-            old_len = len(tree.text_content())
-            backup = deepcopy(tree)
+            journal = RemovalJournal(tree)
         for expr in nodelist:
-            for subtree in tree.xpath(expr):
+            if matches is None:
+                self.traversals += 1
+                nodes = run_xpath(tree, expr)
+            else:
+                nodes = [node for node in matches[expr] if is_attached(node, tree)]
+            for subtree in nodes:
 
                 # DISCARD_IMAGE_ELEMENTS 需要特殊判断
-                if '"caption"' in expr and subtree.xpath(".//img"):
+                if '"caption"' in expr and run_xpath(subtree, ".//img"):
                     continue
                 # 有些出现hidden
                 if "hidden" in expr:
@@ -97,80 +159,173 @@ class BaseExtractor:
 
                 if ancestor_node_check(subtree, ['code', 'pre']):
                     continue
-                self.remove_node(subtree)
-        if with_backup is False:
-            return tree
-        # else:
-        new_len = len(tree.text_content())
-        if new_len > old_len / 7:
+                self.remove_node(subtree, journal)
+        if with_backup is False or not journal.removed_too_much(7):
             return tree
-        return backup
+        journal.undo()
+        self.metrics.clear()
+        return tree
 
     def prune_html(self, tree):
         """Delete selected empty elements"""
-        for element in tree.xpath(".//*[not(node())]"):
+        for element in run_xpath(tree, ".//*[not(node())]"):
             if element.tag in CUT_EMPTY_ELEMS:
                 self.remove_node(element)
         return tree
 
-    def remove_node(self, node: HtmlElement):
+    def remove_node(self, node: HtmlElement, journal=None):
         parent = node.getparent()
-        if text_strip(node.tail):
-            previous = node.getprevious()
-            if previous is None:
-                if parent is not None:
-                    if text_strip(parent.text):
-                        parent.text = "".join([parent.text, node.tail])
-                    else:
-                        parent.text = node.tail
-            else:
-                if text_strip(previous.tail):
-                    previous.tail = "".join([previous.tail, node.tail])
-                else:
-                    previous.tail = node.tail
-
+        if journal is not None:
+            journal.record(node)
         if parent is not None:
-            idx = node.attrib.get(Unique_ID, "")
-            parent.remove(node)
-            if idx:
-                self.drop_ids.append(int(idx))
+            self.metrics.invalidate(parent)
+        idx = node.attrib.get(Unique_ID, "") if parent is not None else ""
+        detach_node(node)
+        if idx:
+            self.drop_ids.append(int(idx))
 
     def clean_tags(self, tree):
-        strip_elements(tree, Comment)
+        return self.normalize_tree(tree, convert=False)
+
+    def normalize_tree(self, tree, base_url="", convert=True, clean=True):
+        """
+        convert_tags 和 clean_tags 中逐节点的改写和删除在一次遍历中完成，
+        结果与先后调用 convert_tags、clean_tags 相同，步骤见 pipeline_steps
+        clean 为 True 时再删除 MANUALLY_CLEANED、去掉 MANUALLY_STRIPPED 的标签，直接修改并返回 tree
+        """
+        options = {"base_url": base_url}
+        if convert:
+            useless_attrs = USELESS_ATTR
+            if not self.need_comment:
+                useless_attrs = useless_attrs + ["comment"]
+            has_math = self.contains_math(tree)
+            self.math_skipped = not has_math
+            if has_math and self.mathml_batch:
+                self.convert_mathml_batch(tree)
+            options.update(has_math=has_math, useless_attrs=set(useless_attrs))
+        if clean:
+            # 解析时已去掉注释，这里处理调用方自行构造的树
+            strip_elements(tree, Comment)
+            self.traversals += 1
+            noise_rules, noise_fallback = self.noise_rules()
+            options.update(noise_rules=noise_rules, noise_fallback=noise_fallback)
+
+        NodePipeline(self.pipeline_steps(convert, clean)).run(self, tree, **options)
+        self.traversals += 1
+        if not clean:
+            return tree
+
+        # 与 HTML_CLEANER.clean_html 结果相同，直接修改 tree，不复制整棵树
+        cleaned_tree = clean_in_place(tree, frozenset(MANUALLY_CLEANED), frozenset(MANUALLY_STRIPPED))
+        self.traversals += 1
+        self.metrics.clear()
 
-        xp_lists = []
+        return cleaned_tree
+
+    def pipeline_steps(self, convert=True, clean=True):
+        """
+        normalize_tree 的步骤，顺序与原先 convert_tags、clean_tags 中各次遍历的顺序一致：
+        标签转换 -> 噪声节点 -> figure 改为 div -> MANUALLY_CLEANED 和 form -> 空节点
+        """
+        steps = []
+        if convert:
+            steps.append(NodeStep("convert_node"))
+        if clean:
+            noise_rules, _ = self.noise_rules()
+            noise_tags = None if None in noise_rules else list(noise_rules)
+            steps += [
+                NodeStep("prune_noise_node", tags=noise_tags, attached_only=True),
+                NodeStep("prune_noise_fallback", tags=(), deferred=True),
+                NodeStep("retag_figures", tags=["figure"], deferred=True),
+                NodeStep("remove_cleaned_nodes", tags=MANUALLY_CLEANED + ["form"], deferred=True),
+                # retag_figures 改为 div 的 figure 也可能变空
+                NodeStep("prune_empty_nodes", tags=CUT_EMPTY_ELEMS | {"figure"}, deferred=True),
+            ]
+        return steps
+
+    def noise_rules(self):
+        """
+        REMOVE_COMMENTS_XPATH 和 CONTENT_EXTRACTOR_NOISE_XPATHS 解析后的规则：
+        (标签 -> 适用于该标签的规则，不限标签的规则放在 None 下), 无法解析的表达式
+        """
+        rules, fallback = defaultdict(list), []
+        expressions = CONTENT_EXTRACTOR_NOISE_XPATHS
         if not self.need_comment:
-            xp_lists.append(REMOVE_COMMENTS_XPATH)
-        xp_lists.append(CONTENT_EXTRACTOR_NOISE_XPATHS)
-        for xp_list in xp_lists:
-            tree = self.prune_unwanted_nodes(tree, xp_list)
+            expressions = REMOVE_COMMENTS_XPATH + expressions
+        for expr in expressions:
+            rule = attribute_rule(expr)
+            if rule is None:
+                fallback.append(expr)
+                continue
+            for tag in rule.tags or [None]:
+                rules[tag].append(rule)
+        any_tag = rules.get(None, [])
+        for tag, tag_rules in rules.items():
+            if tag is not None:
+                tag_rules.extend(any_tag)
+        return dict(rules), fallback
+
+    def prune_noise_node(self, node, context):
+        """REMOVE_COMMENTS_XPATH 和 CONTENT_EXTRACTOR_NOISE_XPATHS 匹配的节点，code、pre 中的除外"""
+        rules = context.noise_rules
+        for rule in rules.get(node.tag) or rules.get(None, ()):
+            # .// 开头的规则不包括根节点
+            if node is context.tree and not rule.absolute:
+                continue
+            if rule.matches(node):
+                if not ancestor_node_check(node, ["code", "pre"]):
+                    self.remove_node(node)
+                return
 
-        cleaning_list, stripping_list = (
-            MANUALLY_CLEANED.copy(),
-            MANUALLY_STRIPPED.copy(),
-        )
+    def prune_noise_fallback(self, nodes, context):
+        """无法逐节点判断的噪声规则，在遍历结束后执行 XPath"""
+        for expr in context.noise_fallback:
+            self.prune_unwanted_nodes(context.tree, [expr])
 
-        for elem in tree.xpath(".//figure[descendant::table]"):
-            elem.tag = "div"
+    def retag_figures(self, nodes, context):
+        """包含 table 的 figure 改为 div"""
+        for node in nodes:
+            if node is context.tree or not is_attached(node, context.tree):
+                continue
+            if next(node.iterdescendants("table"), None) is not None:
+                node.tag = "div"
 
-        for expression in cleaning_list + ["form"]:
-            for element in tree.getiterator(expression):
+    def remove_cleaned_nodes(self, nodes, context):
+        """
+        删除 MANUALLY_CLEANED 中的标签，form 在其余标签删除之后按文本长度判断
+        与原先按标签依次 getiterator 的结果一致：删除的节点中还有同名标签时，lxml 的迭代器
+        会走进已删除的子树并在其中结束，该标签剩下的节点留给 clean_in_place 删除
+        """
+        self.metrics.clear()
+        by_tag = defaultdict(list)
+        for node in nodes:
+            by_tag[node.tag].append(node)
+        for expression in MANUALLY_CLEANED + ["form"]:
+            for node in by_tag.get(expression, ()):
+                if not is_attached(node, context.tree):
+                    continue
                 # 针对form 标签特殊处理
-                if element.tag == "form":
-                    ptest = element.xpath(".//text()[not(ancestor::a)]")
-                    if text_len("".join(ptest)) <= 60:  # 50
-                        self.remove_node(element)
-                else:
-                    self.remove_node(element)
-
-        HTML_CLEANER.kill_tags, HTML_CLEANER.remove_tags = cleaning_list, stripping_list
-        cleaned_tree = HTML_CLEANER.clean_html(self.prune_html(tree))
+                if expression == "form" and self.metrics.nonlink_text_len(node) > 60:  # 50
+                    continue
+                self.remove_node(node)
+                if next(node.iterdescendants(expression), None) is not None:
+                    break
 
-        return cleaned_tree
+    def prune_empty_nodes(self, nodes, context):
+        """与 prune_html 相同：删除没有任何子节点的 CUT_EMPTY_ELEMS，不连带删除因此变空的父节点"""
+        tree = context.tree
+        empty = [
+            node for node in nodes
+            if node.tag in CUT_EMPTY_ELEMS and node is not tree
+            and len(node) == 0 and not node.text and is_attached(node, tree)
+        ]
+        for node in empty:
+            self.remove_node(node)
 
     def generate_unique_id(self, element):
+        self.traversals += 1
         idx = 0
-        for node in iter_node(element):
+        for node in iter_tree(element):
             l_tag = node.tag.lower()
             if l_tag not in ["html", "body"]:
                 node.attrib[Unique_ID] = str(idx)
@@ -184,15 +339,13 @@ class BaseExtractor:
         for x in ids:
             if int(x) > int(skip_ids[-1]):
                 skip_ids.append(int(x))
-                drop_node = raw_element.xpath(
-                    f"//*[@{Unique_ID}='{x}']"
-                )
+                drop_node = run_xpath(raw_element, f"//*[@{Unique_ID}=$id]", id=x)
                 if drop_node:
                     new_div = Element("div")
                     for j in self.drop_ids:
                         if int(j) > int(skip_ids[-1]):
-                            append_element = drop_node[0].xpath(
-                                f".//*[@{Unique_ID}='{j}']"
+                            append_element = run_xpath(
+                                drop_node[0], f".//*[@{Unique_ID}=$id]", id=str(j)
                             )
                             if append_element:
                                 skip_ids.append(j)
@@ -200,8 +353,8 @@ class BaseExtractor:
                                     skip_ids.extend(
                                         [
                                             int(pjid)
-                                            for pjid in append_element[0].xpath(
-                                            f".//*/@{Unique_ID}"
+                                            for pjid in run_xpath(
+                                            append_element[0], f".//*/@{Unique_ID}"
                                         )
                                         ]
                                     )
@@ -227,331 +380,13 @@ class BaseExtractor:
 
     def math_latex_processing(self, node):
         # 1. 文本中有\\begin{align} 或 \\begin{equation}
-        if node.tag not in ["script", "style"] and text_strip(node.text):
-            regex = r"\\begin{align}(.*?)\\end{align}"
-            text = node.text
-            matches = re.findall(regex, text, re.DOTALL)
-            if matches:
-                node.text = text.replace("\\begin{align}", "").replace(
-                    "\\end{align}", ""
-                )
-
-        if node.tag not in ["script", "style"] and text_strip(node.text):
-            regex = r"\\begin{equation}(.*?)\\end{equation}"
-            text = node.text
-            matches = re.findall(regex, text, re.DOTALL)
-            for match in matches:
-                match = match.replace("\\begin{equation}", "")
-                match = match.replace("\\end{equation}", "")
-                wrapped_text = wrap_math(match, display=True)
-                text = text.replace(match, wrapped_text)
-            if matches:
-                # Remove the \begin{equation} and \end{equation} tags
-                text = text.replace("\\begin{equation}", "").replace(
-                    "\\end{equation}", ""
-                )
-                node.text = text
-
-        if node.tag not in ["script", "style"] and text_strip(node.tail):
-            regex = r"\\begin{align}(.*?)\\end{align}"
-            text = node.tail
-            matches = re.findall(regex, text, re.DOTALL)
-            if matches:
-                node.tail = text.replace("\\begin{align}", "").replace(
-                    "\\end{align}", ""
-                )
-
-        if node.tag not in ["script", "style"] and text_strip(node.tail):
-            regex = r"\\begin{equation}(.*?)\\end{equation}"
-            text = node.tail
-            matches = re.findall(regex, text, re.DOTALL)
-            for match in matches:
-                match = match.replace("\\begin{equation}", "")
-                match = match.replace("\\end{equation}", "")
-                wrapped_text = wrap_math(match, display=True)
-                text = text.replace(match, wrapped_text)
-            if matches:
-                # Remove the \begin{equation} and \end{equation} tags
-                text = text.replace("\\begin{equation}", "").replace(
-                    "\\end{equation}", ""
-                )
-                node.tail = text
-
-        node_class = node.get("class")
-
-        parent = node.getparent()
-
-        # 2. class 为 texerror 的标签
-        # Find the text between {} (maximum length) and replace the texerror with that text
-
-        # 3. img中的latex
-        if node.tag == "img":
-            if node_class:
-                class_list = node_class.split(" ")
-                if any(
-                        [img_class in class_list for img_class in latex_image_class_names]
-                ):
-                    alt = node.get("alt")
-                    if text_strip(alt):
-                        new_span = Element("span")
-                        wrapped_alt = wrap_math(alt)
-                        new_span.text = wrapped_alt
-                        node.addprevious(new_span)
-            src = node.get("src")
-            if src:
-                if "codecogs.com" in src:
-                    try:
-                        latex = src.split("?")[1:]
-                        latex = "?".join(
-                            latex
-                        )  # In case there are multiple ? in the latex
-                        latex = unquote(latex)
-                        new_span = Element("span")
-                        wrapped_latex = wrap_math(latex)
-                        new_span.text = wrapped_latex
-                        node.addprevious(new_span)
-                    except:
-                        pass
-                if "latex.php" in src:
-                    try:
-                        # they usually have "alt='-i u_t + &#92;Delta u = |u|^2 u'"
-                        alt = node.get("alt")
-                        if text_strip(alt):
-                            # Unescape the latex
-                            alt = unquote(alt)
-                            # Get the latex
-                            wrapped_alt = wrap_math(alt)
-                            new_span = Element("span")
-                            new_span.text = wrapped_alt
-                            node.addprevious(new_span)
-                    except:
-                        pass
-                if "/images/math/codecogs" in src:
-                    try:
-                        # they usually have "alt='-i u_t + &#92;Delta u = |u|^2 u'"
-                        alt = node.get("alt")
-                        if text_strip(alt):
-                            # Unescape the latex
-                            alt = unquote(alt)
-                            # Get the latex
-                            wrapped_alt = wrap_math(alt)
-                            new_span = Element("span")
-                            new_span.text = wrapped_alt
-                            node.addprevious(new_span)
-                    except:
-                        pass
-                if "mimetex.cgi" in src:
-                    try:
-                        latex = src.split("?")[1:]
-                        latex = "?".join(
-                            latex
-                        )  # In case there are multiple ? in the latex
-                        latex = unquote(latex)
-                        new_span = Element("span")
-                        wrapped_latex = wrap_math(latex)
-                        new_span.text = wrapped_latex
-                        node.addprevious(new_span)
-                    except:
-                        pass
-                if "mathtex.cgi" in src:
-                    try:
-                        latex = src.split("?")[1:]
-                        latex = "?".join(
-                            latex
-                        )  # In case there are multiple ? in the latex
-                        latex = unquote(latex)
-                        new_span = Element("span")
-                        wrapped_latex = wrap_math(latex)
-                        new_span.text = wrapped_latex
-                        node.addprevious(new_span)
-                    except:
-                        pass
-            if node_class:
-                if "x-ck12" in node_class:
-                    try:
-                        latex = node.get("alt")
-                        if text_strip(latex):
-                            latex = unquote(latex)
-                            new_span = Element("span")
-                            wrapped_latex = wrap_math(latex)
-                            new_span.text = wrapped_latex
-                            node.addprevious(new_span)
-                    except:
-                        pass
-
-        # 4. class 为 math-container
-        if node_class == "math-container":
-            try:
-                text = node.text
-                if text_strip(text):
-                    new_span = Element("span")
-                    wrapped_math = wrap_math(text, display=True)
-                    new_span.text = wrapped_math
-                    if parent is not None:
-                        if text_strip(node.tail):
-                            new_span.tail = node.tail
-                        parent.replace(node, new_span)
-            except:
-                pass
-
-        # 5. class 为 wp-katex-eq
-        if node_class == "wp-katex-eq":
-            try:
-                text = node.text
-                if text_strip(text):
-                    new_span = Element("span")
-                    display_attr = node.get("data-display")
-                    if display_attr is not None:
-                        display = display_attr == "true"
-                    else:
-                        display = False
-                    wrapped_math = wrap_math(text, display=display)
-                    new_span.text = wrapped_math
-                    if parent is not None:
-                        if text_strip(node.tail):
-                            new_span.tail = node.tail
-                        parent.replace(node, new_span)
-            except:
-                pass
-
-        # 6. script[type="math/tex"]
-        if node.tag == "script" and node.get("type") == "math/tex":
-            try:
-                text = node.text
-                if text_strip(text):
-                    new_span = Element("span")
-                    wrapped_text = wrap_math(text)
-                    new_span.text = wrapped_text
-                    if parent is not None:
-                        if text_strip(node.tail):
-                            new_span.tail = node.tail
-                        parent.replace(node, new_span)
-            except:
-                pass
-
-        # 7. script[type="math/asciimath"]
-        if node.tag == "script" and node.get("type") == "math/asciimath":
-            try:
-                text = node.text
-                if text_strip(text):
-                    new_span = Element("span")
-                    wrapped_asciimath = wrap_math(extract_asciimath(text))
-                    new_span.text = wrapped_asciimath
-                    if parent is not None:
-                        if text_strip(node.tail):
-                            new_span.tail = node.tail
-                        parent.replace(node, new_span)
-            except:
-                # Delete this script tag
-                self.remove_node(node)
-
-        # 8. class tex
-        if node_class == "tex":
-            try:
-                # Check if they have data-expr attr
-                expr = node.get("data-expr")
-                if text_strip(expr):
-                    # Replace with a span
-                    new_span = Element("span")
-                    wrapped_expr = wrap_math(expr)
-                    new_span.text = wrapped_expr
-                    if parent is not None:
-                        if text_strip(node.tail):
-                            new_span.tail = node.tail
-                        parent.replace(node, new_span)
-            except:
-                pass
-
-        # 9. span.katex
-        if node.tag == "span" and node_class == "katex":
-            # Find any spans with class "katex-html" and remove them
-            katex_html_spans = node.xpath('.//span[@class="katex-html"]')
-            for katex_html_span in katex_html_spans:
-                self.remove_node(katex_html_span)
-
-        # 10. Remove any .MathJax_Preview spans
-        if node.tag == "span" and node_class == "MathJax_Preview":
-            self.remove_node(node)
-
-        if node.tag == "span" and node_class and "x-ck12-mathEditor" in node_class:
-            try:
-                expr = node.get("data-tex")
-                if text_strip(expr):
-                    expr = unquote(expr).replace(r"\&quot;", "").replace("&quot;", "")
-                    # Replace with a span
-                    new_span = Element("span")
-                    wrapped_expr = wrap_math(expr)
-                    new_span.text = wrapped_expr
-                    if parent is not None:
-                        if text_strip(node.tail):
-                            new_span.tail = node.tail
-                        parent.replace(node, new_span)
-            except:
-                pass
-
-        # 11. all math tags
-        if node.tag == "math":
-            annotation_tags = node.xpath('.//annotation[@encoding="application/x-tex"]')
-            if len(annotation_tags) > 0:
-                annotation_tag = annotation_tags[0]
-                text = annotation_tag.text
-                if text_strip(text):
-                    new_span = Element("span")
-                    wrapped_text = wrap_math(text)
-                    new_span.text = wrapped_text
-                    if parent is not None:
-                        if text_strip(node.tail):
-                            new_span.tail = node.tail
-                        parent.replace(node, new_span)
-                    style_value = parent.get("style")
-                    if style_value:
-                        normalized_style_value = (
-                            style_value.lower()
-                            .strip()
-                            .replace(" ", "")
-                            .replace(";", "")
-                        )
-                        if "display:none" in normalized_style_value:
-                            parent.style = ""
-            elif text_strip(node.get("alttext")):
-                # Get the alttext attribute
-                alttext = node.get("alttext")
-                if text_strip(alttext):
-                    new_span = Element("span")
-                    wrapped_alttext = wrap_math(alttext)
-                    new_span.text = wrapped_alttext
-                    if parent is not None:
-                        if text_strip(node.tail):
-                            new_span.tail = node.tail
-                        parent.replace(node, new_span)
-            else:
-                try:
-                    # Try translating to LaTeX
-                    tmp_node = deepcopy(node)
-                    tmp_node.tail = None
-                    mathml = tostring(tmp_node, encoding=str)
-                    # If this includes xmlns:mml, then we need to replace all
-                    # instances of mml: with nothing
-                    if "xmlns:mml" in mathml:
-                        mathml = mathml.replace("mml:", "")
-                        # replace xmlns:mml="..." with nothing
-                        mathml = re.sub(r'xmlns:mml=".*?"', "", mathml)
-                    # if 'xmlns=' in mathml:
-                    #     mathml = re.sub(r"xmlns='.*?'", '', mathml)
-                    latex = mml_to_latex(mathml)
-                    # Make a new span tag
-                    new_span = Element("span")
-                    # Set the html of the new span tag to the text
-                    wrapped_latex = wrap_math(latex)
-                    new_span.text = wrapped_latex
-                    # Then, we need to replace the math tag with the new span tag
-                    if parent is not None:
-                        if text_strip(node.tail):
-                            new_span.tail = node.tail
-                        parent.replace(node, new_span)
-                except:
-
-                    self.remove_node(node)
+        convert_latex_environments(node)
+        # 2 ~ 11. 按标签名和类名查表得到适用的处理器，见 magic_html.math_handlers
+        handlers = MATH_HANDLERS.lookup(node.tag, node.get("class"))
+        if handlers:
+            parent = node.getparent()
+            for handler in handlers:
+                handler(self, node, parent)
 
     def _process_image_node(self, node, base_url=""):
         """
@@ -697,52 +532,123 @@ class BaseExtractor:
             except:
                 pass
 
+    def contains_math(self, element):
+        """
+        element 中是否有 math_latex_processing 会转换的节点，没有时可以跳过整个公式分支
+        class 为 MATH_EXACT_CLASSES 的节点不在这里检查，见 convert_node
+        """
+        self.traversals += 1
+        for node in element.iter(MATH_PRESCAN_TAGS):
+            tag = node.tag
+            if tag == "math":
+                return True
+            if tag == "script":
+                if node.get("type") in ("math/tex", "math/asciimath"):
+                    return True
+                continue
+            node_class = node.get("class") or ""
+            if tag == "span":
+                if node_class in ("katex", "MathJax_Preview") or "x-ck12-mathEditor" in node_class:
+                    return True
+            else:
+                # latex_image_class_names 中的类名都包含 tex
+                if "tex" in node_class or "x-ck12" in node_class:
+                    return True
+                src = node.get("src")
+                if src and any(marker in src for marker in MATH_IMAGE_SRC_MARKERS):
+                    return True
+        # register_math_handler 注册的处理器
+        if MATH_HANDLERS.custom_tags:
+            self.traversals += 1
+            for _ in element.iter(MATH_HANDLERS.custom_tags):
+                return True
+        for class_name in MATH_HANDLERS.custom_classes:
+            self.traversals += 1
+            if run_xpath(element, CLASS_TOKEN_XPATH, class_name=f" {class_name} "):
+                return True
+        self.traversals += 1
+        return "\\begin{" in element.text_content() or "\\begin{" in (element.tail or "")
+
+    def convert_mathml_batch(self, element):
+        """把 element 中没有 TeX 标注和 alttext 的 <math> 一次性转换，结果写入 mml_to_latex 的缓存"""
+        mml_codes = []
+        self.traversals += 1
+        for node in element.iter("math"):
+            if run_xpath(node, './/annotation[@encoding="application/x-tex"]'):
+                continue
+            if text_strip(node.get("alttext")):
+                continue
+            mml_codes.append(mathml_source(node))
+        if mml_codes:
+            mml_to_latex_many(mml_codes)
+
     def convert_tags(self, element, base_url=""):
-        USELESS_ATTR_LIST = USELESS_ATTR
-        if not self.need_comment:
-            USELESS_ATTR_LIST = USELESS_ATTR_LIST + ["comment"]
-        for node in iter_node(element):
+        return self.normalize_tree(element, base_url, clean=False)
 
-            # 增加数学标签转换
+    def convert_node(self, node, context):
+        """标签转换：公式、图片和 src 链接、没有子节点的 div 改为 p、删除 class 无用的节点"""
+        # 增加数学标签转换；预检未发现公式时，只有 class 为 MATH_EXACT_CLASSES 的节点需要转换
+        if context.has_math or node.get("class") in MATH_EXACT_CLASSES:
             self.math_latex_processing(node)
 
-            # 增强的图片链接处理逻辑
-            if node.tag == "img":
-                self._process_image_node(node, base_url)
-            elif "src" in node.attrib and node.attrib["src"] and base_url:
-                # 处理其他带src属性的标签（如iframe, video等）
-                src_url = node.attrib["src"]
-                if not src_url.startswith(("http://", "https://", "data:", "//")):
-                    absolute_url = urljoin(base_url, src_url)
-                    node.attrib["src"] = absolute_url
-                elif src_url.startswith("//"):
-                    node.attrib["src"] = "https:" + src_url
-
-            if node.tag.lower() == "div" and not node.getchildren():
-                node.tag = "p"
-
-            class_name = node.get("class")
-            if class_name:
-                if class_name.lower() in USELESS_ATTR_LIST:
-                    self.remove_node(node)
-
-        return element
+        # 增强的图片链接处理逻辑
+        base_url = context.base_url
+        if node.tag == "img":
+            self._process_image_node(node, base_url)
+        elif "src" in node.attrib and node.attrib["src"] and base_url:
+            # 处理其他带src属性的标签（如iframe, video等）
+            src_url = node.attrib["src"]
+            if not src_url.startswith(("http://", "https://", "data:", "//")):
+                absolute_url = urljoin(base_url, src_url)
+                node.attrib["src"] = absolute_url
+            elif src_url.startswith("//"):
+                node.attrib["src"] = "https:" + src_url
+
+        if node.tag.lower() == "div" and not node.getchildren():
+            node.tag = "p"
+
+        class_name = node.get("class")
+        if class_name:
+            if class_name.lower() in context.useless_attrs:
+                self.remove_node(node)
 
     def delete_by_link_density(
             self, subtree, tagname, backtracking=False, favor_precision=False
     ):
         need_del_par = []
-        skip_par = []
+        # need_del_par 的成员集合，元素按对象本身比较
+        need_del_set = set()
+        skip_par = set()
         drop_list = False
+        # 父节点 -> (同名子节点列表, 子节点 -> 下标)，父节点的子节点变化时丢弃
+        sibling_groups = {}
+
+        def following_siblings(node, parent):
+            """等价于 node.xpath(f"following-sibling::{tagname}")"""
+            if parent is None:
+                return []
+            group = sibling_groups.get(parent)
+            if group is None:
+                children = [child for child in parent if child.tag == tagname]
+                group = children, {child: idx for idx, child in enumerate(children)}
+                sibling_groups[parent] = group
+            children, index = group
+            return children[index[node] + 1:]
+
+        def schedule(nodes):
+            need_del_par.extend(nodes)
+            need_del_set.update(nodes)
+
+        self.traversals += 1
         for descendant in subtree.iter(tagname):
             pparent = descendant.getparent()
-            if pparent in need_del_par or pparent in skip_par:
+            if pparent in need_del_set or pparent in skip_par:
                 continue
-            siblings = descendant.xpath(f"following-sibling::{tagname}")
+            siblings = following_siblings(descendant, pparent)
 
-            if 'list' in descendant.get("class", "") and len(descendant.xpath('./a')) >= 5:
-                need_del_par.append(descendant)
-                need_del_par.extend(siblings)
+            if 'list' in descendant.get("class", "") and len(descendant.findall("a")) >= 5:
+                schedule([descendant])
+                schedule(siblings)
                 continue
 
             nn = [descendant]
@@ -765,7 +671,7 @@ class BaseExtractor:
                 }
                 if tagname == "div" or tagname == "article" or tagname == "section":
                     for j in nn:
-                        txt = "".join(j.xpath(".//text()")).strip()
+                        txt = j.text_content().strip()
                         for x in [
                             "read",
                             "more",
@@ -789,28 +695,28 @@ class BaseExtractor:
                     pass
                 else:
                     continue
-            skip_par.append(pparent)
+            skip_par.add(pparent)
             a_num = 0
             for j in siblings:
-                if j.xpath(".//a"):
+                if next(j.iterdescendants("a"), None) is not None:
                     if tagname == "p":
-                        if density_of_a_text(j, pre=0.8):
+                        if density_of_a_text(j, pre=0.8, metrics=self.metrics):
                             a_num += 1
                     elif tagname in ["div", "section", "article"]:
-                        if density_of_a_text(j, pre=0.2):
+                        if density_of_a_text(j, pre=0.2, metrics=self.metrics):
                             a_num += 1
                     else:
                         if self.need_comment:
                             # 增加判断是否包含评论 再决定是否删除
                             break_flg = False
                             for c_xpath in Forum_XPATH[:-1]:
-                                if j.xpath(c_xpath.replace(".//*", "self::*")):
+                                if run_xpath(j, c_xpath.replace(".//*", "self::*")):
                                     break_flg = True
                                     break
                             if break_flg:
                                 continue
                         if tagname == "li":
-                            if text_len("".join(j.xpath(".//text()[not(ancestor::a)]"))) > 50:
+                            if self.metrics.nonlink_text_len(j) > 50:
                                 continue
                         a_num += 1
 
@@ -833,7 +739,7 @@ class BaseExtractor:
                 for ll in [".//head[@rend='h2']", ".//head[@rend='h1']", "./article"]:
                     title_num = 0
                     for jj in nn:
-                        if jj.xpath(ll):
+                        if run_xpath(jj, ll):
                             title_num += 1
                     if title_max_num < title_num:
                         title_max_num = title_num
@@ -860,17 +766,18 @@ class BaseExtractor:
                 sk_flg = True
                 for dl in siblings:
                     if (
-                            text_len("".join(descendant.xpath(".//text()"))) * 2
-                            < text_len("".join(dl.xpath(".//text()")))
+                            self.metrics.text_len(descendant) * 2
+                            < self.metrics.text_len(dl)
                             and sk_flg
                     ):
                         self.remove_node(descendant)
                         sk_flg = False
                     else:
                         self.remove_node(dl)
+                sibling_groups.pop(pparent, None)
             else:
-                need_del_par.append(descendant)
-                need_del_par.extend(siblings)
+                schedule([descendant])
+                schedule(siblings)
         for node in need_del_par:
             drop_list = True
             try:
@@ -881,13 +788,17 @@ class BaseExtractor:
         myelems, deletions = defaultdict(list), []
 
         if tagname == "div":
+            self.traversals += 1
             for elem in subtree.iter(tagname):
-                if density_of_a_text(elem, pre=0.8) and img_div_check(elem):
+                if density_of_a_text(elem, pre=0.8, metrics=self.metrics) and img_div_check(elem):
                     deletions.append(elem)
 
+        self.traversals += 1
         for elem in subtree.iter(tagname):
             elemtext = trim(elem.text_content())
-            result, templist = link_density_test(elem, elemtext, favor_precision)
+            result, templist = link_density_test(
+                elem, elemtext, favor_precision, metrics=self.metrics
+            )
             if result is True and img_div_check(elem):
                 # 保留table中的链接
                 if tagname in ['ul', 'li', 'div', 'p'] and ancestor_node_check(elem, ['td']):
@@ -910,7 +821,7 @@ class BaseExtractor:
                     # 增加判断是否包含评论 再决定是否删除
                     break_flg = False
                     for c_xpath in Forum_XPATH[:-1]:
-                        if elem.xpath(c_xpath):
+                        if run_xpath(elem, c_xpath):
                             break_flg = True
                             break
                     if break_flg:
@@ -920,57 +831,36 @@ class BaseExtractor:
                 pass
         return subtree, drop_list
 
-    def prune_unwanted_sections(self, tree):
+    def prune_unwanted_sections(self, tree, backend=None):
+        backend = backend or self.discard_backend
+        if backend not in DISCARD_BACKENDS:
+            raise ValueError(f"backend must be one of {DISCARD_BACKENDS}", backend)
+        self.metrics.clear()
         tmp_OVERALL_DISCARD_XPATH = OVERALL_DISCARD_XPATH
         if self.need_comment:
             tmp_OVERALL_DISCARD_XPATH = tmp_OVERALL_DISCARD_XPATH[:-1]
-        tree = self.prune_unwanted_nodes(
-            tree, tmp_OVERALL_DISCARD_XPATH, with_backup=True
-        )
-        for xp_list in [
+        xp_lists = [
             PAYWALL_DISCARD_XPATH,
             TEASER_DISCARD_XPATH,
             DISCARD_IMAGE_ELEMENTS,
-        ]:
-            tree = self.prune_unwanted_nodes(tree, xp_list)
-        # remove elements by link density
-        tree, drop_list_1 = self.delete_by_link_density(
-            tree, "div", backtracking=True, favor_precision=False
-        )
-        tree, drop_list_1_1 = self.delete_by_link_density(
-            tree, "article", backtracking=False, favor_precision=False
-        )
-        tree, drop_list_1_2 = self.delete_by_link_density(
-            tree, "section", backtracking=False, favor_precision=False
-        )
-        tree, drop_list_2_1 = self.delete_by_link_density(
-            tree, "ul", backtracking=False, favor_precision=False
-        )
-        tree, drop_list_2_2 = self.delete_by_link_density(
-            tree, "li", backtracking=False, favor_precision=False
-        )
-        tree, drop_list_3_1 = self.delete_by_link_density(
-            tree, "dl", backtracking=False, favor_precision=False
-        )
-        tree, drop_list_3_3 = self.delete_by_link_density(
-            tree, "dt", backtracking=False, favor_precision=False
-        )
-        tree, drop_list_3_2 = self.delete_by_link_density(
-            tree, "dd", backtracking=False, favor_precision=False
-        )
-        tree, drop_list_3 = self.delete_by_link_density(
-            tree, "p", backtracking=False, favor_precision=False
+        ]
+        matches = None
+        if backend == "tokens":
+            exprs = [expr for xp_list in [tmp_OVERALL_DISCARD_XPATH] + xp_lists for expr in xp_list]
+            matches = DISCARD_ENGINE.match(tree, exprs)
+            self.traversals += DISCARD_ENGINE.walks(exprs)
+        # 删除过多时原地撤销，树回到匹配时的状态，matches 仍然可用
+        tree = self.prune_unwanted_nodes(
+            tree, tmp_OVERALL_DISCARD_XPATH, with_backup=True, matches=matches
         )
+        for xp_list in xp_lists:
+            tree = self.prune_unwanted_nodes(tree, xp_list, matches=matches)
+        # remove elements by link density
+        drop_list = False
+        for tagname, backtracking in LINK_DENSITY_TAGS:
+            tree, tag_drop_list = self.delete_by_link_density(
+                tree, tagname, backtracking=backtracking, favor_precision=False
+            )
+            drop_list = drop_list or tag_drop_list
 
-        return (
-            tree,
-            drop_list_1
-            or drop_list_2_1
-            or drop_list_2_2
-            or drop_list_3
-            or drop_list_1_1
-            or drop_list_1_2
-            or drop_list_3_1
-            or drop_list_3_2
-            or drop_list_3_3,
-        )
+        return tree, drop_list
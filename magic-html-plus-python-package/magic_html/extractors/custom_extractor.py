@@ -2,6 +2,7 @@
 import re
 
 from magic_html.utils import *
+from magic_html.context import with_extraction_context
 from magic_html.extractors.base_extractor import BaseExtractor
 from magic_html.extractors.title_extractor import TitleExtractor
 
@@ -21,8 +22,10 @@ class CustomExtractor(BaseExtractor):
             return "".join(tree.xpath(extract_rule["value"])).strip()
         return tree.xpath(extract_rule["value"])[0]
 
-    def extract(self, html="", base_url="", rule={}) -> dict:
-        tree = load_html(html)
+    @with_extraction_context
+    def extract(self, html="", base_url="", rule={}, encoding=None, content_type=None) -> dict:
+        with self.stage("load_html"):
+            tree = load_html(html, encoding, content_type, base_url)
         if tree is None:
             raise ValueError
 
@@ -36,10 +39,11 @@ class CustomExtractor(BaseExtractor):
             tree = self.use_clean_rule(tree, rule["clean"])
 
         # 获取title
-        if "title" not in rule:
-            title = TitleExtractor().process(tree)
-        else:
-            title = self.use_extract_rule(tree, rule["title"])
+        with self.stage("title"):
+            if "title" not in rule:
+                title = TitleExtractor().process(tree)
+            else:
+                title = self.use_extract_rule(tree, rule["title"])
 
         # 文章区域
         try:
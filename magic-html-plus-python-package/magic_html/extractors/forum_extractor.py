@@ -3,120 +3,134 @@ import re
 
 from magic_html.config import Forum_XPATH, Unique_ID
 from magic_html.utils import *
+from magic_html.context import with_extraction_context
 from magic_html.extractors.base_extractor import BaseExtractor
 from magic_html.extractors.title_extractor import TitleExtractor
+from magic_html.xpaths import run_xpath
+
+ID_EQUALS_XPATH = f".//*[@{Unique_ID}=$id]"
+ID_AFTER_XPATH = f".//*[number(@{Unique_ID}) > $id]"
+ID_BEFORE_XPATH = f".//*[number(@{Unique_ID}) < $id]"
 
 
 class ForumExtractor(BaseExtractor):
+    default_need_comment = True
+
     def __init__(self) -> None:
         super().__init__()
 
-    def extract(self, html="", base_url="") -> dict:
-        self.need_comment = True
-        html = html.replace("&nbsp;", " ").replace("&#160;", " ")
-        tree = load_html(html)
+    @with_extraction_context
+    def extract(self, html="", base_url="", encoding=None, content_type=None) -> dict:
+        with self.stage("load_html"):
+            html = replace_nbsp(html)
+            tree = load_html(html, encoding, content_type, base_url)
         if tree is None:
             raise ValueError
 
         # 获取title
-        title = TitleExtractor().process(tree)
+        with self.stage("title"):
+            title = TitleExtractor().process(tree)
 
         # base_url
-        base_href = tree.xpath("//base/@href")
+        base_href = run_xpath(tree, "//base/@href")
 
         if base_href and "http" in base_href[0]:
             base_url = base_href[0]
-        self.generate_unique_id(tree)
+        with self.stage("unique_id"):
+            self.generate_unique_id(tree)
 
-        format_tree = self.convert_tags(tree, base_url=base_url)
+        # 标签转换（含数学标签处理），删除script style等标签及其内容，在一次遍历中完成
+        with self.stage("normalize"):
+            normal_tree = self.normalize_tree(tree, base_url=base_url)
 
-        normal_tree = self.clean_tags(format_tree)
-
-        subtree, xp_num, drop_list = self.xp_1_5(normal_tree)
+        with self.stage("xp_1_5"):
+            subtree, xp_num, drop_list = self.xp_1_5(normal_tree)
         if xp_num == "others":
-            subtree, drop_list = self.prune_unwanted_sections(normal_tree)
+            with self.stage("prune_unwanted_sections"):
+                subtree, drop_list = self.prune_unwanted_sections(normal_tree)
         body_html = self.get_content_html(subtree, xp_num, base_url)
 
         # 论坛等独有
-        body_html_tree = fromstring(body_html)
-        try:
-            body_tree = body_html_tree.body
-        except:
-            body_tree = Element("body")
-            body_tree.extend(body_html_tree)
-        main_ids = body_tree.xpath(f".//@{Unique_ID}")
-
-        for main_id in main_ids:
-            main_tree = normal_tree.xpath(
-                f".//*[@{Unique_ID}={main_id}]"
-            )
-            if main_tree:
-                self.remove_node(main_tree[0])
-        if not main_ids:
-            main_ids = [-1]
+        with self.stage("forum_posts"):
+            body_html_tree = fromstring(body_html)
+            try:
+                body_tree = body_html_tree.body
+            except:
+                body_tree = Element("body")
+                body_tree.extend(body_html_tree)
+            main_ids = run_xpath(body_tree, f".//@{Unique_ID}")
+
+            for main_id in main_ids:
+                self.traversals += 1
+                main_tree = run_xpath(normal_tree, ID_EQUALS_XPATH, id=int(main_id))
+                if main_tree:
+                    self.remove_node(main_tree[0])
+            if not main_ids:
+                main_ids = [-1]
 
         if xp_num != "others":
-            normal_tree, _ = self.prune_unwanted_sections(normal_tree)
-        for c_xpath in Forum_XPATH:
-            while normal_tree.xpath(c_xpath):
-                x = normal_tree.xpath(c_xpath)[0]
-                self.remove_node(x)
-                if "'post-'" in c_xpath:
-                    if not (re.findall(r'post-\d+', x.attrib.get("id", "").lower()) or re.findall(r'post_\d+',
-                                                                                                 x.attrib.get("id",
-                                                                                                              "").lower())):
-                        continue
-                if (
-                        "header" in x.attrib.get("class", "").lower()
-                        or "header" in x.attrib.get("id", "").lower()
-                ):
-                    continue
-                try:
-                    if int(x.attrib.get(Unique_ID, "0")) > int(
-                            main_ids[-1]
+            with self.stage("prune_unwanted_sections"):
+                normal_tree, _ = self.prune_unwanted_sections(normal_tree)
+        with self.stage("forum_posts"):
+            for c_xpath in Forum_XPATH:
+                # while 条件每次执行 XPath 都遍历一次，最后一次不满足时也计入
+                self.traversals += 1
+                while run_xpath(normal_tree, c_xpath):
+                    self.traversals += 2
+                    x = run_xpath(normal_tree, c_xpath)[0]
+                    self.remove_node(x)
+                    if "'post-'" in c_xpath:
+                        if not (re.findall(r'post-\d+', x.attrib.get("id", "").lower()) or re.findall(r'post_\d+',
+                                                                                                     x.attrib.get("id",
+                                                                                                                  "").lower())):
+                            continue
+                    if (
+                            "header" in x.attrib.get("class", "").lower()
+                            or "header" in x.attrib.get("id", "").lower()
                     ):
-                        body_tree.append(x)
-                    else:
-                        prefix_div = Element("div")
-                        suffix_div = Element("div")
-                        need_prefix = False
-                        need_suffix = False
-                        while x.xpath(
-                                f".//*[number(@{Unique_ID}) > {int(main_ids[-1])}]"
-                        ):
-                            tmp_x = x.xpath(
-                                f".//*[number(@{Unique_ID}) > {int(main_ids[-1])}]"
-                            )[0]
-                            self.remove_node(tmp_x)
-                            suffix_div.append(tmp_x)
-                            need_suffix = True
-                        while x.xpath(
-                                f".//*[number(@{Unique_ID}) < {int(main_ids[-1])}]"
+                        continue
+                    try:
+                        if int(x.attrib.get(Unique_ID, "0")) > int(
+                                main_ids[-1]
                         ):
-                            tmp_x = x.xpath(
-                                f".//*[number(@{Unique_ID}) < {int(main_ids[-1])}]"
-                            )[0]
-                            self.remove_node(tmp_x)
-                            prefix_div.append(tmp_x)
-                            need_prefix = True
-                        if need_prefix:
-                            body_tree.insert(0, prefix_div)
-                        if need_suffix:
-                            body_tree.append(suffix_div)
-
-                except:
-                    pass
-
-        body_html = re.sub(
-            rf' {Unique_ID}="\d+"',
-            "",
-            tostring(body_tree, encoding=str),
-        )
+                            body_tree.append(x)
+                        else:
+                            prefix_div = Element("div")
+                            suffix_div = Element("div")
+                            need_prefix = False
+                            need_suffix = False
+                            while run_xpath(x, ID_AFTER_XPATH, id=int(main_ids[-1])):
+                                tmp_x = run_xpath(x, ID_AFTER_XPATH, id=int(main_ids[-1]))[0]
+                                self.remove_node(tmp_x)
+                                suffix_div.append(tmp_x)
+                                need_suffix = True
+                            while run_xpath(x, ID_BEFORE_XPATH, id=int(main_ids[-1])):
+                                tmp_x = run_xpath(x, ID_BEFORE_XPATH, id=int(main_ids[-1]))[0]
+                                self.remove_node(tmp_x)
+                                prefix_div.append(tmp_x)
+                                need_prefix = True
+                            if need_prefix:
+                                body_tree.insert(0, prefix_div)
+                            if need_suffix:
+                                body_tree.append(suffix_div)
+
+                    except:
+                        pass
+
+            body_html = re.sub(
+                rf' {Unique_ID}="\d+"',
+                "",
+                tostring(body_tree, encoding=str),
+            )
 
         return {
             "xp_num": xp_num,
             "drop_list": drop_list,
             "html": body_html,
             "title": title,
-            "base_url": base_url
+            "base_url": base_url,
+            "math_skipped": self.math_skipped,
+            "traversals": self.traversals,
+            "readability_retries": self.readability_retries,
+            "readability_reuses": self.readability_reuses,
         }
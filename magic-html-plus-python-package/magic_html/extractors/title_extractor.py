@@ -1,30 +1,31 @@
 # -*- coding:utf-8 -*-
 
 from magic_html.utils import *
+from magic_html.xpaths import run_xpath
 from magic_html.config import *
 
 
 class TitleExtractor:
     def extract_by_meta(self, element: HtmlElement):
         for xpath in METAS:
-            title = element.xpath(xpath)
+            title = run_xpath(element, xpath)
             if title:
                 return "".join(title)
 
     def extract_by_title(self, element: HtmlElement):
-        return "".join(element.xpath("//title//text()")).strip()
+        return "".join(run_xpath(element, "//title//text()")).strip()
 
     def extract_by_hs(self, element: HtmlElement):
-        hs = element.xpath("//h1//text()|//h2//text()|//h3//text()")
+        hs = run_xpath(element, "//h1//text()|//h2//text()|//h3//text()")
         return hs or []
 
     def extract_by_h(self, element: HtmlElement):
         for xpath in ["//h1", "//h2", "//h3"]:
-            children = element.xpath(xpath)
+            children = run_xpath(element, xpath)
             if not children:
                 continue
             child = children[0]
-            texts = child.xpath("./text()")
+            texts = run_xpath(child, "./text()")
             if texts and len(texts):
                 return texts[0].strip()
 
@@ -1,6 +1,7 @@
 # -*- coding:utf-8 -*-
 
 from magic_html.utils import *
+from magic_html.context import with_extraction_context
 from magic_html.extractors.base_extractor import BaseExtractor
 from magic_html.extractors.title_extractor import TitleExtractor
 
@@ -9,14 +10,17 @@ class WeixinExtractor(BaseExtractor):
     def __init__(self) -> None:
         super().__init__()
 
-    def extract(self, html="", base_url="") -> dict:
-        html = html.replace("&nbsp;", " ")
-        tree = load_html(html)
+    @with_extraction_context
+    def extract(self, html="", base_url="", encoding=None, content_type=None) -> dict:
+        with self.stage("load_html"):
+            html = replace_nbsp(html, ("&nbsp;",))
+            tree = load_html(html, encoding, content_type, base_url)
         if tree is None:
             raise ValueError
 
         # 获取title
-        title = TitleExtractor().process(tree)
+        with self.stage("title"):
+            title = TitleExtractor().process(tree)
 
         # base_url
         base_href = tree.xpath("//base/@href")
@@ -0,0 +1,94 @@
+# -*- coding:utf-8 -*-
+"""
+节点删除日志
+
+prune_unwanted_nodes 在删除过多时需要回退到删除前的树。这里记录每次删除的
+(父节点, 位置, 节点, tail 并入的位置及原值)，可以逆序撤销，
+同时在删除时累计 text_content() 减少的长度；判断是否删除过多时剩余文本只读到能确定结果为止，
+无需整树复制和重新统计文本。
+"""
+
+from magic_html.utils import is_attached, text_strip
+
+
+def merge_target(node):
+    """删除 node 时其非空白 tail 并入的位置 (节点, "tail" | "text")，无需并入时返回 None"""
+    if not text_strip(node.tail):
+        return None
+    previous = node.getprevious()
+    if previous is not None:
+        return previous, "tail"
+    parent = node.getparent()
+    if parent is not None:
+        return parent, "text"
+    return None
+
+
+def detach_node(node):
+    """删除节点，非空白的 tail 并入前一个兄弟节点的 tail 或父节点的 text"""
+    target = merge_target(node)
+    if target is not None:
+        element, attr = target
+        old = getattr(element, attr)
+        if text_strip(old):
+            setattr(element, attr, "".join([old, node.tail]))
+        else:
+            setattr(element, attr, node.tail)
+    parent = node.getparent()
+    if parent is not None:
+        parent.remove(node)
+
+
+class RemovalJournal:
+    def __init__(self, root):
+        self.root = root
+        self.entries = []
+        # root.text_content() 因删除减少的长度
+        self.removed_len = 0
+
+    def record(self, node):
+        """在 detach_node(node) 之前调用"""
+        parent = node.getparent()
+        if parent is None:
+            return
+        target = merge_target(node)
+        old = getattr(*target) if target is not None else None
+        self.entries.append((parent, parent.index(node), node, target, old))
+
+        # 已随祖先一起删除的节点不再影响 root 的文本
+        if not is_attached(parent, self.root):
+            return
+        if isinstance(node.tag, str):
+            self.removed_len += len(node.text_content())
+        if target is None:
+            self.removed_len += len(node.tail or "")
+        elif not text_strip(old):
+            # 空白的 tail/text 被 node.tail 覆盖
+            self.removed_len += len(old or "")
+
+    def removed_too_much(self, ratio):
+        """
+        删除后 root 的文本长度是否不超过删除前的 1/ratio，与比较 len(root.text_content()) 的结果相同
+        删除前的长度为剩余长度加 removed_len，剩余文本超过 removed_len / (ratio - 1) 即可确定，
+        通常只需读取开头的少量文本
+        """
+        if not self.entries:
+            return False
+        kept_len = 0
+        for text in self.root.itertext():
+            kept_len += len(text)
+            if kept_len * (ratio - 1) > self.removed_len:
+                return False
+        return True
+
+    def undo(self):
+        """逆序撤销全部删除，树恢复到第一次删除之前"""
+        for parent, index, node, target, old in reversed(self.entries):
+            if target is not None:
+                setattr(target[0], target[1], old)
+            parent.insert(index, node)
+
+    def redo(self):
+        """按原顺序重新执行 undo 撤销的删除"""
+        for _, _, node, _, _ in self.entries:
+            detach_node(node)
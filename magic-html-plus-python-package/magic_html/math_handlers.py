@@ -0,0 +1,418 @@
+# -*- coding:utf-8 -*-
+"""
+公式转换处理器注册表
+
+math_latex_processing 原先对每个节点依次判断十几种公式写法（texerror、图片公式、math-container、
+wp-katex-eq、tex、katex、MathJax_Preview、x-ck12-mathEditor、math 等），每种都要读取 class 做字符串比较。
+这里把每种写法注册为按标签名或 class 中的类名索引的处理器，节点按 (tag, class) 查一次表即可得到
+需要执行的处理器，查表结果按 (tag, class) 缓存在各线程中。处理器按注册顺序执行，与原先的判断顺序一致。
+
+处理器的签名为 handler(extractor, node, parent)，parent 为执行处理器之前 node 的父节点。
+站点特有的公式写法可以通过 register_math_handler 注册，不会影响其他节点。
+"""
+
+import re
+import threading
+from urllib.parse import unquote
+
+from magic_html.utils import (
+    Element,
+    extract_asciimath,
+    latex_image_class_names,
+    mathml_source,
+    mml_to_latex,
+    text_strip,
+    wrap_math,
+)
+from magic_html.xpaths import run_xpath
+
+# 查表缓存的最大条目数，超过后清空
+DISPATCH_CACHE_SIZE = 10000
+# 与 XPath normalize-space 一致的类名分隔符
+CLASS_SEPARATOR_REGEX = re.compile(r"[ \t\n\r]+")
+
+
+class DispatchTables:
+    """注册表的只读快照，注册和注销时整体替换，查表期间不会变化"""
+
+    __slots__ = ("tag_handlers", "tag_entries", "class_index")
+
+    def __init__(self, by_tag, by_class):
+        # 标签名 / 类名 -> 按注册顺序排列的 ((注册序号, handler, tag), ...)
+        self.tag_entries = {tag: tuple(entries) for tag, entries in by_tag.items()}
+        self.class_index = {name: tuple(sorted(entries, key=_entry_order)) for name, entries in by_class.items()}
+        # 标签名 -> 按注册顺序排列的处理器，只有标签、没有类名匹配的节点直接使用
+        self.tag_handlers = {
+            tag: tuple(dict.fromkeys(e[1] for e in entries))
+            for tag, entries in self.tag_entries.items()
+        }
+
+
+class DispatchCache:
+    """一个线程的查表缓存，只对生成它的快照有效"""
+
+    __slots__ = ("tables", "class_entries", "dispatch")
+
+    def __init__(self, tables):
+        self.tables = tables
+        # class 属性 -> 其中各个类名对应的 [(注册序号, handler, tag)]
+        self.class_entries = {}
+        # (tag, class) -> 类名有匹配时合并后的处理器
+        self.dispatch = {}
+
+
+def _entry_order(entry):
+    return entry[0]
+
+
+class MathHandlerRegistry:
+    """
+    注册和注销在锁内修改 _by_tag、_by_class 并生成新的 DispatchTables；
+    lookup 不加锁，只读取当时的快照，查表缓存按线程各存一份，不会与其他线程同时修改同一个字典
+    """
+
+    def __init__(self):
+        # 标签名 / 类名 -> [(注册序号, handler, tag)]
+        self._by_tag = {}
+        self._by_class = {}
+        self._tables = DispatchTables({}, {})
+        self._local = threading.local()
+        self._count = 0
+        # 用户注册的标签名和类名，BaseExtractor.contains_math 预检时需要一并检查
+        # 注册时整体替换而不是原地修改，其他线程正在遍历的集合不会变化
+        self.custom_tags = set()
+        self.custom_classes = set()
+        self._lock = threading.Lock()
+
+    def register(self, handler=None, tag=None, class_name=None, builtin=False):
+        """
+        注册处理器，tag 为标签名，class_name 为 class 属性中的一个类名，两者至少指定一个，
+        同时指定时两者都满足才执行；不传 handler 时作为装饰器使用
+        """
+        if handler is None:
+            return lambda func: self.register(func, tag, class_name, builtin)
+        if tag is None and class_name is None:
+            raise ValueError("math handler needs a tag or a class_name")
+        with self._lock:
+            self._count += 1
+            entry = (self._count, handler, tag)
+            if class_name is not None:
+                self._by_class.setdefault(class_name, []).append(entry)
+                if not builtin:
+                    self.custom_classes = self.custom_classes | {class_name}
+            else:
+                self._by_tag.setdefault(tag, []).append(entry)
+                if not builtin:
+                    self.custom_tags = self.custom_tags | {tag}
+            self._tables = DispatchTables(self._by_tag, self._by_class)
+        return handler
+
+    def unregister(self, handler):
+        with self._lock:
+            for index in (self._by_tag, self._by_class):
+                for key, entries in list(index.items()):
+                    entries[:] = [e for e in entries if e[1] is not handler]
+                    if not entries:
+                        del index[key]
+            self.custom_tags = self.custom_tags & set(self._by_tag)
+            self.custom_classes = self.custom_classes & set(self._by_class)
+            self._tables = DispatchTables(self._by_tag, self._by_class)
+
+    def _thread_cache(self, tables):
+        cache = getattr(self._local, "cache", None)
+        if cache is None or cache.tables is not tables:
+            cache = self._local.cache = DispatchCache(tables)
+        return cache
+
+    def lookup(self, tag, node_class):
+        """(tag, class) 对应的处理器元组，按注册顺序排列"""
+        tables = self._tables
+        tag_handlers = tables.tag_handlers.get(tag, ())
+        if not node_class:
+            return tag_handlers
+        cache = self._thread_cache(tables)
+        class_entries = cache.class_entries.get(node_class)
+        if class_entries is None:
+            class_entries = []
+            class_index = tables.class_index
+            for class_name in set(CLASS_SEPARATOR_REGEX.split(node_class)):
+                class_entries.extend(class_index.get(class_name, ()))
+            if len(cache.class_entries) >= DISPATCH_CACHE_SIZE:
+                cache.class_entries.clear()
+            cache.class_entries[node_class] = class_entries
+        if not class_entries:
+            return tag_handlers
+        key = (tag, node_class)
+        handlers = cache.dispatch.get(key)
+        if handlers is None:
+            entries = list(tables.tag_entries.get(tag, ()))
+            entries.extend(e for e in class_entries if e[2] is None or e[2] == tag)
+            entries.sort(key=_entry_order)
+            handlers = tuple(dict.fromkeys(e[1] for e in entries))
+            if len(cache.dispatch) >= DISPATCH_CACHE_SIZE:
+                cache.dispatch.clear()
+            cache.dispatch[key] = handlers
+        return handlers
+
+
+MATH_HANDLERS = MathHandlerRegistry()
+
+
+def register_math_handler(handler=None, tag=None, class_name=None):
+    """注册站点特有的公式处理器，见 MathHandlerRegistry.register"""
+    return MATH_HANDLERS.register(handler, tag, class_name)
+
+
+def convert_latex_environments(node):
+    """文本中有\\begin{align} 或 \\begin{equation}"""
+    # 含有 \\begin{ 的文本去掉首尾空白后必然非空，无需再调用 text_strip
+    text = node.text
+    if text and "\\begin{" in text and node.tag not in ["script", "style"]:
+        node.text = _convert_environments(text)
+    tail = node.tail
+    if tail and "\\begin{" in tail and node.tag not in ["script", "style"]:
+        node.tail = _convert_environments(tail)
+
+
+def _convert_environments(text):
+    regex = r"\\begin{align}(.*?)\\end{align}"
+    matches = re.findall(regex, text, re.DOTALL)
+    if matches:
+        text = text.replace("\\begin{align}", "").replace(
+            "\\end{align}", ""
+        )
+
+    if text_strip(text):
+        regex = r"\\begin{equation}(.*?)\\end{equation}"
+        matches = re.findall(regex, text, re.DOTALL)
+        for match in matches:
+            match = match.replace("\\begin{equation}", "")
+            match = match.replace("\\end{equation}", "")
+            wrapped_text = wrap_math(match, display=True)
+            text = text.replace(match, wrapped_text)
+        if matches:
+            # Remove the \begin{equation} and \end{equation} tags
+            text = text.replace("\\begin{equation}", "").replace(
+                "\\end{equation}", ""
+            )
+    return text
+
+
+def _replace_with_span(node, parent, text):
+    """用内容为 text 的 span 替换 node，保留非空白的 tail"""
+    new_span = Element("span")
+    new_span.text = text
+    if parent is not None:
+        if text_strip(node.tail):
+            new_span.tail = node.tail
+        parent.replace(node, new_span)
+
+
+def _insert_span_before(node, text):
+    new_span = Element("span")
+    new_span.text = text
+    node.addprevious(new_span)
+
+
+def _insert_alt_span(node):
+    try:
+        # they usually have "alt='-i u_t + &#92;Delta u = |u|^2 u'"
+        alt = node.get("alt")
+        if text_strip(alt):
+            # Unescape the latex
+            _insert_span_before(node, wrap_math(unquote(alt)))
+    except:
+        pass
+
+
+def _latex_from_query(src):
+    latex = src.split("?")[1:]
+    latex = "?".join(latex)  # In case there are multiple ? in the latex
+    return unquote(latex)
+
+
+# 2. class 为 texerror 的标签
+# Find the text between {} (maximum length) and replace the texerror with that text
+
+# 3. img中的latex
+@MATH_HANDLERS.register(tag="img", builtin=True)
+def handle_latex_image(extractor, node, parent):
+    node_class = node.get("class")
+    if node_class:
+        class_list = node_class.split(" ")
+        if any([img_class in class_list for img_class in latex_image_class_names]):
+            alt = node.get("alt")
+            if text_strip(alt):
+                _insert_span_before(node, wrap_math(alt))
+    src = node.get("src")
+    if src:
+        if "codecogs.com" in src:
+            try:
+                _insert_span_before(node, wrap_math(_latex_from_query(src)))
+            except:
+                pass
+        if "latex.php" in src:
+            _insert_alt_span(node)
+        if "/images/math/codecogs" in src:
+            _insert_alt_span(node)
+        if "mimetex.cgi" in src:
+            try:
+                _insert_span_before(node, wrap_math(_latex_from_query(src)))
+            except:
+                pass
+        if "mathtex.cgi" in src:
+            try:
+                _insert_span_before(node, wrap_math(_latex_from_query(src)))
+            except:
+                pass
+    if node_class:
+        if "x-ck12" in node_class:
+            try:
+                latex = node.get("alt")
+                if text_strip(latex):
+                    _insert_span_before(node, wrap_math(unquote(latex)))
+            except:
+                pass
+
+
+# 4. class 为 math-container
+@MATH_HANDLERS.register(class_name="math-container", builtin=True)
+def handle_math_container(extractor, node, parent):
+    if node.get("class") != "math-container":
+        return
+    try:
+        text = node.text
+        if text_strip(text):
+            _replace_with_span(node, parent, wrap_math(text, display=True))
+    except:
+        pass
+
+
+# 5. class 为 wp-katex-eq
+@MATH_HANDLERS.register(class_name="wp-katex-eq", builtin=True)
+def handle_wp_katex(extractor, node, parent):
+    if node.get("class") != "wp-katex-eq":
+        return
+    try:
+        text = node.text
+        if text_strip(text):
+            display_attr = node.get("data-display")
+            if display_attr is not None:
+                display = display_attr == "true"
+            else:
+                display = False
+            _replace_with_span(node, parent, wrap_math(text, display=display))
+    except:
+        pass
+
+
+# 6. script[type="math/tex"]
+@MATH_HANDLERS.register(tag="script", builtin=True)
+def handle_tex_script(extractor, node, parent):
+    if node.get("type") != "math/tex":
+        return
+    try:
+        text = node.text
+        if text_strip(text):
+            _replace_with_span(node, parent, wrap_math(text))
+    except:
+        pass
+
+
+# 7. script[type="math/asciimath"]
+@MATH_HANDLERS.register(tag="script", builtin=True)
+def handle_asciimath_script(extractor, node, parent):
+    if node.get("type") != "math/asciimath":
+        return
+    try:
+        text = node.text
+        if text_strip(text):
+            _replace_with_span(node, parent, wrap_math(extract_asciimath(text)))
+    except:
+        # Delete this script tag
+        extractor.remove_node(node)
+
+
+# 8. class tex
+@MATH_HANDLERS.register(class_name="tex", builtin=True)
+def handle_tex_class(extractor, node, parent):
+    if node.get("class") != "tex":
+        return
+    try:
+        # Check if they have data-expr attr
+        expr = node.get("data-expr")
+        if text_strip(expr):
+            # Replace with a span
+            _replace_with_span(node, parent, wrap_math(expr))
+    except:
+        pass
+
+
+# 9. span.katex
+@MATH_HANDLERS.register(tag="span", class_name="katex", builtin=True)
+def handle_katex(extractor, node, parent):
+    if node.get("class") != "katex":
+        return
+    # Find any spans with class "katex-html" and remove them
+    katex_html_spans = run_xpath(node, './/span[@class="katex-html"]')
+    for katex_html_span in katex_html_spans:
+        extractor.remove_node(katex_html_span)
+
+
+# 10. Remove any .MathJax_Preview spans
+@MATH_HANDLERS.register(tag="span", class_name="MathJax_Preview", builtin=True)
+def handle_mathjax_preview(extractor, node, parent):
+    if node.get("class") != "MathJax_Preview":
+        return
+    extractor.remove_node(node)
+
+
+# class 中包含 x-ck12-mathEditor，可能是其他类名的一部分，因此按标签索引
+@MATH_HANDLERS.register(tag="span", builtin=True)
+def handle_ck12_editor(extractor, node, parent):
+    node_class = node.get("class")
+    if not (node_class and "x-ck12-mathEditor" in node_class):
+        return
+    try:
+        expr = node.get("data-tex")
+        if text_strip(expr):
+            expr = unquote(expr).replace(r"\&quot;", "").replace("&quot;", "")
+            # Replace with a span
+            _replace_with_span(node, parent, wrap_math(expr))
+    except:
+        pass
+
+
+# 11. all math tags
+@MATH_HANDLERS.register(tag="math", builtin=True)
+def handle_mathml(extractor, node, parent):
+    annotation_tags = run_xpath(node, './/annotation[@encoding="application/x-tex"]')
+    if len(annotation_tags) > 0:
+        annotation_tag = annotation_tags[0]
+        text = annotation_tag.text
+        if text_strip(text):
+            _replace_with_span(node, parent, wrap_math(text))
+            style_value = parent.get("style")
+            if style_value:
+                normalized_style_value = (
+                    style_value.lower()
+                    .strip()
+                    .replace(" ", "")
+                    .replace(";", "")
+                )
+                if "display:none" in normalized_style_value:
+                    parent.style = ""
+    elif text_strip(node.get("alttext")):
+        # Get the alttext attribute
+        alttext = node.get("alttext")
+        if text_strip(alttext):
+            _replace_with_span(node, parent, wrap_math(alttext))
+    else:
+        try:
+            # Try translating to LaTeX
+            latex = mml_to_latex(mathml_source(node))
+            # Then, we need to replace the math tag with the new span tag
+            _replace_with_span(node, parent, wrap_math(latex))
+        except:
+
+            extractor.remove_node(node)
@@ -0,0 +1,270 @@
+# -*- coding:utf-8 -*-
+"""
+节点文本统计缓存
+
+text_len / number_of_char / density_of_a_text / Document.get_link_density 等密度判断
+原先每次都要拼接子树的全部文本重新统计，深层 DOM 上同一批节点会被反复遍历。
+这里自底向上为每个元素计算一次文本摘要并缓存，父节点的摘要由子节点的摘要合并得到：
+  - all      .//text() 拼接后的文本
+  - link     .//a//text() 拼接后的文本
+  - nonlink  子树内不在 <a> 之下的文本（.//text()[not(ancestor::a)] 还需检查祖先）
+  - linksum  所有 <a> 后代的 readability 文本长度之和
+
+每段文本的摘要 Segment 可以按顺序合并，合并结果与先拼接字符串再统计完全一致。
+节点被删除或修改后需要调用 invalidate 使其祖先的缓存失效。
+ReadabilityMetrics 在同一次遍历中另外统计逗号数和后代标签数，供 readability 使用。
+"""
+
+import re
+from functools import lru_cache
+
+from magic_html.utils import TEXT_LEN_CHAR_REGEX
+
+WHITESPACE_REGEX = re.compile(r"\s+")
+TAB_SPACE_REGEX = re.compile(r"\t|[ \t]{2,}")
+# readability_plus.clean 会把 255 个以上的连续空白替换为 255 个空格，更长的部分无需保留
+RUN_CAP = 255
+# Document.sanitize 统计的后代标签，最后一项 hidden_input 为 type="hidden" 的 <input>
+COUNTED_TAGS = ("p", "img", "li", "a", "embed", "input")
+COUNTED_KEYS = COUNTED_TAGS + ("hidden_input",)
+COUNTED_INDEX = {tag: i for i, tag in enumerate(COUNTED_TAGS)}
+NO_COUNTS = (0,) * len(COUNTED_KEYS)
+
+# Segment: (length, nonws, words, cjk, lead, trail, inner)
+#   length  字符数
+#   nonws   非空白字符数
+#   words   str.split() 得到的词数
+#   cjk     中日阿文字符数
+#   lead    开头的连续空白（最多 RUN_CAP 个字符），全为空白时即整段
+#   trail   结尾的连续空白，全为空白时与 lead 相同
+#   inner   readability_plus.clean 处理后，首尾之间各段空白的长度之和
+EMPTY = (0, 0, 0, 0, "", "", 0)
+
+
+@lru_cache(maxsize=1024)
+def run_length(run):
+    """一段位于文本中间的连续空白经 readability_plus.clean 处理后的长度"""
+    if len(run) >= RUN_CAP or "\n" in run:
+        return 1
+    return len(TAB_SPACE_REGEX.sub(" ", run))
+
+
+@lru_cache(maxsize=4096)
+def segment(text):
+    """单个文本节点的摘要"""
+    if not text:
+        return EMPTY
+    length = len(text)
+    stripped = text.strip()
+    if not stripped:
+        run = text[:RUN_CAP]
+        return length, 0, 0, 0, run, run, 0
+    lead = text[: length - len(text.lstrip())][:RUN_CAP]
+    trail = text[len(text.rstrip()):][:RUN_CAP]
+    runs = WHITESPACE_REGEX.findall(stripped)
+    return (
+        length,
+        len(stripped) - sum(map(len, runs)),
+        len(runs) + 1,
+        0 if stripped.isascii() else TEXT_LEN_CHAR_REGEX.subn("", stripped)[1],
+        lead,
+        trail,
+        sum(map(run_length, runs)),
+    )
+
+
+def combine(a, b):
+    """合并两段相邻文本的摘要，等价于 segment(a_text + b_text)"""
+    if not a[0]:
+        return b
+    if not b[0]:
+        return a
+    length = a[0] + b[0]
+    if not a[1]:
+        if not b[1]:
+            run = (a[4] + b[4])[:RUN_CAP]
+            return length, 0, 0, 0, run, run, 0
+        return length, b[1], b[2], b[3], (a[4] + b[4])[:RUN_CAP], b[5], b[6]
+    if not b[1]:
+        return length, a[1], a[2], a[3], a[4], (a[5] + b[4])[:RUN_CAP], a[6]
+    joint = a[5] + b[4]
+    if joint:
+        words = a[2] + b[2]
+        inner = a[6] + b[6] + run_length(joint[:RUN_CAP])
+    else:
+        # 两段首尾相接，最后一个词和第一个词合并
+        words = a[2] + b[2] - 1
+        inner = a[6] + b[6]
+    return length, a[1] + b[1], words, a[3] + b[3], a[4], b[5], inner
+
+
+def text_len_of(seg):
+    """等价于 utils.text_len(文本)"""
+    return seg[2] + seg[3]
+
+
+def clean_len_of(seg):
+    """等价于 len(readability_plus.clean(文本))"""
+    return seg[1] + seg[6] if seg[1] else 0
+
+
+def trim_len_of(seg):
+    """等价于 len(utils.trim(文本))"""
+    return seg[1] + seg[2] - 1 if seg[1] else 0
+
+
+class TextMetrics:
+    def __init__(self):
+        # element -> (all, link, nonlink, linksum)
+        self._cache = {}
+
+    def clear(self):
+        self._cache.clear()
+
+    def invalidate(self, element):
+        """element 的文本或子节点发生变化后调用，清除它及其祖先的缓存"""
+        cache = self._cache
+        while element is not None:
+            cache.pop(element, None)
+            element = element.getparent()
+
+    def _build(self, element):
+        cache = self._cache
+        is_link = element.tag == "a"
+        all_seg = segment(element.text)
+        link_seg = EMPTY
+        nonlink_seg = EMPTY if is_link else all_seg
+        linksum = 0
+        for child in element:
+            if isinstance(child.tag, str):
+                # 子类的记录在这四项之后还有其他统计
+                child_record = cache[child]
+                c_all = child_record[0]
+                all_seg = combine(all_seg, c_all)
+                linksum += child_record[3]
+                if child.tag == "a":
+                    link_seg = combine(link_seg, c_all)
+                    linksum += clean_len_of(c_all)
+                else:
+                    link_seg = combine(link_seg, child_record[1])
+                if not is_link:
+                    nonlink_seg = combine(nonlink_seg, child_record[2])
+            if child.tail:
+                tail_seg = segment(child.tail)
+                all_seg = combine(all_seg, tail_seg)
+                if not is_link:
+                    nonlink_seg = combine(nonlink_seg, tail_seg)
+        return all_seg, link_seg, nonlink_seg, linksum
+
+    def get(self, element):
+        cache = self._cache
+        record = cache.get(element)
+        if record is not None:
+            return record
+        # 非递归的后序遍历，只计算尚未缓存的子树
+        stack = [(element, False)]
+        while stack:
+            node, ready = stack.pop()
+            if ready:
+                cache[node] = self._build(node)
+                continue
+            stack.append((node, True))
+            for child in node:
+                if isinstance(child.tag, str) and child not in cache:
+                    stack.append((child, False))
+        return cache[element]
+
+    def all_text(self, element):
+        return self.get(element)[0]
+
+    def link_text(self, element):
+        return self.get(element)[1]
+
+    def nonlink_text(self, element):
+        """.//text()[not(ancestor::a)]，element 位于 <a> 之内时为空"""
+        for _ in element.iterancestors("a"):
+            return EMPTY
+        return self.get(element)[2]
+
+    def paragraph_text(self, tree):
+        """//p//text()[not(ancestor::a)]，在 tree 所在文档的所有 <p> 中统计"""
+        root = tree.getroottree().getroot()
+        seg = EMPTY
+        for p in root.iter("p"):
+            # 嵌套的 <p> 已包含在外层 <p> 的文本中
+            for _ in p.iterancestors("p"):
+                break
+            else:
+                seg = combine(seg, self.nonlink_text(p))
+        return seg
+
+    def content_length(self, element):
+        """len(element.text_content())"""
+        return self.get(element)[0][0]
+
+    def text_len(self, element):
+        """text_len("".join(element.xpath(".//text()")))"""
+        return text_len_of(self.get(element)[0])
+
+    def link_text_len(self, element):
+        """text_len("".join(element.xpath(".//a//text()")))"""
+        return text_len_of(self.get(element)[1])
+
+    def nonlink_text_len(self, element):
+        """text_len("".join(element.xpath(".//text()[not(ancestor::a)]")))"""
+        return text_len_of(self.nonlink_text(element))
+
+    def clean_length(self, element):
+        """readability_plus.text_length(element)"""
+        return clean_len_of(self.get(element)[0])
+
+    def link_length(self, element):
+        """element 所有 <a> 后代的 readability_plus.text_length 之和"""
+        return self.get(element)[3]
+
+    def trim_length(self, element):
+        """len(utils.trim(element.text_content()))"""
+        return trim_len_of(self.get(element)[0])
+
+
+def count_commas(text):
+    return text.count(",") + text.count("，") if text else 0
+
+
+class ReadabilityMetrics(TextMetrics):
+    """
+    记录在文本摘要之后增加 commas 和 counts：
+      - commas  text_content() 中半角和全角逗号的个数
+      - counts  COUNTED_KEYS 中各项的后代元素个数，等价于 findall(".//tag")
+    Document.sanitize 对每个 table/ul/div 等元素读取这些值，不再逐个调用 text_content() 和 findall
+    """
+
+    def _build(self, element):
+        record = super()._build(element)
+        cache = self._cache
+        commas = count_commas(element.text)
+        # 没有需要统计的后代时共用 NO_COUNTS
+        counts = None
+        for child in element:
+            tag = child.tag
+            if isinstance(tag, str):
+                child_record = cache[child]
+                commas += child_record[4]
+                if child_record[5] is not NO_COUNTS:
+                    counts = [a + b for a, b in zip(counts or NO_COUNTS, child_record[5])]
+                index = COUNTED_INDEX.get(tag)
+                if index is not None:
+                    counts = counts or list(NO_COUNTS)
+                    counts[index] += 1
+                    if tag == "input" and child.get("type") == "hidden":
+                        counts[-1] += 1
+            commas += count_commas(child.tail)
+        return record + (commas, NO_COUNTS if counts is None else tuple(counts))
+
+    def commas(self, element):
+        """el.text_content().count(",") + el.text_content().count("，")"""
+        return self.get(element)[4]
+
+    def tag_counts(self, element):
+        """{tag: len(element.findall(".//tag"))}，hidden_input 为 .//input[@type="hidden"] 的个数"""
+        return dict(zip(COUNTED_KEYS, self.get(element)[5]))
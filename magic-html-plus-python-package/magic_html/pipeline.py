@@ -0,0 +1,103 @@
+# -*- coding:utf-8 -*-
+"""
+单次遍历的节点处理流水线
+
+convert_tags 和 clean_tags 原先各自遍历整棵树，clean_tags 中噪声 XPath 每条遍历一次，
+MANUALLY_CLEANED 的每个标签、form、figure、空节点又各遍历一次。这里把逐节点的改写和删除
+登记为步骤（NodeStep），在一次遍历中执行，执行顺序保证如下：
+
+- 节点按文档顺序访问，同一节点上的步骤按登记顺序执行；
+- attached_only 的步骤跳过遍历中已被删除（包括随祖先删除）的节点，相当于在前面的步骤
+  全部执行完之后再单独遍历一次树。这类步骤只能读取节点自身和祖先的状态；
+- 需要读取子树的步骤（例如 form 的文本长度、figure 中是否有 table、节点是否为空）
+  登记为 deferred：节点上遍历中的步骤都执行完后，收集对应标签、此时仍在树中的节点，
+  遍历结束后按登记顺序执行，节点按文档顺序传入，执行时需要自行判断节点是否仍在树中。
+
+遍历本身与 iter_tree 相同：开始时取得节点快照，遍历中新插入的节点不会访问，
+访问之前已被移出树的节点及其子孙也不会访问。
+"""
+
+from collections import defaultdict
+
+from lxml import etree
+
+
+class NodeStep:
+    """
+    流水线中的一步，name 为提取器的方法名，子类可以覆盖对应方法
+    遍历中的步骤调用 method(node, context)，deferred 的步骤调用 method(nodes, context)
+    tags 为 None 时处理所有节点
+    """
+
+    def __init__(self, name, tags=None, attached_only=False, deferred=False):
+        self.name = name
+        self.tags = None if tags is None else frozenset(tags)
+        self.attached_only = attached_only
+        self.deferred = deferred
+
+
+class PipelineContext:
+    """一次执行的参数，tree 为遍历的根节点，其余参数按名称访问"""
+
+    def __init__(self, tree, **options):
+        self.tree = tree
+        self.__dict__.update(options)
+
+
+class NodePipeline:
+    def __init__(self, steps):
+        self.steps = list(steps)
+
+    def run(self, extractor, tree, **options):
+        context = PipelineContext(tree, **options)
+        walk_steps = []
+        # 标签 -> 需要收集该标签节点的列表，tags 为 None 的步骤收集所有节点
+        collectors = defaultdict(list)
+        collect_all = []
+        deferred = []
+        for step in self.steps:
+            method = getattr(extractor, step.name)
+            if not step.deferred:
+                walk_steps.append((step.tags, step.attached_only, method))
+                continue
+            collected = []
+            deferred.append((method, collected))
+            if step.tags is None:
+                collect_all.append(collected)
+            else:
+                for tag in step.tags:
+                    collectors[tag].append(collected)
+
+        # 与 iter_tree 相同：访问之前已被移出树的节点及其子孙不再访问
+        skipped = set()
+        # 访问时或访问之后被删除的节点，子孙随之视为已删除
+        removed = set()
+        for node in list(tree.iter(etree.Element)):
+            detached = False
+            if node is not tree:
+                parent = node.getparent()
+                if parent is None or parent in skipped:
+                    skipped.add(node)
+                    continue
+                if parent in removed:
+                    detached = True
+                    removed.add(node)
+            tag = node.tag
+            for tags, attached_only, method in walk_steps:
+                if tags is not None and tag not in tags:
+                    continue
+                if detached and attached_only:
+                    continue
+                method(node, context)
+                tag = node.tag
+                if not detached and node is not tree and node.getparent() is None:
+                    detached = True
+                    removed.add(node)
+            if not detached:
+                for collected in collectors.get(tag, ()):
+                    collected.append(node)
+                for collected in collect_all:
+                    collected.append(node)
+        for method, collected in deferred:
+            method(collected, context)
+        return context
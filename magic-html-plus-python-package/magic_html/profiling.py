@@ -0,0 +1,71 @@
+# -*- coding:utf-8 -*-
+"""
+提取各阶段的耗时
+
+extract(..., profile=True) 返回的结果中增加 timings：{阶段名: 秒}，同名阶段执行多次时累加，
+整个 extract 调用记为 extract。另外可以通过 add_stage_hook 注册全局钩子，接收每个阶段的开始和结束事件，
+例如上报到监控系统。既没有 profile 也没有钩子时 stage 返回共享的空上下文管理器，不读取时钟。
+
+阶段：load_html、title、unique_id（论坛）、normalize（标签转换和清理）、xp_1_5、
+prune_unwanted_sections、readability、forum_posts（论坛的回复整理）
+"""
+
+import threading
+import time
+from contextlib import nullcontext
+
+# 注册的钩子，注册和注销时整体替换，读取时不需要加锁
+STAGE_HOOKS = ()
+_HOOKS_LOCK = threading.Lock()
+NULL_STAGE = nullcontext()
+
+
+def add_stage_hook(hook):
+    """
+    注册钩子 hook(event, stage, elapsed, context)：event 为 start 或 stop，elapsed 为该阶段的秒数，
+    start 时为 None；context 为本次调用的 ExtractionContext，同一页面的事件 context 相同。
+    钩子在提取线程中同步调用，抛出的异常会中断提取
+    """
+    global STAGE_HOOKS
+    with _HOOKS_LOCK:
+        STAGE_HOOKS = STAGE_HOOKS + (hook,)
+    return hook
+
+
+def remove_stage_hook(hook):
+    global STAGE_HOOKS
+    with _HOOKS_LOCK:
+        STAGE_HOOKS = tuple(h for h in STAGE_HOOKS if h is not hook)
+
+
+class Stage:
+    __slots__ = ("name", "context", "hooks", "start")
+
+    def __init__(self, name, context, hooks):
+        self.name = name
+        self.context = context
+        self.hooks = hooks
+        self.start = 0.0
+
+    def __enter__(self):
+        for hook in self.hooks:
+            hook("start", self.name, None, self.context)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        timings = self.context.timings
+        if timings is not None:
+            timings[self.name] = timings.get(self.name, 0.0) + elapsed
+        for hook in self.hooks:
+            hook("stop", self.name, elapsed, self.context)
+        return False
+
+
+def stage(context, name):
+    """with stage(context, name): 统计其中代码的耗时"""
+    hooks = STAGE_HOOKS
+    if not hooks and context.timings is None:
+        return NULL_STAGE
+    return Stage(name, context, hooks)
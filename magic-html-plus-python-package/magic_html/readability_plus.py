@@ -1,9 +1,16 @@
 # -*- coding:utf-8 -*-
 
+import heapq
+from copy import deepcopy
+from functools import lru_cache
+
+from lxml import etree
 from lxml.etree import tounicode
 from lxml.html import document_fromstring, fragment_fromstring
 
+from magic_html.metrics import ReadabilityMetrics
 from magic_html.utils import *
+from magic_html.xpaths import run_xpath
 
 
 def to_int(x):
@@ -44,12 +51,113 @@ htmlstrip = re.compile(
 )
 
 
+# lxml.html.tostring 不输出子节点的空元素，以及文本不转义的元素
+VOID_TAGS = frozenset(
+    ["area", "base", "basefont", "br", "col", "frame", "hr", "img", "input", "isindex", "link", "meta", "param"]
+)
+RAW_TEXT_TAGS = frozenset(["script", "style"])
+
+
+# 与 htmlstrip 中的属性名相同，匹配整个属性名
+bad_attr_name = re.compile("(?:%s)\\Z" % "|".join(bad_attrs), re.I)
+
+
 def clean_attributes(html):
+    """在序列化后的 HTML 上删除 bad_attrs 中的属性，每次只能删除每个标签的一个属性；保留用于兼容"""
     while htmlstrip.search(html):
         html = htmlstrip.sub("<\\1\\2>", html)
     return html
 
 
+def strip_bad_attributes(tree):
+    """
+    在树上一次遍历删除 bad_attrs 中的属性，代替对序列化结果执行 clean_attributes。
+    htmlstrip 要求属性值非空，值为空的属性原先不会删除，这里同样保留
+    """
+    bad_names = {}
+    for elem in tree.iter(etree.Element):
+        for name, value in elem.items():
+            bad = bad_names.get(name)
+            if bad is None:
+                bad = bad_names[name] = bad_attr_name.match(name) is not None
+            if bad and value:
+                del elem.attrib[name]
+    return tree
+
+
+REGEXES = {
+    "unlikelyCandidatesRe": re.compile(
+        r"combx|comment|community|disqus|extra|foot|header|menu|remark|rss|shoutbox|sidebar|sponsor|ad-break|agegate|pagination|pager|popup|tweet|twitter",
+        re.I,
+    ),
+    "okMaybeItsACandidateRe": re.compile(
+        r"and|article|body|column|main|shadow", re.I
+    ),
+    "positiveRe": re.compile(
+        r"article|body|content|entry|hentry|main|page|pagination|post|text|blog|story",
+        re.I,
+    ),
+    "negativeRe": re.compile(
+        r"combx|comment|com-|contact|foot|footer|footnote|masthead|media|meta|outbrain|promo|related|scroll|shoutbox|sidebar|sponsor|shopping|tags|tool|widget",
+        re.I,
+    ),
+    "divToPElementsRe": re.compile(
+        r"<(a|blockquote|dl|div|img|ol|p|pre|table|ul)", re.I
+    ),
+    "videoRe": re.compile(r"https?:\/\/(www\.)?(youtube|vimeo)\.com", re.I),
+}
+
+# need_comment 时保留评论区：unlikelyCandidatesRe、negativeRe 中不含 comment
+COMMENT_REGEXES = {
+    "unlikelyCandidatesRe": re.compile(
+        r"combx|community|disqus|extra|foot|header|menu|remark|rss|shoutbox|sidebar|sponsor|ad-break|agegate|pagination|pager|popup|tweet|twitter",
+        re.I,
+    ),
+    "okMaybeItsACandidateRe": re.compile(
+        r"and|article|body|column|main|shadow", re.I
+    ),
+    "positiveRe": re.compile(
+        r"article|body|content|entry|hentry|main|page|pagination|post|text|blog|story",
+        re.I,
+    ),
+    "negativeRe": re.compile(
+        r"combx|com-|contact|foot|footer|footnote|masthead|media|meta|outbrain|promo|related|scroll|shoutbox|sidebar|sponsor|shopping|tags|tool|widget",
+        re.I,
+    ),
+    "divToPElementsRe": re.compile(
+        r"<(a|blockquote|dl|div|img|ol|p|pre|table|ul)", re.I
+    ),
+    "videoRe": re.compile(r"https?:\/\/(www\.)?(youtube|vimeo)\.com", re.I),
+}
+
+
+@lru_cache(maxsize=4096)
+def feature_weight(feature, need_comment, negative):
+    """
+    class 或 id 的属性值按 positiveRe 和 negativeRe（negative 为 False 时不使用）得到的权重，
+    同一属性值在页面内和页面之间大量重复
+    """
+    regexes = COMMENT_REGEXES if need_comment else REGEXES
+    weight = 0
+    if negative and regexes["negativeRe"].search(feature):
+        weight -= 25
+    if regexes["positiveRe"].search(feature):
+        weight += 25
+    return weight
+
+
+class Candidate:
+    __slots__ = ("content_score", "elem")
+
+    def __init__(self, content_score, elem):
+        self.content_score = content_score
+        self.elem = elem
+
+
+def candidate_score(candidate):
+    return candidate.content_score
+
+
 class Document:
     """Class to build a etree document out of html."""
 
@@ -76,50 +184,13 @@ class Document:
         self.handle_failures = handle_failures
         self.xp_num = xp_num
         self.need_comment = need_comment
-        if not need_comment:
-            self.REGEXES = {
-                "unlikelyCandidatesRe": re.compile(
-                    r"combx|comment|community|disqus|extra|foot|header|menu|remark|rss|shoutbox|sidebar|sponsor|ad-break|agegate|pagination|pager|popup|tweet|twitter",
-                    re.I,
-                ),
-                "okMaybeItsACandidateRe": re.compile(
-                    r"and|article|body|column|main|shadow", re.I
-                ),
-                "positiveRe": re.compile(
-                    r"article|body|content|entry|hentry|main|page|pagination|post|text|blog|story",
-                    re.I,
-                ),
-                "negativeRe": re.compile(
-                    r"combx|comment|com-|contact|foot|footer|footnote|masthead|media|meta|outbrain|promo|related|scroll|shoutbox|sidebar|sponsor|shopping|tags|tool|widget",
-                    re.I,
-                ),
-                "divToPElementsRe": re.compile(
-                    r"<(a|blockquote|dl|div|img|ol|p|pre|table|ul)", re.I
-                ),
-                "videoRe": re.compile(r"https?:\/\/(www\.)?(youtube|vimeo)\.com", re.I),
-            }
-        else:
-            self.REGEXES = {
-                "unlikelyCandidatesRe": re.compile(
-                    r"combx|community|disqus|extra|foot|header|menu|remark|rss|shoutbox|sidebar|sponsor|ad-break|agegate|pagination|pager|popup|tweet|twitter",
-                    re.I,
-                ),
-                "okMaybeItsACandidateRe": re.compile(
-                    r"and|article|body|column|main|shadow", re.I
-                ),
-                "positiveRe": re.compile(
-                    r"article|body|content|entry|hentry|main|page|pagination|post|text|blog|story",
-                    re.I,
-                ),
-                "negativeRe": re.compile(
-                    r"combx|com-|contact|foot|footer|footnote|masthead|media|meta|outbrain|promo|related|scroll|shoutbox|sidebar|sponsor|shopping|tags|tool|widget",
-                    re.I,
-                ),
-                "divToPElementsRe": re.compile(
-                    r"<(a|blockquote|dl|div|img|ol|p|pre|table|ul)", re.I
-                ),
-                "videoRe": re.compile(r"https?:\/\/(www\.)?(youtube|vimeo)\.com", re.I),
-            }
+        # 文本、逗号和后代标签统计缓存，在 transform_misused_divs_into_paragraphs 之后使用，删除节点时失效
+        self.metrics = ReadabilityMetrics()
+        # summary 中宽松模式重新整理和评分的次数
+        self.retries = 0
+        # summary 中严格模式没有候选节点、宽松模式直接沿用其结果的次数
+        self.reuses = 0
+        self.REGEXES = COMMENT_REGEXES if need_comment else REGEXES
 
     def _html(self, force=False):
         if force or self.html is None:
@@ -150,55 +221,63 @@ class Document:
             doc.resolve_base_href(handle_failures=self.handle_failures)
         return doc
 
+    def _prepare(self, ruthless):
+        """整理当前的树并为段落评分，返回 (candidates, best_candidate)"""
+        self._html(True)
+        for i in self.tags(self.html, "body"):
+            i.set("id", "readabilityplusBody")
+        if ruthless:
+            self.remove_unlikely_candidates()
+        self.transform_misused_divs_into_paragraphs()
+        self.metrics.clear()
+        if self.xp_num != "others":
+            return {}, None
+        candidates = self.score_paragraphs()
+        return candidates, self.select_best_candidate(candidates)
+
     def summary(self, html_partial=False):
         try:
-            ruthless = True
+            ruthless = self.xp_num == "others"
+            candidates, best_candidate = self._prepare(ruthless)
+            if ruthless and not best_candidate:
+                # 宽松模式原先在同一棵树上再执行一次 _prepare(False)，结果必然同样为空：
+                # remove_unlikely_candidates 不再执行；transform_misused_divs_into_paragraphs 执行过一次后，
+                # div 的 text 和子节点的 tail 都已移入新建的 p，br 已删除，剩下的 div 仍有块级后代，
+                # 再次执行不会改动树，score_paragraphs 在同一棵树上得到同样的空候选集。
+                # _html(True) 只会再次补全链接，xpath 为 True 时还会按当前的树重新写入 x 属性，需要执行
+                if self.xpath:
+                    self._html(True)
+                self.reuses += 1
+                ruthless = False
             while True:
-                self._html(True)
-                for i in self.tags(self.html, "body"):
-                    i.set("id", "readabilityplusBody")
-                if ruthless and self.xp_num == "others":
-                    self.remove_unlikely_candidates()
-                self.transform_misused_divs_into_paragraphs()
-                if self.xp_num == "others":
-                    candidates = self.score_paragraphs()
-                    best_candidate = self.select_best_candidate(candidates)
-                else:
-                    best_candidate = None
-                    ruthless = False
-                    candidates = {}
                 if best_candidate:
                     article = self.get_article(
                         candidates, best_candidate, html_partial=html_partial
                     )
                 else:
-                    if ruthless:
-                        ruthless = False
-                        continue
-                    else:
-                        article = self.html.find("body")
-                        if article is None:
-                            article = self.html
+                    article = self.html.find("body")
+                    if article is None:
+                        article = self.html
                 cleaned_article = self.sanitize(article, candidates)
 
                 article_length = len(cleaned_article or "")
-                retry_length = self.retry_length
-                of_acceptable_length = article_length >= retry_length
-                if ruthless and not of_acceptable_length:
+                if ruthless and article_length < self.retry_length:
+                    # get_article 已把选中的节点移出原树，需要在剩下的树上重新评分
+                    self.retries += 1
                     ruthless = False
+                    candidates, best_candidate = self._prepare(False)
                     continue
-                else:
-                    return cleaned_article
+                return cleaned_article
         except Exception as e:
             return None
 
     def get_article(self, candidates, best_candidate, html_partial=False):
-        sibling_score_threshold = max([10, best_candidate["content_score"] * 0.2])
+        sibling_score_threshold = max([10, best_candidate.content_score * 0.2])
         if html_partial:
             output = fragment_fromstring("<div/>")
         else:
             output = document_fromstring("<div/>")
-        best_elem = best_candidate["elem"]
+        best_elem = best_candidate.elem
         parent = best_elem.getparent()
         siblings = parent.getchildren() if parent is not None else [best_elem]
         for sibling in siblings:
@@ -208,7 +287,7 @@ class Document:
             sibling_key = sibling
             if (
                     sibling_key in candidates
-                    and candidates[sibling_key]["content_score"] >= sibling_score_threshold
+                    and candidates[sibling_key].content_score >= sibling_score_threshold
             ):
                 append = True
 
@@ -237,22 +316,18 @@ class Document:
         if not candidates:
             return None
 
-        sorted_candidates = sorted(
-            candidates.values(), key=lambda x: x["content_score"], reverse=True
-        )
-        for candidate in sorted_candidates[:5]:
-            elem = candidate["elem"]
-
-        best_candidate = sorted_candidates[0]
-        return best_candidate
+        # 与 sorted(..., reverse=True) 一样，分数相同时取先加入的候选节点
+        return heapq.nlargest(1, candidates.values(), key=candidate_score)[0]
 
     def get_link_density(self, elem):
-        link_length = 0
-        for i in elem.findall(".//a"):
-            link_length += text_length(i)
-        total_length = text_length(elem)
+        link_length = self.metrics.link_length(elem)
+        total_length = self.metrics.clean_length(elem)
         return float(link_length) / max(total_length, 1)
 
+    def drop_tree(self, elem):
+        self.metrics.invalidate(elem.getparent())
+        elem.drop_tree()
+
     def score_paragraphs(self):
         MIN_LEN = self.min_text_length
         candidates = {}
@@ -282,32 +357,23 @@ class Document:
             content_score += len(inner_text.split("，"))
             content_score += min((inner_text_len / 100), 3)
 
-            candidates[parent_node]["content_score"] += content_score
+            candidates[parent_node].content_score += content_score
             if grand_parent_node is not None:
-                candidates[grand_parent_node]["content_score"] += content_score / 2.0
+                candidates[grand_parent_node].content_score += content_score / 2.0
 
         for elem in ordered:
             candidate = candidates[elem]
             ld = self.get_link_density(elem)
-            score = candidate["content_score"]
-
-            candidate["content_score"] *= 1 - ld
+            candidate.content_score *= 1 - ld
 
         return candidates
 
     def class_weight(self, e):
         weight = 0
+        negative = self.xp_num == "others"
         for feature in [e.get("class", None), e.get("id", None)]:
             if feature:
-                if self.xp_num == "others":
-                    if self.REGEXES["negativeRe"].search(feature):
-                        weight -= 25
-
-                    if self.REGEXES["positiveRe"].search(feature):
-                        weight += 25
-                else:
-                    if self.REGEXES["positiveRe"].search(feature):
-                        weight += 25
+                weight += feature_weight(feature, self.need_comment, negative)
 
                 if self.positive_keywords and self.positive_keywords.search(feature):
                     weight += 25
@@ -345,7 +411,7 @@ class Document:
             "nav",
         ]:
             content_score -= 5
-        return {"content_score": content_score, "elem": elem}
+        return Candidate(content_score, elem)
 
     def remove_unlikely_candidates(self):
         for elem in self.html.findall(".//*"):
@@ -359,11 +425,50 @@ class Document:
             ):
                 elem.drop_tree()
 
+    def block_tag(self, tag):
+        """
+        标签名为 tag 的节点序列化后能否被 divToPElementsRe 匹配到。文本和属性值中的 < 序列化时会转义，
+        只需要看标签名；注释、处理指令、script/style 的文本不转义，返回 None，需要序列化后查找
+        """
+        if not isinstance(tag, str) or tag.startswith("{") or tag.lower() in RAW_TEXT_TAGS:
+            return None
+        # 正则是前缀匹配，例如 <p 也匹配 <pre、<param，<a 也匹配 <article
+        return self.REGEXES["divToPElementsRe"].match("<" + tag) is not None
+
+    def block_containers(self):
+        """
+        后代中有块级节点的元素集合，一次遍历自底向上求出，
+        等价于对每个元素序列化全部子节点后用 divToPElementsRe 查找
+        """
+        containers = set()
+        # 空元素（br 等）的子节点不会被序列化
+        hidden = set()
+        block_tags = {}
+        for node in self.html.iter():
+            if hidden and node in hidden:
+                continue
+            tag = node.tag
+            if tag not in block_tags:
+                block_tags[tag] = self.block_tag(tag)
+            matched = block_tags[tag]
+            if matched is None or "<" in "".join(node.values()):
+                # 序列化的内容包括后代节点，匹配到的即使在后代中，祖先节点序列化后也同样能匹配到
+                matched = self.REGEXES["divToPElementsRe"].search(str(tostring(node, with_tail=False))) is not None
+            if not matched:
+                if len(node) and isinstance(tag, str) and tag.lower() in VOID_TAGS:
+                    hidden.update(node.iterdescendants())
+                continue
+            parent = node.getparent()
+            while parent is not None and parent not in containers:
+                containers.add(parent)
+                parent = parent.getparent()
+        return containers
+
     def transform_misused_divs_into_paragraphs(self):
+        # div 改为 p 后仍能被匹配，逐个修改不影响其他 div 的判断，因此可以预先求出
+        containers = self.block_containers()
         for elem in self.tags(self.html, "div"):
-            if not self.REGEXES["divToPElementsRe"].search(
-                    str(b"".join(map(tostring, list(elem))))
-            ):
+            if elem not in containers:
                 elem.tag = "p"
 
         for elem in self.tags(self.html, "div"):
@@ -396,15 +501,16 @@ class Document:
         MIN_LEN = self.min_text_length
         for header in self.tags(node, "h1", "h2", "h3", "h4", "h5", "h6"):
             if self.class_weight(header) < 0 or self.get_link_density(header) > 0.33:
-                header.drop_tree()
+                self.drop_tree(header)
 
         for elem in self.tags(node, "iframe"):
             if "src" in elem.attrib and self.REGEXES["videoRe"].search(
                     elem.attrib["src"]
             ):
                 elem.text = "VIDEO"
+                self.metrics.invalidate(elem)
             else:
-                elem.drop_tree()
+                self.drop_tree(elem)
 
         allowed = {}
         # Conditionally clean <table>s, <ul>s, and <div>s
@@ -415,21 +521,19 @@ class Document:
                 continue
             weight = self.class_weight(el)
             if el in candidates:
-                content_score = candidates[el]["content_score"]
+                content_score = candidates[el].content_score
             else:
                 content_score = 0
             tag = el.tag
 
             if weight + content_score < 0:
-                el.drop_tree()
-            elif el.text_content().count(",") + el.text_content().count("，") < 10:
-                counts = {}
-                for kind in ["p", "img", "li", "a", "embed", "input"]:
-                    counts[kind] = len(el.findall(".//%s" % kind))
+                self.drop_tree(el)
+            elif self.metrics.commas(el) < 10:
+                counts = self.metrics.tag_counts(el)
                 counts["li"] -= 100
-                counts["input"] -= len(el.findall('.//input[@type="hidden"]'))
+                counts["input"] -= counts["hidden_input"]
 
-                content_length = text_length(el)
+                content_length = self.metrics.clean_length(el)
                 link_density = self.get_link_density(el)
 
                 to_remove = False
@@ -469,15 +573,14 @@ class Document:
                     to_remove = True
                 elif weight < 25 and link_density > 0.2:
                     if tag in ["div", "ul", "table"]:
-                        ptest = el.xpath(".//text()[not(ancestor::a)]")
-                        ptest_len = text_len("".join(ptest))
+                        ptest_len = self.metrics.nonlink_text_len(el)
                         if ptest_len >= MIN_LEN and link_density <= 0.3:
                             continue
                     if tag == "table":
-                        if len(el.xpath('.//tr[1]/td')) >=2:
+                        if len(run_xpath(el, './/tr[1]/td')) >=2:
                             continue
                     if tag == "div":
-                        if el.xpath('.//table'):
+                        if run_xpath(el, './/table'):
                             continue
                     reason = "too many links %.3f for its weight %s" % (
                         link_density,
@@ -486,10 +589,10 @@ class Document:
                     to_remove = True
                 elif weight >= 25 and link_density > 0.5:
                     if tag == "table":
-                        if len(el.xpath('.//tr[1]/td')) >= 2:
+                        if len(run_xpath(el, './/tr[1]/td')) >= 2:
                             continue
                     if tag == "div":
-                        if el.xpath('.//table'):
+                        if run_xpath(el, './/table'):
                             continue
                     reason = "too many links %.3f for its weight %s" % (
                         link_density,
@@ -511,14 +614,14 @@ class Document:
                     x = 1
                     siblings = []
                     for sib in el.itersiblings():
-                        sib_content_length = text_length(sib)
+                        sib_content_length = self.metrics.clean_length(sib)
                         if sib_content_length:
                             i = +1
                             siblings.append(sib_content_length)
                             if i == x:
                                 break
                     for sib in el.itersiblings(preceding=True):
-                        sib_content_length = text_length(sib)
+                        sib_content_length = self.metrics.clean_length(sib)
                         if sib_content_length:
                             j = +1
                             siblings.append(sib_content_length)
@@ -530,7 +633,7 @@ class Document:
                             allowed[desnode] = True
 
                 if to_remove:
-                    el.drop_tree()
+                    self.drop_tree(el)
                 else:
                     pass
 
@@ -538,4 +641,8 @@ class Document:
         return self.get_clean_html()
 
     def get_clean_html(self):
-        return clean_attributes(tounicode(self.html, method="html"))
+        html = self.html
+        if html.getroottree().getroot() is self.input.getroottree().getroot():
+            # 没有候选节点时 html 是调用方树中的 body，调用方之后还会按 style 等属性删除节点，只在副本上删除属性
+            html = deepcopy(html)
+        return tounicode(strip_bad_attributes(html), method="html")
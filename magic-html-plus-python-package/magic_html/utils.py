@@ -2,15 +2,23 @@
 
 import os
 import re
+import codecs
 import logging
+import mmap
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+from functools import lru_cache
 from gzip import decompress
+from itertools import chain
+from urllib.parse import urlparse
 
 import numpy as np
 from lxml import etree
 from lxml.html import Element, HtmlElement, HTMLParser, fromstring, tostring
-from lxml.html.clean import Cleaner
 from urllib3.response import HTTPResponse
 from magic_html.config import Unique_ID
+from magic_html.xpaths import run_xpath
 
 try:
     import brotli
@@ -26,35 +34,154 @@ from difflib import SequenceMatcher
 
 from charset_normalizer import from_bytes
 
-HTML_PARSER = HTMLParser(
-    collect_ids=False,
-    default_doctype=False,
-    encoding="utf-8",
-    remove_comments=True,
-    remove_pis=True,
-)
+
+
+def new_html_parser(encoding="utf-8"):
+    """按 encoding 解析字节的 HTMLParser，libxml2 不认识该编码时抛出 LookupError"""
+    return HTMLParser(
+        collect_ids=False,
+        default_doctype=False,
+        encoding=encoding,
+        remove_comments=True,
+        remove_pis=True,
+    )
+
+
+HTML_PARSER = new_html_parser()
 DOCTYPE_TAG = re.compile("^< ?! ?DOCTYPE.+?/ ?>", re.I)
+DOCTYPE_TAG_BYTES = re.compile(DOCTYPE_TAG.pattern.encode(), re.I)
 UNICODE_ALIASES = {"utf-8", "utf_8"}
-
-HTML_CLEANER = Cleaner(
-    annoying_tags=False,
-    comments=True,
-    embedded=False,
-    forms=False,
-    frames=False,
-    javascript=False,
-    links=False,
-    meta=False,
-    page_structure=False,
-    processing_instructions=True,
-    remove_unknown_tags=False,
-    safe_attrs_only=False,
-    scripts=False,
-    style=False,
+# load_html 可以直接解析的字节类型
+BYTES_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+# 每个线程各自的解析器和 XSLT：lxml 的解析器同一时间只能被一个线程使用，共享时其他线程在解析器的锁上等待；
+# XSLT 在创建它以外的线程中执行时每次都要复制样式表
+_THREAD_LOCAL = threading.local()
+# 字节顺序标记，UTF-32 LE 的 BOM 以 UTF-16 LE 的 BOM 开头，需先判断
+ENCODING_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
 )
+CHARSET_REGEX = re.compile(r"""charset\s*=\s*["']?\s*([\w.:-]+)""", re.I)
+META_CHARSET_REGEX = re.compile(
+    rb"""<meta[^>]+?charset\s*=\s*["']?\s*([\w.:-]+)""", re.I
+)
+# 只在开头这么多字节内查找 <meta charset>
+META_SNIFF_SIZE = 4096
+# 统计检测的采样字节数
+ENCODING_SAMPLE_SIZE = 15000
+NON_ASCII_BYTE_REGEX = re.compile(rb"[\x80-\xff]")
+# 声明的编码按浏览器的习惯换成兼容的超集
+ENCODING_SUPERSETS = {
+    "gb2312": "gb18030",
+    "gbk": "gb18030",
+    "shift_jis": "cp932",
+    "euc_kr": "cp949",
+    "ascii": "cp1252",
+    # codecs.lookup 返回的名称，latin-1、ISO-8859-1 等别名都规范化为 iso8859-1
+    "iso8859-1": "cp1252",
+}
+# netloc -> 该站点最近一次由 BOM 或声明确认的编码，最多保留 ENCODING_CACHE_SIZE 个站点，为 0 时不缓存
+ENCODING_CACHE = OrderedDict()
+ENCODING_CACHE_SIZE = 1024
+# 多个线程同时提取时，OrderedDict 的查找、移动和淘汰需要作为一个整体执行
+ENCODING_CACHE_LOCK = threading.Lock()
+
+
+
+@lru_cache(maxsize=None)
+def html_cleaner():
+    """
+    原先 clean_tags 使用的 lxml Cleaner，现在只作为 HTML_CLEANER 保留兼容，提取过程使用 clean_in_place
+    lxml 5.2 起 lxml.html.clean 拆分为单独的 lxml_html_clean 包，因此在用到时才导入
+    """
+    from lxml.html.clean import Cleaner
+
+    return Cleaner(
+        annoying_tags=False,
+        comments=True,
+        embedded=False,
+        forms=False,
+        frames=False,
+        javascript=False,
+        links=False,
+        meta=False,
+        page_structure=False,
+        processing_instructions=True,
+        remove_unknown_tags=False,
+        safe_attrs_only=False,
+        scripts=False,
+        style=False,
+    )
+
+
+XHTML_PREFIX = "{http://www.w3.org/1999/xhtml}"
+
+
+def clean_in_place(tree, kill_tags, remove_tags):
+    """
+    与 HTML_CLEANER 设置 kill_tags、remove_tags 后的 clean_html 结果相同，但直接修改 tree，
+    不做 deepcopy，也不修改共享的 HTML_CLEANER：
+    kill_tags 中的标签、注释和处理指令连同子树删除，remove_tags 中的标签去掉标签保留内容，
+    两者都有的标签按 kill_tags 处理；根节点无法删除，按 Cleaner 的方式改为 div
+    """
+    try:
+        tree = tree.getroot()
+    except AttributeError:
+        pass
+    kill = []
+    remove = []
+    # 已删除子树中的节点不再处理，与 Cleaner 处理后再随子树删除的结果相同
+    killed = set()
+    for node in tree.iter():
+        tag = node.tag
+        if isinstance(tag, str):
+            if tag.startswith(XHTML_PREFIX):
+                tag = node.tag = tag[len(XHTML_PREFIX):]
+            if tag == "image":
+                tag = node.tag = "img"
+        elif tag is etree.Comment or tag is etree.ProcessingInstruction:
+            tag = None
+        else:
+            continue
+        if node is not tree and node.getparent() in killed:
+            killed.add(node)
+            continue
+        if tag is None or tag in kill_tags:
+            killed.add(node)
+            kill.append(node)
+        elif tag in remove_tags:
+            remove.append(node)
+
+    if remove and remove[0] is tree:
+        remove.pop(0)
+        tree.tag = "div"
+        tree.attrib.clear()
+    elif kill and kill[0] is tree:
+        kill.pop(0)
+        if tree.tag != "html":
+            tree.tag = "div"
+        tree.clear()
+
+    # 从内层开始删除
+    for node in reversed(kill):
+        node.drop_tree()
+    for node in remove:
+        node.drop_tag()
+    return tree
+
 
 color_regex = re.compile(r"\\textcolor\[.*?\]\{.*?\}")
 
+# text_len 中按字符计数的中文、日文（平假名、片假名）、阿拉伯文
+TEXT_LEN_CHAR_REGEX = re.compile(r"[\u4e00-\u9fff\u3040-\u309F\u30A0-\u30FF\u0600-\u06FF]")
+# text_len_many 使用的查找表：str.isspace() 为真的码位都不超过 U+3000
+_WHITESPACE_TABLE = np.array([chr(i).isspace() for i in range(0x3002)], dtype=bool)
+_TEXT_LEN_CHAR_TABLE = np.zeros(0x10000, dtype=np.int8)
+for _start, _end in ((0x4E00, 0x9FFF), (0x3040, 0x30FF), (0x0600, 0x06FF)):
+    _TEXT_LEN_CHAR_TABLE[_start:_end + 1] = 1
+
 latex_image_class_names = [
     "latexcenter",
     "latex",
@@ -83,7 +210,56 @@ def MathML2Tex(*args, **kwargs):
     return _translator().MathML2Tex(*args, **kwargs)
 
 
-asciimath2tex = ASCIIMath2Tex(log=False)
+def ASCIIMath2MathML(*args, **kwargs):
+    return _translator().ASCIIMath2MathML(*args, **kwargs)
+
+
+def cache_dir():
+    """磁盘缓存目录，可通过环境变量 MAGIC_HTML_CACHE_DIR 指定"""
+    path = os.environ.get("MAGIC_HTML_CACHE_DIR")
+    if not path:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        path = os.path.join(base, "magic_html")
+    return path
+
+
+@lru_cache(maxsize=None)
+def asciimath_translator():
+    """
+    第一次用到时才构建 AsciiMath 解析器，构建 Lark 语法表约需 1 秒
+    语法表缓存在 cache_dir() 下，之后的进程直接加载；语法或 lark 版本变化时 lark 会自动重建
+    带 transformer 的解析器无法序列化，因此使用 inplace=False，解析后再转换，结果相同
+    """
+    try:
+        os.makedirs(cache_dir(), exist_ok=True)
+        return ASCIIMath2Tex(
+            log=False,
+            inplace=False,
+            cache=os.path.join(cache_dir(), "asciimath_grammar.lark"),
+        )
+    except OSError:
+        return ASCIIMath2Tex(log=False)
+
+
+def mml_transform():
+    """MathML 转 LaTeX 的 XSLT，每个线程第一次用到时才解析 mmltex.xsl"""
+    transform = getattr(_THREAD_LOCAL, "mml_transform", None)
+    if transform is None:
+        transform = _THREAD_LOCAL.mml_transform = etree.XSLT(etree.parse(xsl_path))
+    return transform
+
+
+def __getattr__(name):
+    # 兼容原先在导入时创建的模块级对象
+    if name == "asciimath2tex":
+        return asciimath_translator()
+    if name == "transform":
+        return mml_transform()
+    if name == "xslt":
+        return etree.parse(xsl_path)
+    if name == "HTML_CLEANER":
+        return html_cleaner()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def lcs_of_2(a, b):
@@ -100,6 +276,8 @@ def lcs_of_list(*args):
 
 
 def isutf8(data):
+    if data.isascii():
+        return True
     try:
         data.decode("UTF-8")
     except UnicodeDecodeError:
@@ -125,28 +303,130 @@ def handle_compressed_file(filecontent):
 def detect_encoding(bytesobject):
     if isutf8(bytesobject):
         return ["utf-8"]
+    return statistical_encodings(bytesobject)
+
+
+def statistical_encodings(bytesobject):
+    """
+    cchardet 和 charset_normalizer 在 ENCODING_SAMPLE_SIZE 字节的采样上的检测结果
+    采样从第一个非 ASCII 字节附近开始，避免开头很长的纯 ASCII 部分被判为 ascii
+    """
+    match = NON_ASCII_BYTE_REGEX.search(bytesobject)
+    start = max(0, match.start() - 64) if match else 0
+    sample = bytesobject[start:start + ENCODING_SAMPLE_SIZE]
     guesses = []
     if cchardet_detect is not None:
-        cchardet_guess = cchardet_detect(bytesobject)["encoding"]
+        cchardet_guess = cchardet_detect(sample)["encoding"]
         if cchardet_guess is not None:
             guesses.append(cchardet_guess.lower())
-    detection_results = from_bytes(bytesobject[:15000]) or from_bytes(bytesobject)
+    detection_results = from_bytes(sample)
     if len(detection_results) > 0:
         guesses.extend([r.encoding for r in detection_results])
     return [g for g in guesses if g not in UNICODE_ALIASES]
 
 
-def decode_file(filecontent):
+def normalize_charset(label):
+    """把声明的字符集名称转为 Python 的编码名，无法识别或不适用于 HTML 字节的返回 None"""
+    try:
+        name = codecs.lookup(label.decode("ascii") if isinstance(label, bytes) else label).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+    # <meta> 中声明的 UTF-16/32 不可能正确，有 BOM 时在前面已经处理
+    if name.startswith(("utf-16", "utf-32")):
+        return None
+    return ENCODING_SUPERSETS.get(name, name)
+
+
+def sniff_bom(bytesobject):
+    for bom, encoding in ENCODING_BOMS:
+        if bytesobject.startswith(bom):
+            return encoding
+    return None
+
+
+def sniff_meta_charset(bytesobject):
+    """在开头 META_SNIFF_SIZE 字节内查找 <meta charset> 或 http-equiv 声明的编码"""
+    match = META_CHARSET_REGEX.search(bytesobject[:META_SNIFF_SIZE])
+    return normalize_charset(match.group(1)) if match else None
+
+
+def charset_from_content_type(content_type):
+    """从 Content-Type 头中取出 charset"""
+    match = CHARSET_REGEX.search(content_type) if content_type else None
+    return normalize_charset(match.group(1)) if match else None
+
+
+def cached_encoding(netloc):
+    if not netloc:
+        return None
+    with ENCODING_CACHE_LOCK:
+        encoding = ENCODING_CACHE.get(netloc)
+        if encoding is not None:
+            ENCODING_CACHE.move_to_end(netloc)
+    return encoding
+
+
+def remember_encoding(netloc, encoding):
+    """记录 netloc 上由 BOM 或声明确认、且解码成功的编码"""
+    if not netloc or ENCODING_CACHE_SIZE <= 0:
+        return
+    with ENCODING_CACHE_LOCK:
+        ENCODING_CACHE[netloc] = encoding
+        ENCODING_CACHE.move_to_end(netloc)
+        while len(ENCODING_CACHE) > ENCODING_CACHE_SIZE:
+            ENCODING_CACHE.popitem(last=False)
+
+
+def guess_encodings(bytesobject, content_type=None, netloc=None):
+    """
+    按代价从低到高依次产出 (候选编码, 是否为声明的编码)，由调用方逐个尝试解码：
+    BOM、UTF-8 校验、Content-Type 中的 charset、<meta charset>、站点缓存，最后才是统计检测
+    合法的 UTF-8 优先于声明，避免服务器默认的 ISO-8859-1 等错误声明把 UTF-8 页面解成乱码
+    只有 BOM 和声明的编码解码成功后才记入站点缓存：单字节编码几乎总能解码成功，
+    统计检测的结果即使解码成功也可能是错的，记入缓存后会排在同一站点其他页面的统计检测之前
+    """
+    bom = sniff_bom(bytesobject)
+    if bom is not None:
+        yield bom, True
+    if isutf8(bytesobject):
+        yield "utf-8", False
+        return
+    # 已确认不是 UTF-8，声明为 UTF-8 的不再尝试
+    seen = {bom, "utf-8"}
+    for encoding, declared in (
+        (charset_from_content_type(content_type), True),
+        (sniff_meta_charset(bytesobject), True),
+        (cached_encoding(netloc), False),
+    ):
+        if encoding is not None and encoding not in seen:
+            seen.add(encoding)
+            yield encoding, declared
+    for encoding in statistical_encodings(bytesobject):
+        if encoding not in seen:
+            seen.add(encoding)
+            yield encoding, False
+
+
+def decode_file(filecontent, content_type=None, netloc=None):
     if isinstance(filecontent, str):
         return filecontent
+    filecontent = handle_compressed_file(buffer_to_bytes(filecontent))
+    return decode_with_guesses(
+        filecontent, guess_encodings(filecontent, content_type, netloc), netloc
+    )
+
+
+def decode_with_guesses(filecontent, guesses, netloc=None):
+    """依次尝试 guesses 中的 (编码, 是否为声明的编码)，声明的编码解码成功时记入 netloc 的缓存"""
     htmltext = None
-    filecontent = handle_compressed_file(filecontent)
-    for guessed_encoding in detect_encoding(filecontent):
+    for guessed_encoding, declared in guesses:
         try:
             htmltext = filecontent.decode(guessed_encoding)
         except (LookupError, UnicodeDecodeError):
             htmltext = None
         else:
+            if declared:
+                remember_encoding(netloc, guessed_encoding)
             break
     return htmltext or str(filecontent, encoding="utf-8", errors="replace")
 
@@ -158,6 +438,74 @@ def strip_faulty_doctypes(htmlstring: str, beginning: str) -> str:
     return htmlstring
 
 
+def strip_faulty_doctypes_bytes(htmlbytes: bytes, beginning: str) -> bytes:
+    if "doctype" in beginning:
+        firstline, _, rest = htmlbytes.partition(b"\n")
+        return DOCTYPE_TAG_BYTES.sub(b"", firstline, count=1) + b"\n" + rest
+    return htmlbytes
+
+
+def buffer_to_bytes(data):
+    """bytearray / memoryview / mmap 转为 bytes，bytes 原样返回"""
+    if isinstance(data, bytes):
+        return data
+    if isinstance(data, mmap.mmap):
+        return data[:]
+    return bytes(data)
+
+
+def thread_html_parsers():
+    """当前线程的 {规范化的编码名: HTMLParser}，libxml2 不支持的编码为 None"""
+    parsers = getattr(_THREAD_LOCAL, "html_parsers", None)
+    if parsers is None:
+        parsers = _THREAD_LOCAL.html_parsers = {}
+    return parsers
+
+
+def html_parser_for(encoding):
+    """按 encoding 解析字节的 HTMLParser，实例按线程和编码缓存；Python 或 libxml2 不认识该编码时返回 None"""
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        return None
+    parsers = thread_html_parsers()
+    if name not in parsers:
+        parser = None
+        # libxml2 不认识 euc_jp 这类带下划线的名称
+        for candidate in dict.fromkeys([name, name.replace("_", "-"), encoding]):
+            try:
+                parser = new_html_parser(candidate)
+            except LookupError:
+                continue
+            break
+        parsers[name] = parser
+    return parsers[name]
+
+
+def default_html_parser():
+    """当前线程按 UTF-8 解析的 HTMLParser，与 HTML_PARSER 的设置相同"""
+    parser = thread_html_parsers().get("utf-8")
+    if parser is None:
+        parser = html_parser_for("utf-8")
+    return parser
+
+
+def replace_nbsp(html, entities=("&nbsp;", "&#160;")):
+    """
+    将 &nbsp; 等实体替换为空格，html 为 str 或字节
+    字节按 ASCII 兼容编码直接替换，压缩的内容先解压
+    """
+    if isinstance(html, str):
+        for entity in entities:
+            html = html.replace(entity, " ")
+        return html
+    if isinstance(html, BYTES_TYPES):
+        html = handle_compressed_file(buffer_to_bytes(html))
+        for entity in entities:
+            html = html.replace(entity.encode(), b" ")
+    return html
+
+
 def is_dubious_html(beginning: str) -> bool:
     return "html" not in beginning
 
@@ -166,7 +514,7 @@ def fromstring_bytes(htmlobject):
     tree = None
     try:
         tree = fromstring(
-            htmlobject.encode("utf8", "surrogatepass"), parser=HTML_PARSER
+            htmlobject.encode("utf8", "surrogatepass"), parser=default_html_parser()
         )
     except Exception as err:
         pass
@@ -174,27 +522,70 @@ def fromstring_bytes(htmlobject):
 
 
 def ancestor_node_check(node: HtmlElement, tags: list):
-    for tag in tags:
-        if node.xpath(f'ancestor::{tag}[1]'):
-            return True
+    """node 是否有标签为 tags 之一的祖先"""
+    for _ in node.iterancestors(*tags):
+        return True
     return False
 
 
-def load_html(htmlobject):
+def load_html(htmlobject, encoding=None, content_type=None, base_url=""):
+    """
+    htmlobject 可以是 str、bytes、bytearray、memoryview、mmap 或 HTTPResponse
+    encoding 为调用方已知的字节编码，不传时自动检测
+    content_type 为 HTTP 响应的 Content-Type 头，检测编码时优先使用其中的 charset
+    base_url 用于按站点缓存检测到的编码
+    """
     if isinstance(htmlobject, HtmlElement):
         return htmlobject
     if isinstance(htmlobject, HTTPResponse) or hasattr(htmlobject, "data"):
+        if content_type is None and isinstance(htmlobject, HTTPResponse):
+            content_type = htmlobject.headers.get("Content-Type")
         htmlobject = htmlobject.data
-    if not isinstance(htmlobject, (bytes, str)):
+    if isinstance(htmlobject, BYTES_TYPES):
+        return load_html_bytes(htmlobject, encoding, content_type, base_url)
+    if not isinstance(htmlobject, str):
         raise TypeError("incompatible input type", type(htmlobject))
+    return load_html_text(htmlobject)
+
+
+def load_html_bytes(htmlbytes, encoding=None, content_type=None, base_url=""):
+    """
+    直接把字节交给按编码配置的 HTMLParser，不经过 str 的解码和重新编码
+    未指定编码时检测编码，只有 UTF-8 直接解析字节；其他编码仍解码为 str，
+    因为 libxml2 对 Shift_JIS 等编码的解码结果与 Python 不完全一致
+    """
+    htmlbytes = handle_compressed_file(buffer_to_bytes(htmlbytes))
+    parser = html_parser_for(encoding) if encoding else None
+    if parser is None:
+        netloc = urlparse(base_url).netloc if base_url else None
+        guesses = guess_encodings(htmlbytes, content_type, netloc)
+        first = next(guesses, None)
+        if first is None or first[0] != "utf-8":
+            guesses = chain([first], guesses) if first is not None else guesses
+            return load_html_text(decode_with_guesses(htmlbytes, guesses, netloc))
+        parser, encoding = default_html_parser(), "utf-8"
+    # 开头 200 字节至少包含 50 个字符
+    beginning = htmlbytes[:200].decode(encoding, "ignore")[:50].lower()
+    check_flag = is_dubious_html(beginning)
+    htmlbytes = strip_faulty_doctypes_bytes(htmlbytes, beginning)
+    tree = None
+    try:
+        tree = fromstring(htmlbytes, parser=parser)
+    except Exception as err:
+        pass
+    if tree is not None and check_flag is True and len(tree) < 2:
+        tree = None
+    return tree
+
+
+def load_html_text(htmlobject):
     tree = None
-    htmlobject = decode_file(htmlobject)
     beginning = htmlobject[:50].lower()
     check_flag = is_dubious_html(beginning)
     htmlobject = strip_faulty_doctypes(htmlobject, beginning)
     fallback_parse = False
     try:
-        tree = fromstring(htmlobject, parser=HTML_PARSER)
+        tree = fromstring(htmlobject, parser=default_html_parser())
     except ValueError:
         tree = fromstring_bytes(htmlobject)
         fallback_parse = True
@@ -211,36 +602,80 @@ def is_empty_element(node: HtmlElement):
     return not node.getchildren() and not node.text
 
 
+def iter_tree(element: HtmlElement):
+    """
+    深度优先遍历 element 及其子孙元素（不含注释），非递归，不受嵌套层数限制。
+    开始时用 iter() 取得节点快照，遍历过程中可以修改树：新插入的节点不会返回；
+    返回之前已经被移出树的节点及其子孙也不会返回，与逐层读取子节点的递归遍历一致
+    """
+    nodes = list(element.iter(etree.Element))
+    # 返回之前已被移出树的节点
+    skipped = set()
+    for node in nodes:
+        if node is not element:
+            parent = node.getparent()
+            if parent is None or parent in skipped:
+                skipped.add(node)
+                continue
+        yield node
+
+
 def iter_node(element: HtmlElement):
-    yield element
-    for sub_element in element:
-        if isinstance(sub_element, HtmlElement):
-            yield from iter_node(sub_element)
+    """兼容旧接口，见 iter_tree"""
+    return iter_tree(element)
 
 
 def img_div_check(tree):
     """
     如果一个div中只有一张图，且子节点数小于4则保留
     """
-    if len(tree.xpath(".//img")) == 1 and len(tree.xpath(".//*")) < 4:
+    if len(run_xpath(tree, ".//img")) == 1 and len(run_xpath(tree, ".//*")) < 4:
         return False
     else:
         return True
 
 
 def text_len(s):
-    s = re.sub(" +", " ", s)  # 将连续的多个空格替换为一个空格
-    s = re.sub("[\n\t\r]+", "\n", s)
-    english_words = s.split()
-    chinese_characters = re.findall(r"[\u4e00-\u9fff]", s)
-    japanese_characters = re.findall(r"[\u3040-\u309F\u30A0-\u30FF]", s)
-    arabic_characters = re.findall(r"[\u0600-\u06FF]", s)
-    return (
-            len(english_words)
-            + len(chinese_characters)
-            + len(japanese_characters)
-            + len(arabic_characters)
-    )
+    """单词数（按空白切分）+ 中文、日文、阿拉伯文字符数"""
+    if s.isascii():
+        return len(s.split())
+    return len(s.split()) + TEXT_LEN_CHAR_REGEX.subn("", s)[1]
+
+
+def text_len_many(strings):
+    """批量计算 text_len，结果与逐个调用相同，返回 list；strings 可以是任意可迭代对象"""
+    result = []
+    pending = []
+    pending_strings = []
+    for idx, s in enumerate(strings):
+        if s.isascii():
+            result.append(len(s.split()))
+        else:
+            result.append(0)
+            pending.append(idx)
+            pending_strings.append(s)
+    if pending:
+        counts = _count_text_len(pending_strings)
+        for idx, count in zip(pending, counts):
+            result[idx] = count
+    return result
+
+
+def _count_text_len(strings):
+    """用 numpy 一次统计一批字符串的 text_len"""
+    # 每个字符串后追加一个空格，保证词不会跨字符串合并
+    joined = " ".join(strings) + " "
+    # 单独的代理码位（如解码时 surrogateescape 留下的）也是合法的 str，按原码位编码
+    codepoints = np.frombuffer(joined.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    is_space = _WHITESPACE_TABLE[np.minimum(codepoints, 0x3001)]
+    # 词的起点：非空白且前一个字符为空白
+    counts = (~is_space).view(np.int8).copy()
+    counts[1:] &= is_space[:-1].view(np.int8)
+    counts += _TEXT_LEN_CHAR_TABLE[np.minimum(codepoints, 0xFFFF)]
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings)) + 1
+    offsets = np.zeros(len(strings), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    return np.add.reduceat(counts, offsets, dtype=np.int64).tolist()
 
 
 def alias(element):
@@ -311,19 +746,23 @@ def similarity_with_siblings(element, siblings):
     return np.mean(scores)
 
 
-def number_of_a_char(ele, xpath=".//a//text()"):
-    s = "".join(ele.xpath(xpath)).strip()
+def number_of_a_char(ele, xpath=".//a//text()", metrics=None):
+    if metrics is not None and xpath == ".//a//text()":
+        return metrics.link_text_len(ele)
+    s = "".join(run_xpath(ele, xpath)).strip()
     return text_len(s)
 
 
-def number_of_char(ele, xpath=".//text()"):
-    s = "".join(ele.xpath(xpath)).strip()
+def number_of_char(ele, xpath=".//text()", metrics=None):
+    if metrics is not None and xpath == ".//text()":
+        return metrics.text_len(ele) + 1
+    s = "".join(run_xpath(ele, xpath)).strip()
     return text_len(s) + 1
 
 
-def density_of_a_text(ele, pre=0.7):
-    a_char = number_of_a_char(ele)
-    t_char = number_of_char(ele)
+def density_of_a_text(ele, pre=0.7, metrics=None):
+    a_char = number_of_a_char(ele, metrics=metrics)
+    t_char = number_of_char(ele, metrics=metrics)
     if a_char / t_char >= pre:
         return True
     else:
@@ -355,7 +794,7 @@ def collect_link_info(links_xpath, favor_precision=False):
     return lengths, len(mylist), shortelems, mylist
 
 
-def link_density_test(element, text, favor_precision=False):
+def link_density_test(element, text, favor_precision=False, metrics=None):
     links_xpath, mylist = element.findall(".//a"), []
     if links_xpath:
         if element.tag == "p":
@@ -378,7 +817,7 @@ def link_density_test(element, text, favor_precision=False):
             )
             if elemnum == 0:
                 return True, mylist
-            if density_of_a_text(element, 0.5):
+            if density_of_a_text(element, 0.5, metrics=metrics):
                 if linklen > threshold * elemlen or (
                         elemnum > 1 and shortelems / elemnum > 0.8
                 ):
@@ -390,6 +829,15 @@ def text_strip(text):
     return text.strip() if text else text
 
 
+def is_attached(node, root):
+    """node 是否仍在 root 之下（未随祖先一起被删除）"""
+    while node is not None:
+        if node is root:
+            return True
+        node = node.getparent()
+    return False
+
+
 def wrap_math(s, display=False):
     s = re.sub(r"\s+", " ", s)
     s = color_regex.sub("", s)
@@ -407,7 +855,7 @@ def wrap_math(s, display=False):
 
 
 def extract_asciimath(s):
-    parsed = asciimath2tex.translate(s)
+    parsed = asciimath_translator().translate(s)
     return parsed
 
 
@@ -421,11 +869,95 @@ except ImportError:
     cur_file = os.path.abspath(__file__)
     xsl_path = os.path.join(os.path.dirname(cur_file), "mmltex/mmltex.xsl")
 
-xslt = etree.parse(xsl_path)
-transform = etree.XSLT(xslt)
+
+# mathml_source 得到的 MathML -> LaTeX，最多保留 MML_CACHE_SIZE 条，为 0 时不缓存
+MML_CACHE = OrderedDict()
+MML_CACHE_SIZE = 4096
+MML_CACHE_LOCK = threading.Lock()
+# 批量转换时各公式输出之间的分隔符，XSLT 以纯文本方式输出，原样保留
+MML_BATCH_SEPARATOR = "\n%%mml-batch%%\n"
+
+
+def mathml_source(node):
+    """<math> 节点序列化为 mml_to_latex 的输入，去掉 tail 和 mml: 前缀"""
+    tmp_node = deepcopy(node)
+    tmp_node.tail = None
+    mathml = tostring(tmp_node, encoding=str)
+    # If this includes xmlns:mml, then we need to replace all
+    # instances of mml: with nothing
+    if "xmlns:mml" in mathml:
+        mathml = mathml.replace("mml:", "")
+        # replace xmlns:mml="..." with nothing
+        mathml = re.sub(r'xmlns:mml=".*?"', "", mathml)
+    # if 'xmlns=' in mathml:
+    #     mathml = re.sub(r"xmlns='.*?'", '', mathml)
+    return mathml
+
+
+def cache_latex(mml_code, latex_code):
+    if MML_CACHE_SIZE <= 0:
+        return
+    with MML_CACHE_LOCK:
+        MML_CACHE[mml_code] = latex_code
+        MML_CACHE.move_to_end(mml_code)
+        while len(MML_CACHE) > MML_CACHE_SIZE:
+            MML_CACHE.popitem(last=False)
+
+
+def cached_latex(mml_code):
+    with MML_CACHE_LOCK:
+        latex_code = MML_CACHE.get(mml_code)
+        if latex_code is not None:
+            MML_CACHE.move_to_end(mml_code)
+    return latex_code
 
 
 def mml_to_latex(mml_code):
+    """MathML 转 LaTeX，同一段 MathML 的结果会被缓存，转换失败时抛出异常"""
+    latex_code = cached_latex(mml_code)
+    if latex_code is not None:
+        return latex_code
+    latex_code = str(mml_transform()(parse_mathml(mml_code)))
+    cache_latex(mml_code, latex_code)
+    return latex_code
+
+
+def mml_to_latex_many(mml_codes):
+    """
+    批量转换，所有未缓存的公式放进同一个文档，只调用一次 XSLT
+    返回与 mml_codes 一一对应的列表，无法转换的位置为 None
+    """
+    pending = {}
+    for mml_code in mml_codes:
+        if mml_code in pending or mml_code in MML_CACHE:
+            continue
+        try:
+            pending[mml_code] = parse_mathml(mml_code)
+        except Exception:
+            continue
+    if pending:
+        batch = etree.Element("batch")
+        for mml_dom in pending.values():
+            mml_dom.tail = MML_BATCH_SEPARATOR
+            batch.append(mml_dom)
+        try:
+            outputs = str(mml_transform()(batch)).split(MML_BATCH_SEPARATOR)
+        except Exception:
+            outputs = []
+        # 最后一个分隔符之后为空串
+        if len(outputs) == len(pending) + 1:
+            for mml_code, latex_code in zip(pending, outputs):
+                cache_latex(mml_code, latex_code)
+    results = []
+    for mml_code in mml_codes:
+        try:
+            results.append(mml_to_latex(mml_code))
+        except Exception:
+            results.append(None)
+    return results
+
+
+def parse_mathml(mml_code):
     # Remove any attibutes from the math tag
     mml_code = re.sub(r"(<math.*?>)", r"\1", mml_code)
     mml_ns = mml_code.replace(
@@ -441,7 +973,4 @@ def mml_to_latex(mml_code):
     pattern = r'"([^"]+?)\''
     mml_ns = re.sub(pattern, r'"\1"', mml_ns)
 
-    mml_dom = etree.fromstring(mml_ns)
-    mmldom = transform(mml_dom)
-    latex_code = str(mmldom)
-    return latex_code
+    return etree.fromstring(mml_ns)
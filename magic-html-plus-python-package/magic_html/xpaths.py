@@ -0,0 +1,109 @@
+# -*- coding:utf-8 -*-
+"""
+XPath 预编译注册表
+
+config.py 中的规则列表在第一次使用时统一编译为 etree.XPath 对象，之后同一线程中的所有提取器共享，
+避免每个页面、每次循环都重新解析同一条表达式。
+"""
+
+import threading
+import time
+
+from lxml import etree
+
+from magic_html.config import (
+    BODY_XPATH,
+    CONTENT_EXTRACTOR_NOISE_XPATHS,
+    DISCARD_IMAGE_ELEMENTS,
+    Forum_XPATH,
+    METAS,
+    OVERALL_DISCARD_XPATH,
+    PAYWALL_DISCARD_XPATH,
+    PRECISION_DISCARD_XPATH,
+    REMOVE_COMMENTS_XPATH,
+    TEASER_DISCARD_XPATH,
+)
+
+RULE_LISTS = (
+    OVERALL_DISCARD_XPATH,
+    PAYWALL_DISCARD_XPATH,
+    TEASER_DISCARD_XPATH,
+    PRECISION_DISCARD_XPATH,
+    DISCARD_IMAGE_ELEMENTS,
+    REMOVE_COMMENTS_XPATH,
+    CONTENT_EXTRACTOR_NOISE_XPATHS,
+    BODY_XPATH,
+    Forum_XPATH,
+    # 论坛评论判断时对当前节点本身的匹配
+    [c_xpath.replace(".//*", "self::*") for c_xpath in Forum_XPATH],
+    METAS,
+)
+
+
+class XPathRegistry:
+    """
+    编译好的 etree.XPath 执行时持有自身的锁，多个线程同时执行同一条表达式会互相等待，
+    因此每个线程各自编译一份；统计数字为所有线程的合计，多个线程同时查找时 lookups 为近似值
+    """
+
+    def __init__(self, rule_lists=RULE_LISTS):
+        self.rule_lists = rule_lists
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.compile_count = 0
+        self.compile_seconds = 0.0
+        self.lookups = 0
+
+    def _thread_compiled(self):
+        """当前线程的 {表达式: etree.XPath}，线程第一次使用时编译全部内置规则"""
+        compiled = getattr(self._local, "compiled", None)
+        if compiled is None:
+            compiled = self._local.compiled = {}
+            self._warm(compiled)
+        return compiled
+
+    def _compile(self, compiled, expr):
+        start = time.perf_counter()
+        xpath = etree.XPath(expr)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.compile_seconds += elapsed
+            self.compile_count += 1
+        compiled[expr] = xpath
+        return xpath
+
+    def _warm(self, compiled):
+        for rule_list in self.rule_lists:
+            for expr in rule_list:
+                if expr not in compiled:
+                    self._compile(compiled, expr)
+
+    def warm(self):
+        """在当前线程中编译全部内置规则"""
+        self._thread_compiled()
+
+    def get(self, expr):
+        compiled = self._thread_compiled()
+        self.lookups += 1
+        xpath = compiled.get(expr)
+        if xpath is None:
+            xpath = self._compile(compiled, expr)
+        return xpath
+
+    def __call__(self, node, expr, **variables):
+        return self.get(expr)(node, **variables)
+
+    def stats(self):
+        return {
+            "compiled": self.compile_count,
+            "compile_seconds": self.compile_seconds,
+            "lookups": self.lookups,
+        }
+
+
+XPATH_REGISTRY = XPathRegistry()
+
+
+def run_xpath(node, expr, **variables):
+    """使用共享注册表中的预编译表达式执行 XPath，variables 对应表达式中的 $变量"""
+    return XPATH_REGISTRY(node, expr, **variables)